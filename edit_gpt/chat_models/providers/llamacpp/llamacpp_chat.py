@@ -1,15 +1,21 @@
+import threading
 from typing import Any, Dict, Iterator, List, Optional
 
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
 from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
 
 
 class LlamaCppChat(BaseChatModel):
     model: Any
     temperature: float
     top_p: float
+    # a llama.cpp context is not thread-safe: completions (chat generation, the
+    # agent, the history summary thread) run one at a time, tokenizing only reads
+    # the vocabulary
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
 
     @staticmethod
     def format_messages_to_llava_cpp(
@@ -52,6 +58,9 @@ class LlamaCppChat(BaseChatModel):
     def _llm_type(self) -> str:
         return "llamacpp-chat"
 
+    def get_num_tokens(self, text: str) -> int:
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False))
+
     def _generate(
         self,
         messages: List[BaseMessage],
@@ -60,9 +69,13 @@ class LlamaCppChat(BaseChatModel):
         **kwargs: Any,
     ) -> ChatResult:
         messages = self.format_messages_to_llava_cpp(messages)
-        raw_output = self.model.create_chat_completion(
-            messages=messages, temperature=self.temperature, top_p=self.top_p, stop=stop
-        )
+        with self._lock:
+            raw_output = self.model.create_chat_completion(
+                messages=messages,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                stop=stop,
+            )
         output = raw_output["choices"][0]["message"]["content"]
         chat_generation = ChatGeneration(message=AIMessage(content=output))
         return ChatResult(generations=[chat_generation])
@@ -75,15 +88,19 @@ class LlamaCppChat(BaseChatModel):
         **kwargs: Any,
     ) -> Iterator[ChatGenerationChunk]:
         messages = self.format_messages_to_llava_cpp(messages)
-        output = self.model.create_chat_completion(
-            messages=messages,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            stream=True,
-            stop=stop,
-        )
+        # held until the stream is consumed or closed
+        with self._lock:
+            output = self.model.create_chat_completion(
+                messages=messages,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                stream=True,
+                stop=stop,
+            )
 
-        for new_text in output:
-            if "content" in new_text["choices"][0]["delta"]:
-                text_chunk = new_text["choices"][0]["delta"]["content"]
-                yield ChatGenerationChunk(message=AIMessageChunk(content=text_chunk))
+            for new_text in output:
+                if "content" in new_text["choices"][0]["delta"]:
+                    text_chunk = new_text["choices"][0]["delta"]["content"]
+                    yield ChatGenerationChunk(
+                        message=AIMessageChunk(content=text_chunk)
+                    )
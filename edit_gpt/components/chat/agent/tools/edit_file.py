@@ -57,13 +57,7 @@ class EditFileTool(BaseTool):
 
     def get_docs_from_filename(self, filename: str) -> List[Document]:
         normalized_filename = normalize_to_straight_slash(filename)
-        all_docs = self.rag_manager.get_all_docs()
-        result_docs = []
-        for doc in all_docs:
-            if doc.metadata["source"] == normalized_filename:
-                result_docs.append(doc)
-
-        return result_docs
+        return self.rag_manager.get_docs_by_source(normalized_filename)
 
     def change_file_content(
         self, file_name: str, user_request: str, chat_model: BaseChatModel
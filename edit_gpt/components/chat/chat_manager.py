@@ -1,12 +1,24 @@
-from typing import Any, Dict, Generator, List, Optional, Union
+import logging
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
 
 from langchain.agents import AgentExecutor
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_core.prompts import BaseChatPromptTemplate
 
-from edit_gpt.components.history.vector_based_history import VectorBasedChatHistory
+from edit_gpt.components.chat.context_packer import ContextPacker, PackingReport
+from edit_gpt.components.history.history_store import HistoryStore
+from edit_gpt.components.history.summary_history import SummaryChatHistory
+from edit_gpt.components.history.vector_based_history import (
+    VectorBasedChatHistory,
+    truncate_history,
+)
+from edit_gpt.components.rag.retrieval_context import RetrievalContext
+from edit_gpt.utils.utils import format_docs
+
+logger = logging.getLogger(__name__)
 
 
 class ChatManager:
@@ -16,11 +28,88 @@ class ChatManager:
         qa_prompt: BaseChatPromptTemplate,
         history: Optional[Union[BaseChatMessageHistory, VectorBasedChatHistory]] = None,
         agent: Optional[AgentExecutor] = None,
+        context_packer: Optional[ContextPacker] = None,
+        answer_tokens: int = 512,
+        history_store: Optional[HistoryStore] = None,
     ):
         self.chat_model = chat_model
+        # used when no session id is given or there is no history store
         self.history = history
+        # histories of the UI sessions
+        self.history_store = history_store
         self.qa_prompt = qa_prompt
         self.agent = agent
+        # fits history and retrieved context into the model's context window
+        self.context_packer = context_packer
+        # kept free for the answer when packing
+        self.answer_tokens = answer_tokens
+        self.last_packing_report: Optional[PackingReport] = None
+
+    def get_history(
+        self, session_id: Optional[str] = None
+    ) -> Optional[BaseChatMessageHistory]:
+        if session_id is not None and self.history_store is not None:
+            return self.history_store.get(session_id)
+        return self.history
+
+    @staticmethod
+    def _get_history(
+        history: Optional[BaseChatMessageHistory],
+        text: str,
+        retrieval_context: Optional[RetrievalContext] = None,
+    ) -> List[BaseMessage]:
+        if history:
+            if isinstance(history, VectorBasedChatHistory):
+                return history.retrieve(text, retrieval_context)
+            elif isinstance(history, SummaryChatHistory):
+                return history.context_messages()
+            elif isinstance(history, BaseChatMessageHistory):
+                return history.messages
+        return []
+
+    def _prepare_context(
+        self,
+        text: str,
+        history: Optional[BaseChatMessageHistory],
+        rag_docs: Optional[List[Document]] = None,
+        web_results: Optional[List[str]] = None,
+        prompt_tokens: int = 0,
+        retrieval_context: Optional[RetrievalContext] = None,
+    ) -> Tuple[List[BaseMessage], Dict[str, str]]:
+        """
+        Returns the history messages and the rag_context and web_context prompt
+        variables, packed into the token budget if there is a context packer.
+        """
+        history = self._get_history(history, text, retrieval_context)
+        rag_docs = rag_docs or []
+        web_results = web_results or []
+        if self.context_packer is not None:
+            packed = self.context_packer.pack(
+                rag_docs,
+                history,
+                web_results,
+                reserved_tokens=prompt_tokens + self.answer_tokens,
+            )
+            history, rag_docs, web_results = (
+                packed.history,
+                packed.rag_docs,
+                packed.web_results,
+            )
+            self.last_packing_report = packed.report
+        return history, {
+            "rag_context": format_docs(rag_docs),
+            "web_context": "\n\n".join(web_results),
+        }
+
+    def _count_prompt_tokens(self, text: str) -> int:
+        if self.context_packer is None:
+            return 0
+        messages = self.qa_prompt.format_messages(
+            question=text, history=[], rag_context="", web_context=""
+        )
+        return sum(
+            self.context_packer.count_tokens(message.content) for message in messages
+        )
 
     def get_answer(
         self, question: str, history: Optional[List[BaseMessage]] = None, **kwargs
@@ -35,51 +124,94 @@ class ChatManager:
             }
         )
 
-    def chat_gen(self, text: str, **kwargs) -> Generator[str, None, None]:
+    def chat_gen(
+        self,
+        text: str,
+        rag_docs: Optional[List[Document]] = None,
+        web_results: Optional[List[str]] = None,
+        session_id: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> Generator[str, None, None]:
         accumulated_text = ""
 
-        history = []
-        if self.history:
-            if isinstance(self.history, VectorBasedChatHistory):
-                history = self.history.retrieve(text)
-            elif isinstance(self.history, BaseChatMessageHistory):
-                history = self.history.messages
+        chat_history = self.get_history(session_id)
+        history, context = self._prepare_context(
+            text,
+            chat_history,
+            rag_docs,
+            web_results,
+            self._count_prompt_tokens(text),
+            retrieval_context,
+        )
 
-        for chunk in self.get_answer(text, history=history, **kwargs):
+        for chunk in self.get_answer(text, history=history, **context, **kwargs):
             chunk_content = chunk.content
             accumulated_text += chunk_content
 
             yield accumulated_text
 
-        if self.history:
-            self.history.add_message(HumanMessage(content=text))
-            self.history.add_message(AIMessage(content=accumulated_text))
-
-    def update_history(self, messages):
-        if self.history:
-            self.history.clear()
-            for message in messages:
-                self.history.add_message(message)
-
-    def agent_gen(self, text: str, **kwargs) -> Dict[str, Any]:
-        history_messages = []
-        if self.history:
-            if isinstance(self.history, VectorBasedChatHistory):
-                history_messages = self.history.retrieve(text)
-            elif isinstance(self.history, BaseChatMessageHistory):
-                history_messages = self.history.messages
+        if chat_history:
+            # one batch for vector history
+            chat_history.add_messages(
+                [HumanMessage(content=text), AIMessage(content=accumulated_text)]
+            )
+
+    def update_history(
+        self, messages: List[BaseMessage], session_id: Optional[str] = None
+    ) -> None:
+        """
+        Makes the history hold messages. Only what follows the common prefix of the
+        stored and the given messages is removed and added, so when the conversation
+        just grew a turn is not re-embedded (with vector history) from the start.
+        """
+        history = self.get_history(session_id)
+        if not history:
+            return
+        stored_messages = history.messages
+        common = 0
+        for stored, message in zip(stored_messages, messages):
+            if stored.type != message.type or stored.content != message.content:
+                break
+            common += 1
+        if common < len(stored_messages):
+            truncate_history(history, common)
+        if common < len(messages):
+            history.add_messages(messages[common:])
+
+    def agent_gen(
+        self,
+        text: str,
+        rag_docs: Optional[List[Document]] = None,
+        web_results: Optional[List[str]] = None,
+        session_id: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        chat_history = self.get_history(session_id)
+        # the agent prompt and scratchpad are not counted, only the question
+        history_messages, context = self._prepare_context(
+            text,
+            chat_history,
+            rag_docs,
+            web_results,
+            self.context_packer.count_tokens(text) if self.context_packer else 0,
+            retrieval_context,
+        )
 
         result = self.agent.invoke(
             {
                 "input": text,
                 "history": history_messages,
                 "get_final_answer_message": "",
+                **context,
                 **kwargs,
             }
         )
 
-        if self.history:
-            self.history.add_message(HumanMessage(content=text))
-            self.history.add_message(AIMessage(content=result["output"]))
+        if chat_history:
+            chat_history.add_messages(
+                [HumanMessage(content=text), AIMessage(content=result["output"])]
+            )
 
         return result
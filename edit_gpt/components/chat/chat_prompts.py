@@ -20,3 +20,15 @@ qa_prompt = ChatPromptTemplate.from_messages(
         ("human", WEB_SEARCH_SYSTEM_PROMPT),
     ]
 )
+
+SUMMARY_PROMPT = (
+    "Progressively summarize the lines of conversation provided, adding onto the "
+    "previous summary and returning a new summary of at most {max_words} words. "
+    "Keep the facts, names, file paths and decisions needed to continue the "
+    "conversation.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New lines of conversation:\n{new_lines}\n\n"
+    "New summary:"
+)
+
+summary_prompt = ChatPromptTemplate.from_messages([("human", SUMMARY_PROMPT)])
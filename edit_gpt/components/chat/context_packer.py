@@ -0,0 +1,176 @@
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+from edit_gpt.components.rag.splitters import count_tokens
+from edit_gpt.utils.utils import format_doc_path
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ("rag", "history", "web")
+# DuckDuckGoSearchResults returns "[snippet: ..., title: ..., link: ...], [snippet: ..."
+WEB_RESULTS_SEPARATOR = re.compile(r"(?<=\]),\s*(?=\[)")
+# BPE tokenizers split identifiers, numbers and rare words into several tokens, so
+# counting words and symbols undercounts, most of all on code
+TOKEN_SAFETY_FACTOR = 1.5
+# providers whose chat models count tokens locally with the model's own tokenizer.
+# Others count with a remote API call (google) or with GPT-2's tokenizer, which is
+# langchain's default and may have to be downloaded
+LOCAL_TOKENIZER_PROVIDERS = ("openai", "llamacpp")
+
+
+def estimate_tokens(text: str) -> int:
+    """count_tokens scaled up to stay above the count of a BPE tokenizer."""
+    return math.ceil(count_tokens(text) * TOKEN_SAFETY_FACTOR)
+
+
+def get_token_counter(
+    chat_model: BaseLanguageModel, provider: str
+) -> Callable[[str], int]:
+    """
+    The chat model's own token counter if the provider has a local tokenizer (see
+    LOCAL_TOKENIZER_PROVIDERS) that can be loaded, estimate_tokens otherwise.
+    """
+    if provider not in LOCAL_TOKENIZER_PROVIDERS:
+        return estimate_tokens
+    try:
+        chat_model.get_num_tokens("token")
+    except Exception as e:
+        logger.warning(
+            "Can't count tokens with the tokenizer of the chat model (%s), "
+            "estimating with a %sx safety factor",
+            e,
+            TOKEN_SAFETY_FACTOR,
+        )
+        return estimate_tokens
+    return chat_model.get_num_tokens
+
+
+def split_web_results(output: Union[str, list, None]) -> List[str]:
+    """Splits the output of a web search tool into one string per result."""
+    if not output:
+        return []
+    if isinstance(output, list):
+        return [str(result) for result in output]
+    return [result for result in WEB_RESULTS_SEPARATOR.split(output) if result]
+
+
+class PackingReport(BaseModel):
+    budget: int = 0
+    used: int = 0
+    kept: Dict[str, int] = {}
+    dropped: Dict[str, int] = {}
+    dropped_tokens: Dict[str, int] = {}
+
+    def __str__(self) -> str:
+        sections = " ".join(
+            f"{section}={self.kept.get(section, 0)}"
+            f"(-{self.dropped.get(section, 0)})"
+            for section in SECTIONS
+        )
+        return f"used {self.used}/{self.budget} tokens, kept(-dropped) {sections}"
+
+
+@dataclass
+class PackedContext:
+    rag_docs: List[Document]
+    history: List[BaseMessage]
+    web_results: List[str]
+    report: PackingReport
+
+
+class ContextPacker:
+    """
+    Fits RAG chunks, history messages and web search results into a token budget.
+
+    Every item gets a value of its section weight divided by its rank (retrieval
+    order for RAG and web results, recency for history), and items are added from
+    the most valuable one while they fit. Items keep their original order in the
+    output, items that don't fit are dropped and counted in the report.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        rag_weight: float = 1.0,
+        history_weight: float = 0.8,
+        web_weight: float = 0.6,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.budget = budget
+        self.weights = {"rag": rag_weight, "history": history_weight, "web": web_weight}
+        self.count_tokens = count_tokens
+
+    def _doc_tokens(self, doc: Document) -> int:
+        # as formatted by format_docs
+        return self.count_tokens(
+            f"Doc path: {format_doc_path(doc)} \n{doc.page_content}"
+        )
+
+    def pack(
+        self,
+        rag_docs: List[Document],
+        history: List[BaseMessage],
+        web_results: List[str],
+        reserved_tokens: int = 0,
+    ) -> PackedContext:
+        """
+        reserved_tokens are taken by what is always sent (the prompt template and the
+        question) and the answer, the rest of the budget is shared by the sections.
+        """
+        items: Dict[str, list] = {
+            "rag": rag_docs,
+            "history": history,
+            "web": web_results,
+        }
+        tokens = {
+            "rag": [self._doc_tokens(doc) for doc in rag_docs],
+            "history": [self.count_tokens(message.content) for message in history],
+            "web": [self.count_tokens(result) for result in web_results],
+        }
+        # (value, section, index), the most recent message ranks first
+        candidates: List[Tuple[float, str, int]] = []
+        for section, section_items in items.items():
+            for index in range(len(section_items)):
+                rank = len(section_items) - index if section == "history" else index + 1
+                candidates.append((self.weights[section] / rank, section, index))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        available = max(self.budget - reserved_tokens, 0)
+        used = 0
+        selected = {section: set() for section in SECTIONS}
+        report = PackingReport(budget=self.budget)
+        for _, section, index in candidates:
+            item_tokens = tokens[section][index]
+            if used + item_tokens <= available:
+                used += item_tokens
+                selected[section].add(index)
+            else:
+                report.dropped[section] = report.dropped.get(section, 0) + 1
+                report.dropped_tokens[section] = (
+                    report.dropped_tokens.get(section, 0) + item_tokens
+                )
+        report.used = used + reserved_tokens
+        report.kept = {section: len(selected[section]) for section in SECTIONS}
+        if report.dropped:
+            logger.info("Packed context into the token budget: %s", report)
+
+        packed = {
+            section: [
+                item for i, item in enumerate(items[section]) if i in selected[section]
+            ]
+            for section in SECTIONS
+        }
+        return PackedContext(
+            rag_docs=packed["rag"],
+            history=packed["history"],
+            web_results=packed["web"],
+            report=report,
+        )
@@ -1,24 +1,101 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Optional
 
 from langchain_core.tools import BaseTool
 
+from edit_gpt.components.chat.context_packer import split_web_results
 from edit_gpt.components.rag.local.rag_local import LocalRAGManager
-from edit_gpt.utils.utils import format_docs
+from edit_gpt.components.rag.retrieval_context import RetrievalContext
+
+logger = logging.getLogger(__name__)
 
 
 class AdditionalDataPreprocessor:
     def __init__(
-        self, rag_manager: LocalRAGManager, web_search_tool: Optional[BaseTool] = None
+        self,
+        rag_manager: LocalRAGManager,
+        web_search_tool: Optional[BaseTool] = None,
+        rag_timeout: Optional[float] = None,
+        web_search_timeout: Optional[float] = None,
     ):
         self.rag_manager = rag_manager
         self.web_search_tool = web_search_tool
+        self.rag_timeout = rag_timeout
+        self.web_search_timeout = web_search_timeout
+
+    def _get_rag_docs(
+        self,
+        message: str,
+        scope: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+    ) -> list:
+        return self.rag_manager.get_filtered_docs(
+            question=message, scope=scope, retrieval_context=retrieval_context
+        )
+
+    def _get_web_results(self, message: str) -> list[str]:
+        return split_web_results(self.web_search_tool.invoke(message))
+
+    def prepare_data(
+        self, message: str, options: list[str], scope: Optional[str] = None
+    ) -> dict:
+        """
+        Collects the RAG documents and web search results for the message
+        concurrently, to be passed to ChatManager.chat_gen or agent_gen.
+        If scope (a file or directory path) is given, RAG only searches files under it.
 
-    def prepare_data(self, message: str, options: list[str]) -> dict:
-        data = {"rag_context": "", "web_context": ""}
+        A source that fails or does not answer within its timeout contributes an
+        empty context, so generation can start with what the other source returned.
+        Every request has its own threads: a late call keeps running in the
+        background, its result is dropped, and it doesn't hold up later requests.
+
+        The returned retrieval_context holds the query embeddings computed for RAG,
+        so that the history search of the request reuses them.
+        """
+        start = time.monotonic()
+        retrieval_context = RetrievalContext(self.rag_manager.embeddings)
+        calls = {}
         if "RAG" in options:
-            data["rag_context"] = format_docs(
-                self.rag_manager.get_filtered_docs(question=message)
+            calls["rag_docs"] = (
+                lambda: self._get_rag_docs(message, scope, retrieval_context),
+                self.rag_timeout,
             )
         if self.web_search_tool and "Web Search" in options:
-            data["web_context"] = self.web_search_tool.invoke(message)
+            calls["web_results"] = (
+                lambda: self._get_web_results(message),
+                self.web_search_timeout,
+            )
+
+        data = {
+            "rag_docs": [],
+            "web_results": [],
+            "retrieval_context": retrieval_context,
+        }
+        if not calls:
+            return data
+        executor = ThreadPoolExecutor(
+            max_workers=len(calls), thread_name_prefix="prepare_data"
+        )
+        futures = {
+            name: (executor.submit(call), timeout)
+            for name, (call, timeout) in calls.items()
+        }
+        # don't wait for the calls that time out
+        executor.shutdown(wait=False)
+        for name, (future, timeout) in futures.items():
+            # timeouts count from submission, not from when the previous source finished
+            remaining = (
+                None
+                if timeout is None
+                else max(0.0, start + timeout - time.monotonic())
+            )
+            try:
+                data[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                logger.warning("%s timed out after %ss, skipping it", name, timeout)
+            except Exception:
+                logger.exception("%s failed, skipping it", name)
         return data
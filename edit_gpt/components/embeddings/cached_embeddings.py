@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of another Embeddings object.
+
+    Vectors are keyed by model name, kind (document or query) and a hash of the text.
+    They are kept in an in-memory LRU bounded by max_bytes and, if cache_directory
+    is set, also written to disk so that they survive restarts.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        cache_directory: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.cache_directory = Path(cache_directory) if cache_directory else None
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.model_name}\0{kind}\0{text}".encode("utf-8")
+        ).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_directory / key[:2] / f"{key}.npy"
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = vector
+            self._memory_bytes += vector.nbytes
+            while self._memory_bytes > self.max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def _lookup(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+        if self.cache_directory is None:
+            return None
+        try:
+            vector = np.load(self._disk_path(key))
+        except (OSError, ValueError):
+            return None
+        self._remember(key, vector)
+        return vector
+
+    def _store(self, key: str, vector: np.ndarray) -> None:
+        self._remember(key, vector)
+        if self.cache_directory is None:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp_path.open("wb") as f:
+            np.save(f, vector)
+        os.replace(tmp_path, path)
+
+    def _embed(self, kind: str, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self._lookup(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            if kind == "query":
+                embedded = [
+                    self.embeddings.embed_query(text) for text in missing.values()
+                ]
+            else:
+                embedded = self.embeddings.embed_documents(list(missing.values()))
+            for key, embedding in zip(missing, embedded):
+                vector = np.asarray(embedding, dtype=np.float32)
+                self._store(key, vector)
+                vectors[key] = vector
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text])[0]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
@@ -0,0 +1,55 @@
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+from edit_gpt.components.embeddings.cached_embeddings import CachedEmbeddings
+from edit_gpt.components.embeddings.parallel_embeddings import ParallelEmbeddings
+
+FAKE_EMBEDDING_SIZE = 384
+
+
+def create_base_embeddings(model: str) -> Embeddings:
+    if model == "fake":
+        from langchain_core.embeddings.fake import DeterministicFakeEmbedding
+
+        # the same vectors in every worker process
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+
+    from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=model)
+
+
+def initialize_embeddings(
+    model: str,
+    cache_max_bytes: int = 64 * 1024 * 1024,
+    cache_directory: Optional[str] = None,
+    processes: int = 1,
+    batch_size: int = 64,
+) -> Embeddings:
+    embeddings = create_base_embeddings(model)
+    if processes > 1:
+        embeddings = ParallelEmbeddings(
+            embeddings,
+            create_embeddings=create_base_embeddings,
+            model=model,
+            processes=processes,
+            batch_size=batch_size,
+        )
+
+    if cache_max_bytes <= 0 and cache_directory is None:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model_name=model,
+        max_bytes=cache_max_bytes,
+        cache_directory=cache_directory,
+    )
+
+
+def close_embeddings(embeddings: Embeddings) -> None:
+    """Shuts down the worker processes of embeddings made by initialize_embeddings."""
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    if isinstance(embeddings, ParallelEmbeddings):
+        embeddings.close()
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+_worker_embeddings: Optional[Embeddings] = None
+
+
+def _init_worker(create_embeddings: Callable[[str], Embeddings], model: str, threads):
+    global _worker_embeddings
+    try:
+        import torch
+
+        # workers split the cores instead of each spawning a thread per core
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_embeddings = create_embeddings(model)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+class ParallelEmbeddings(Embeddings):
+    """
+    Embeds large lists of documents in batches on a pool of worker processes,
+    each holding its own copy of the model. Lists are split into at least one
+    batch per worker, so all of them are busy whatever the size of the list.
+    Queries and small lists are embedded in-process by the wrapped embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        create_embeddings: Callable[[str], Embeddings],
+        model: str,
+        processes: int = 2,
+        batch_size: int = 64,
+    ):
+        self.embeddings = embeddings
+        self.create_embeddings = create_embeddings
+        self.model = model
+        self.processes = processes
+        self.batch_size = batch_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                # fork is unsafe once torch has started its thread pools
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    self.create_embeddings,
+                    self.model,
+                    max(1, (os.cpu_count() or 1) // self.processes),
+                ),
+            )
+        return self._pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.processes <= 1 or len(texts) <= self.batch_size:
+            return self.embeddings.embed_documents(texts)
+        n_batches = max(-(-len(texts) // self.batch_size), self.processes)
+        size = -(-len(texts) // n_batches)
+        batches = [texts[i : i + size] for i in range(0, len(texts), size)]
+        result = []
+        for embedded_batch in self._get_pool().map(_embed_batch, batches):
+            result.extend(embedded_batch)
+        return result
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from edit_gpt.components.ingest_service import IngestService
+from edit_gpt.utils.file_filter import FileFilter
+from edit_gpt.utils.loaders import iter_filenames_from_paths
+
+logger = logging.getLogger(__name__)
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+class FileWatcher:
+    """
+    Keeps the index in sync with the files under paths from a background thread.
+
+    Changes are picked up from filesystem events when the optional watchdog package
+    is installed (inotify on Linux) and by polling file stats otherwise. Once the
+    files have stopped changing for `debounce` seconds, only the changed, added and
+    removed files are passed to IngestService.bulk_ingest.
+
+    A scan only stats the files. The size and binary checks of file_filter, which
+    read the file, are repeated only for files whose size or mtime changed.
+    """
+
+    def __init__(
+        self,
+        ingest_service: IngestService,
+        paths: List[str],
+        file_filter: Optional[FileFilter] = None,
+        poll_interval: float = 2.0,
+        debounce: float = 1.0,
+        use_events: bool = True,
+    ):
+        self._ingest_service = ingest_service
+        self.paths = paths
+        self.file_filter = file_filter
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_events = use_events
+        self._stopped = threading.Event()
+        # set by filesystem events (or stop), unused when polling
+        self._changed = threading.Event()
+        self._observer = None
+        self._thread: Optional[threading.Thread] = None
+        # filename -> its stat when last checked and whether its content was accepted
+        self._content_checks: Dict[str, Tuple[Tuple[int, int], bool]] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self._stopped.clear()
+        if self.use_events:
+            self._observer = self._start_observer()
+        logger.info(
+            "Watching %s for changes (%s)",
+            self.paths,
+            "filesystem events" if self._observer is not None else "polling",
+        )
+        # taken before returning so that changes made right after start are seen
+        snapshot = self._scan()
+        self._thread = threading.Thread(
+            target=self._run, args=(snapshot,), name="file-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._changed.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("watchdog is not installed, falling back to polling")
+            return None
+
+        changed = self._changed
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # the event only triggers a rescan, which applies the ignore rules
+                changed.set()
+
+        observer = Observer()
+        handler = _Handler()
+        for path in self.paths:
+            if not os.path.exists(path):
+                continue
+            directory = path if os.path.isdir(path) else os.path.dirname(path) or "."
+            observer.schedule(handler, directory, recursive=os.path.isdir(path))
+        observer.start()
+        return observer
+
+    def _scan(self) -> Snapshot:
+        snapshot = {}
+        content_checks = {}
+        for filename in iter_filenames_from_paths(
+            self.paths, self.file_filter, check_content=False
+        ):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                # removed while walking
+                continue
+            key = (stat.st_size, stat.st_mtime_ns)
+            check = self._content_checks.get(filename)
+            if check is None or check[0] != key:
+                check = (
+                    key,
+                    self.file_filter is None
+                    or self.file_filter.accepts_content(filename),
+                )
+            content_checks[filename] = check
+            if check[1]:
+                snapshot[filename] = key
+        self._content_checks = content_checks
+        return snapshot
+
+    def _wait_for_change(self) -> bool:
+        if self._observer is not None:
+            self._changed.wait()
+            self._changed.clear()
+        else:
+            self._stopped.wait(self.poll_interval)
+        return not self._stopped.is_set()
+
+    def _wait_until_settled(self, snapshot: Snapshot) -> Optional[Snapshot]:
+        # files that are still being written are picked up once they stop changing
+        while not self._stopped.wait(self.debounce):
+            settled = self._scan()
+            if settled == snapshot:
+                return settled
+            snapshot = settled
+        return None
+
+    def _run(self, snapshot: Snapshot) -> None:
+        while self._wait_for_change():
+            current = self._scan()
+            if current == snapshot:
+                continue
+            current = self._wait_until_settled(current)
+            if current is None:
+                break
+            changed = sorted(
+                filename
+                for filename in snapshot.keys() | current.keys()
+                if snapshot.get(filename) != current.get(filename)
+            )
+            try:
+                self._ingest_service.bulk_ingest(changed)
+            except Exception:
+                logger.exception("Failed to re-ingest %s", changed)
+            snapshot = current
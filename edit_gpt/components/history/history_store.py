@@ -0,0 +1,383 @@
+import json
+import logging
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Sequence
+
+from langchain_community.chat_message_histories.in_memory import ChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from edit_gpt.components.history.summary_history import SummaryChatHistory
+from edit_gpt.components.history.vector_based_history import (
+    VectorBasedChatHistory,
+    create_empty_vectorstore,
+)
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILENAME = "history.sqlite3"
+SESSIONS_DIRECTORY = "sessions"
+UNSAFE_FILENAME_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+# how often idle sessions are looked for at most, seconds
+SWEEP_INTERVAL = 60.0
+
+
+class HistoryDatabase:
+    """Messages of all sessions in a SQLite database."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # shared by the request threads, serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, position INTEGER NOT NULL, "
+                "message TEXT NOT NULL, PRIMARY KEY (session_id, position))"
+            )
+            # when a message was last added or removed, wall-clock seconds
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+            )
+            # sessions of databases written before they were tracked
+            self._connection.execute(
+                "INSERT OR IGNORE INTO sessions "
+                "SELECT DISTINCT session_id, ? FROM messages",
+                (time.time(),),
+            )
+
+    def _touch(self, session_id: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?)", (session_id, time.time())
+        )
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        return messages_from_dict([json.loads(message) for message, in rows])
+
+    def insert(
+        self, session_id: str, position: int, messages: Sequence[BaseMessage]
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                [
+                    (session_id, position + i, json.dumps(message_to_dict(message)))
+                    for i, message in enumerate(messages)
+                ],
+            )
+            self._touch(session_id)
+
+    def truncate(self, session_id: str, n_messages: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM messages WHERE session_id = ? AND position >= ?",
+                (session_id, n_messages),
+            )
+            self._touch(session_id)
+
+    def expired(self, before: float) -> List[str]:
+        """The sessions last updated before the given time."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ?", (before,)
+            ).fetchall()
+        return [session_id for session_id, in rows]
+
+    def delete(self, session_id: str, before: float) -> bool:
+        """Deletes the session if it is still last updated before the given time."""
+        with self._lock, self._connection:
+            deleted = self._connection.execute(
+                "DELETE FROM sessions WHERE session_id = ? AND updated_at < ?",
+                (session_id, before),
+            ).rowcount
+            if deleted:
+                self._connection.execute(
+                    "DELETE FROM messages WHERE session_id = ?", (session_id,)
+                )
+        return bool(deleted)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """The messages of one session, read from the database once and kept in memory."""
+
+    def __init__(self, database: HistoryDatabase, session_id: str):
+        self._database = database
+        self.session_id = session_id
+        self._messages = database.load(session_id)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self._messages
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._database.insert(self.session_id, len(self._messages), messages)
+        self._messages.extend(messages)
+
+    def truncate(self, n_messages: int) -> None:
+        self._database.truncate(self.session_id, n_messages)
+        del self._messages[n_messages:]
+
+    def clear(self) -> None:
+        self.truncate(0)
+
+
+class HistoryStore:
+    """
+    Chat histories by session id.
+
+    With persist_directory, messages are stored in a SQLite database and the vector
+    index (history_type "vector") or the summary (history_type "summary") of every
+    session in a directory of its own. A session is loaded on first access and
+    evicted from memory when more than max_resident_sessions are loaded or, by a
+    background sweep, once it has been idle for idle_timeout seconds. Its vector
+    index or summary is saved on eviction. Without persist_directory evicted sessions
+    are dropped (the UI sends the whole conversation with every message, so
+    ChatManager.update_history rebuilds them).
+
+    The UI keys sessions by its session hash, which changes on every page load, so
+    persisted sessions with no new messages for retention seconds are deleted by
+    the sweep. Sessions are loaded outside the lock, a placeholder makes concurrent
+    requests for the same session wait for the first load.
+    """
+
+    def __init__(
+        self,
+        history_type: Literal["vector", "simple", "summary"] = "simple",
+        embeddings: Optional[Embeddings] = None,
+        persist_directory: Optional[str] = None,
+        n_retrieved_messages: int = 3,
+        k_last_messages: Optional[int] = 2,
+        idle_timeout: float = 900.0,
+        max_resident_sessions: int = 100,
+        chat_model: Optional[BaseChatModel] = None,
+        summary_kwargs: Optional[dict] = None,
+        retention: Optional[float] = None,
+    ):
+        """summary_kwargs are passed to SummaryChatHistory."""
+        self.history_type = history_type
+        self.embeddings = embeddings
+        self.chat_model = chat_model
+        self.summary_kwargs = summary_kwargs or {}
+        self.persist_directory = persist_directory
+        self.n_retrieved_messages = n_retrieved_messages
+        self.k_last_messages = k_last_messages
+        self.idle_timeout = idle_timeout
+        self.max_resident_sessions = max_resident_sessions
+        self.retention = retention
+        self._database = (
+            HistoryDatabase(str(Path(persist_directory) / DATABASE_FILENAME))
+            if persist_directory
+            else None
+        )
+        # session id -> history, least recently used first
+        self._sessions: OrderedDict[str, BaseChatMessageHistory] = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        # sessions being saved, given back if accessed meanwhile
+        self._evicting: Dict[str, BaseChatMessageHistory] = {}
+        # sessions being loaded or deleted, set when done
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._sweep, name="history-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _session_directory(self, session_id: str) -> str:
+        return str(
+            Path(self.persist_directory)
+            / SESSIONS_DIRECTORY
+            / UNSAFE_FILENAME_CHARACTERS.sub("_", session_id)
+        )
+
+    def _load(self, session_id: str) -> BaseChatMessageHistory:
+        if self._database is not None:
+            chat_message_history = SQLiteChatMessageHistory(self._database, session_id)
+        else:
+            chat_message_history = ChatMessageHistory()
+        if self.history_type == "simple":
+            return chat_message_history
+        if self.history_type == "summary":
+            if self.persist_directory:
+                return SummaryChatHistory.load(
+                    self._session_directory(session_id),
+                    self.chat_model,
+                    chat_message_history,
+                    **self.summary_kwargs,
+                )
+            return SummaryChatHistory(
+                self.chat_model, chat_message_history, **self.summary_kwargs
+            )
+        if self.persist_directory:
+            return VectorBasedChatHistory.load(
+                self._session_directory(session_id),
+                self.embeddings,
+                chat_message_history,
+                n_retrieved_messages=self.n_retrieved_messages,
+                k_last_messages=self.k_last_messages,
+            )
+        return VectorBasedChatHistory(
+            create_empty_vectorstore(self.embeddings).as_retriever(
+                search_kwargs={"k": self.n_retrieved_messages}
+            ),
+            chat_message_history,
+            k_last_messages=self.k_last_messages,
+        )
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        while True:
+            with self._lock:
+                history = self._sessions.pop(session_id, None)
+                if history is None:
+                    history = self._evicting.get(session_id)
+                if history is not None:
+                    evicted = self._add_resident(session_id, history)
+                    break
+                loading = self._loading.get(session_id)
+                is_loader = loading is None
+                if is_loader:
+                    loading = self._loading[session_id] = threading.Event()
+            if not is_loader:
+                # loaded (or deleted) by another thread, looked up again
+                loading.wait()
+                continue
+            try:
+                history = self._load(session_id)
+            finally:
+                with self._lock:
+                    del self._loading[session_id]
+                    if history is not None:
+                        evicted = self._add_resident(session_id, history)
+                loading.set()
+            break
+        self._save(evicted)
+        return history
+
+    def _add_resident(
+        self, session_id: str, history: BaseChatMessageHistory
+    ) -> Dict[str, BaseChatMessageHistory]:
+        now = time.monotonic()
+        self._sessions[session_id] = history
+        self._last_access[session_id] = now
+        return self._pop_evicted(now)
+
+    def _pop_evicted(self, now: float) -> Dict[str, BaseChatMessageHistory]:
+        evicted = {}
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if (
+                len(self._sessions) <= self.max_resident_sessions
+                and now - self._last_access[session_id] <= self.idle_timeout
+            ):
+                break
+            evicted[session_id] = self._sessions.pop(session_id)
+            del self._last_access[session_id]
+        self._evicting.update(evicted)
+        return evicted
+
+    def _save(self, sessions: Dict[str, BaseChatMessageHistory]) -> None:
+        for session_id, history in sessions.items():
+            try:
+                if self.persist_directory and isinstance(
+                    history, (VectorBasedChatHistory, SummaryChatHistory)
+                ):
+                    history.save(self._session_directory(session_id))
+                if isinstance(history, VectorBasedChatHistory):
+                    history.close()
+            except Exception:
+                logger.exception("Failed to save the history of session %s", session_id)
+            finally:
+                with self._lock:
+                    self._evicting.pop(session_id, None)
+        if sessions:
+            logger.debug("Unloaded %s history session(s)", len(sessions))
+
+    def evict_idle(self) -> None:
+        with self._lock:
+            evicted = self._pop_evicted(time.monotonic())
+        self._save(evicted)
+
+    def delete_expired(self) -> int:
+        """
+        Deletes the persisted sessions without new messages for retention seconds,
+        returns their number. Loaded sessions are kept.
+        """
+        if self._database is None or self.retention is None:
+            return 0
+        before = time.time() - self.retention
+        expired = self._database.expired(before)
+        with self._lock:
+            claimed = {
+                session_id: threading.Event()
+                for session_id in expired
+                if session_id not in self._sessions
+                and session_id not in self._evicting
+                and session_id not in self._loading
+            }
+            self._loading.update(claimed)
+        n_deleted = 0
+        try:
+            for session_id in claimed:
+                try:
+                    if self._database.delete(session_id, before):
+                        shutil.rmtree(
+                            self._session_directory(session_id), ignore_errors=True
+                        )
+                        n_deleted += 1
+                except Exception:
+                    logger.exception("Failed to delete history session %s", session_id)
+        finally:
+            with self._lock:
+                for session_id, deleted in claimed.items():
+                    del self._loading[session_id]
+                    deleted.set()
+        if n_deleted:
+            logger.info("Deleted %s expired history session(s)", n_deleted)
+        return n_deleted
+
+    def _sweep(self) -> None:
+        # get only evicts on access, sessions nobody comes back to are evicted here
+        interval = max(min(self.idle_timeout, SWEEP_INTERVAL), 1.0)
+        self.delete_expired()
+        while not self._stopped.wait(interval):
+            self.evict_idle()
+            self.delete_expired()
+
+    def close(self) -> None:
+        """Saves and unloads every session."""
+        self._stopped.set()
+        self._sweeper.join()
+        with self._lock:
+            evicted = dict(self._sessions)
+            self._evicting.update(evicted)
+            self._sessions.clear()
+            self._last_access.clear()
+        self._save(evicted)
+        if self._database is not None:
+            self._database.close()
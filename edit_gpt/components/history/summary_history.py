@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from langchain_core.prompts import BasePromptTemplate
+
+from edit_gpt.components.chat.chat_prompts import summary_prompt
+from edit_gpt.components.history.vector_based_history import truncate_history
+from edit_gpt.components.rag.splitters import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILENAME = "summary.json"
+SUMMARY_MESSAGE_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def messages_digest(messages: Sequence[BaseMessage]) -> str:
+    return hashlib.sha256(get_buffer_string(messages).encode("utf-8")).hexdigest()
+
+
+class SummaryChatHistory(BaseChatMessageHistory):
+    """
+    Chat history sent as a summary of the older turns followed by the last ones
+    verbatim (see context_messages), so that prompts stop growing with the
+    conversation.
+
+    The last last_turns turns are kept verbatim as long as they fit max_tokens along
+    with the summary, older messages are folded into the summary by the chat model
+    in a background thread after they are added. Until then they are sent verbatim.
+    """
+
+    def __init__(
+        self,
+        chat_model: BaseChatModel,
+        chat_message_history: BaseChatMessageHistory,
+        last_turns: int = 3,
+        max_tokens: int = 1500,
+        summary_max_tokens: int = 500,
+        prompt: BasePromptTemplate = summary_prompt,
+        count_tokens: Callable[[str], int] = count_tokens,
+        summary: str = "",
+        n_summarized: int = 0,
+    ):
+        self.chat_message_history = chat_message_history
+        self.last_turns = last_turns
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_chain = prompt | chat_model
+        self.count_tokens = count_tokens
+        # summary of the first n_summarized messages
+        self.summary = summary
+        self.n_summarized = n_summarized
+        # guards the above
+        self._condition = threading.Condition()
+        # bumped when messages are removed, a summary of them in progress is dropped
+        self._generation = 0
+        self._summarizing = False
+        self._schedule_summary()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.chat_message_history.messages
+
+    def context_messages(self) -> List[BaseMessage]:
+        """The messages to send with a prompt, the summary first if there is one."""
+        with self._condition:
+            messages = list(self.messages[self.n_summarized :])
+            if self.summary:
+                messages.insert(
+                    0, SystemMessage(content=SUMMARY_MESSAGE_PREFIX + self.summary)
+                )
+            return messages
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with self._condition:
+            self.chat_message_history.add_messages(messages)
+            self._schedule_summary()
+
+    def _summary_end(self) -> int:
+        """The number of first messages that should be in the summary."""
+        messages = self.messages
+        available = self.max_tokens - self.count_tokens(self.summary)
+        n_verbatim = 0
+        for message in reversed(messages[self.n_summarized :]):
+            if n_verbatim >= 2 * self.last_turns:
+                break
+            available -= self.count_tokens(message.content)
+            if available < 0:
+                break
+            n_verbatim += 1
+        return len(messages) - n_verbatim
+
+    def _schedule_summary(self) -> None:
+        with self._condition:
+            if self._summarizing or self._summary_end() <= self.n_summarized:
+                return
+            self._summarizing = True
+            threading.Thread(
+                target=self._summarize, name="history-summarizer", daemon=True
+            ).start()
+
+    def _summarize(self) -> None:
+        while True:
+            with self._condition:
+                generation = self._generation
+                summary = self.summary
+                start, end = self.n_summarized, self._summary_end()
+                if end <= start:
+                    self._summarizing = False
+                    self._condition.notify_all()
+                    return
+                new_lines = get_buffer_string(self.messages[start:end])
+            try:
+                new_summary = self.summary_chain.invoke(
+                    {
+                        "summary": summary,
+                        "new_lines": new_lines,
+                        "max_words": self.summary_max_tokens * 3 // 4,
+                    }
+                ).content.strip()
+            except Exception:
+                logger.exception("Failed to summarize %s history messages", end - start)
+                with self._condition:
+                    # retried with the next added messages
+                    self._summarizing = False
+                    self._condition.notify_all()
+                return
+            with self._condition:
+                # dropped if the summarized messages were removed meanwhile
+                if self._generation == generation:
+                    self.summary = new_summary
+                    self.n_summarized = end
+                    logger.debug(
+                        "Summarized %s history messages in %s tokens",
+                        end,
+                        self.count_tokens(new_summary),
+                    )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the summary is up to date, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._summarizing, timeout=timeout
+            )
+
+    def clear(self) -> None:
+        self.truncate(0)
+
+    def truncate(self, n_messages: int) -> None:
+        """Keeps the first n_messages messages, the summary too if it covers no more."""
+        with self._condition:
+            if n_messages < len(self.messages):
+                self._generation += 1
+            truncate_history(self.chat_message_history, n_messages)
+            if n_messages < self.n_summarized:
+                self.summary = ""
+                self.n_summarized = 0
+            self._schedule_summary()
+
+    def save(self, directory: str) -> None:
+        """Saves the summary with a digest of the messages it summarizes."""
+        with self._condition:
+            data = {
+                "summary": self.summary,
+                "n_summarized": self.n_summarized,
+                "digest": messages_digest(self.messages[: self.n_summarized]),
+            }
+        path = Path(directory) / SUMMARY_FILENAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        chat_model: BaseChatModel,
+        chat_message_history: BaseChatMessageHistory,
+        **kwargs,
+    ) -> "SummaryChatHistory":
+        """
+        Loads a summary saved by save for the messages of chat_message_history. It
+        is dropped (and the messages summarized again) if they have changed since.
+        """
+        path = Path(directory) / SUMMARY_FILENAME
+        summary, n_summarized = "", 0
+        if path.is_file():
+            data = json.loads(path.read_text())
+            messages = chat_message_history.messages
+            if data["n_summarized"] <= len(messages) and data[
+                "digest"
+            ] == messages_digest(messages[: data["n_summarized"]]):
+                summary, n_summarized = data["summary"], data["n_summarized"]
+        return cls(
+            chat_model,
+            chat_message_history,
+            summary=summary,
+            n_summarized=n_summarized,
+            **kwargs,
+        )
@@ -1,40 +1,243 @@
+import json
+import logging
+import os
 import re
+import threading
 import uuid
-from typing import List, Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set
 
+import numpy as np
 from langchain.text_splitter import CharacterTextSplitter
+from langchain_community.chat_message_histories.in_memory import ChatMessageHistory
+from langchain_community.vectorstores.faiss import FAISS
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.vectorstores import VectorStoreRetriever
 
+from edit_gpt.components.rag.local.faiss_storage import (
+    faiss_index_exists,
+    load_faiss,
+    save_faiss,
+)
+from edit_gpt.components.rag.retrieval_context import RetrievalContext, embed_query
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_DOC_IDS_FILENAME = "message_doc_ids.json"
+
+
+def create_empty_vectorstore(embeddings: Embeddings, vectorstore=FAISS):
+    # trick to init empty db
+    fake_id = str(uuid.uuid4())
+    db = vectorstore.from_documents(
+        [Document(page_content="")], embeddings, ids=[fake_id]
+    )
+    db.delete([fake_id])
+    return db
+
+
+def truncate_history(history: BaseChatMessageHistory, n_messages: int) -> None:
+    """Keeps the first n_messages messages of history."""
+    if isinstance(history, ChatMessageHistory):
+        del history.messages[n_messages:]
+    elif hasattr(history, "truncate"):
+        # VectorBasedChatHistory, SQLiteChatMessageHistory
+        history.truncate(n_messages)
+    else:
+        kept_messages = history.messages[:n_messages]
+        history.clear()
+        history.add_messages(kept_messages)
+
 
 class VectorBasedChatHistory(BaseChatMessageHistory):
+    """
+    Chat history whose messages are also embedded into the retriever's vectorstore
+    (FAISS), so that retrieve returns the ones related to a question.
+
+    Messages are embedded off the request path by a background thread, everything
+    added since its last run in one embedding call. Until then they are returned by
+    retrieve along with the last messages.
+
+    message_doc_ids restores the ids of the docs of already embedded messages (see
+    load), the messages of chat_message_history after them are embedded again.
+    """
+
     def __init__(
         self,
         retriever: VectorStoreRetriever,
         chat_message_history: BaseChatMessageHistory,
         k_last_messages: Optional[int] = 2,
+        message_doc_ids: Optional[List[List[str]]] = None,
     ):
         self.retriever = retriever
         self.chat_message_history = chat_message_history
         self.k_last_messages = k_last_messages
-        self.docs_in_retriever_ids = []
+        self.text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+        # ids of the retriever docs of every message, in message order
+        self.message_doc_ids: List[List[str]] = list(message_doc_ids or [])
+        # docs waiting for the indexing thread, the ids of those and of the batch it
+        # is embedding, and the ids of that batch's docs deleted meanwhile
+        self._pending_docs: List[Document] = []
+        self._unindexed_ids: Set[str] = set()
+        self._cancelled_ids: Set[str] = set()
+        # doc id -> position in the FAISS index, built on first use, extended on add
+        # and rebuilt after deletes (which shift the positions)
+        self._doc_positions: Optional[Dict[str, int]] = None
+        # guards the above and the vectorstore
+        self._condition = threading.Condition()
+        self._indexing_thread: Optional[threading.Thread] = None
+        # the indexing thread exits once the queue is empty
+        self._closed = False
+        self._index_messages(
+            self.chat_message_history.messages[len(self.message_doc_ids) :]
+        )
 
     @property
     def messages(self):
         return self.chat_message_history.messages
 
     def add_message(self, message: BaseMessage) -> None:
-        self.chat_message_history.add_message(message)
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        docs = text_splitter.create_documents(
-            [f"<mtype>{message.type}<mtype> {message.content}"]
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with self._condition:
+            self.chat_message_history.add_messages(messages)
+            self._index_messages(messages)
+
+    def _index_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        with self._condition:
+            for message in messages:
+                docs = self.text_splitter.create_documents(
+                    [f"<mtype>{message.type}<mtype> {message.content}"]
+                )
+                ids = [str(uuid.uuid4()) for _ in docs]
+                for i, doc in enumerate(docs):
+                    doc.metadata["id"] = ids[i]
+                self.message_doc_ids.append(ids)
+                self._pending_docs.extend(docs)
+                self._unindexed_ids.update(ids)
+            if self._indexing_thread is None:
+                self._closed = False
+                self._indexing_thread = threading.Thread(
+                    target=self._index_pending, name="history-indexer", daemon=True
+                )
+                self._indexing_thread.start()
+            self._condition.notify_all()
+
+    def _index_pending(self) -> None:
+        vectorstore = self.retriever.vectorstore
+        while True:
+            with self._condition:
+                while not self._pending_docs and not self._closed:
+                    self._condition.wait()
+                if not self._pending_docs:
+                    self._indexing_thread = None
+                    return
+                docs, self._pending_docs = self._pending_docs, []
+            ids = [doc.metadata["id"] for doc in docs]
+            texts = [doc.page_content for doc in docs]
+            try:
+                vectors = vectorstore.embeddings.embed_documents(texts)
+            except Exception:
+                logger.exception("Failed to embed %s history message doc(s)", len(docs))
+                vectors = None
+
+            with self._condition:
+                if vectors is not None:
+                    start = len(vectorstore.index_to_docstore_id)
+                    vectorstore.add_embeddings(
+                        zip(texts, vectors),
+                        metadatas=[doc.metadata for doc in docs],
+                        ids=ids,
+                    )
+                    if self._doc_positions is not None:
+                        for position, doc_id in enumerate(ids, start):
+                            self._doc_positions[doc_id] = position
+                    cancelled_ids = [i for i in ids if i in self._cancelled_ids]
+                    if cancelled_ids:
+                        self._delete_docs(cancelled_ids)
+                else:
+                    # the messages stay in the history, just not retrievable
+                    failed_ids = set(ids)
+                    for message_ids in self.message_doc_ids:
+                        message_ids[:] = [i for i in message_ids if i not in failed_ids]
+                self._cancelled_ids.difference_update(ids)
+                self._unindexed_ids.difference_update(ids)
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all messages are embedded, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._unindexed_ids, timeout=timeout
+            )
+
+    def close(self) -> None:
+        """Stops the indexing thread once the pending messages are embedded."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def save(self, directory: str) -> None:
+        """
+        Saves the vectorstore and the doc ids of the embedded messages to directory.
+        Docs of messages that are not recorded as embedded are dropped by load.
+        """
+        self.flush()
+        with self._condition:
+            save_faiss(self.retriever.vectorstore, directory)
+            n_indexed = 0
+            for ids in self.message_doc_ids:
+                if not self._unindexed_ids.isdisjoint(ids):
+                    break
+                n_indexed += 1
+            path = Path(directory) / MESSAGE_DOC_IDS_FILENAME
+            tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(self.message_doc_ids[:n_indexed]))
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        embeddings: Embeddings,
+        chat_message_history: BaseChatMessageHistory,
+        n_retrieved_messages: int = 3,
+        k_last_messages: Optional[int] = 2,
+    ) -> "VectorBasedChatHistory":
+        """
+        Loads a history saved by save for the messages of chat_message_history, which
+        may have changed since. Messages without docs in the saved vectorstore (or
+        after one without) are embedded again, docs of no message are deleted.
+        """
+        ids_path = Path(directory) / MESSAGE_DOC_IDS_FILENAME
+        if not faiss_index_exists(directory) or not ids_path.is_file():
+            db = create_empty_vectorstore(embeddings)
+            message_doc_ids = []
+        else:
+            db = load_faiss(directory, embeddings)
+            saved_ids = set(db.index_to_docstore_id.values())
+            message_doc_ids = []
+            for ids in json.loads(ids_path.read_text())[
+                : len(chat_message_history.messages)
+            ]:
+                if not saved_ids.issuperset(ids):
+                    break
+                message_doc_ids.append(ids)
+            kept_ids = {doc_id for ids in message_doc_ids for doc_id in ids}
+            if saved_ids - kept_ids:
+                db.delete(list(saved_ids - kept_ids))
+        return cls(
+            db.as_retriever(search_kwargs={"k": n_retrieved_messages}),
+            chat_message_history,
+            k_last_messages=k_last_messages,
+            message_doc_ids=message_doc_ids,
         )
-        ids = [str(uuid.uuid4()) for _ in docs]
-        for i, doc in enumerate(docs):
-            doc.metadata["id"] = ids[i]
-        self.docs_in_retriever_ids.extend(ids)
-        self.retriever.add_documents(docs, ids=ids)
 
     @staticmethod
     def db_doc_to_message(db_doc):
@@ -52,12 +255,68 @@ class VectorBasedChatHistory(BaseChatMessageHistory):
             return SystemMessage(content=content)
 
     def clear(self) -> None:
-        self.chat_message_history.clear()
-        if self.docs_in_retriever_ids:
-            self.retriever.vectorstore.delete(self.docs_in_retriever_ids)
-            self.docs_in_retriever_ids = []
+        self.truncate(0)
+
+    def truncate(self, n_messages: int) -> None:
+        """Keeps the first n_messages messages and deletes the others' docs."""
+        with self._condition:
+            truncate_history(self.chat_message_history, n_messages)
+            removed_ids = {
+                doc_id for ids in self.message_doc_ids[n_messages:] for doc_id in ids
+            }
+            del self.message_doc_ids[n_messages:]
+            pending_ids = {doc.metadata["id"] for doc in self._pending_docs}
+            self._pending_docs = [
+                doc
+                for doc in self._pending_docs
+                if doc.metadata["id"] not in removed_ids
+            ]
+            # taken before the pending ids leave _unindexed_ids, they were never added
+            indexed_ids = removed_ids - self._unindexed_ids
+            # deleted by the indexing thread once their batch is added
+            self._cancelled_ids.update(
+                (self._unindexed_ids - pending_ids) & removed_ids
+            )
+            self._unindexed_ids -= pending_ids & removed_ids
+            if indexed_ids:
+                self._delete_docs(list(indexed_ids))
+            self._condition.notify_all()
+
+    def _delete_docs(self, doc_ids: List[str]) -> None:
+        self.retriever.vectorstore.delete(doc_ids)
+        self._doc_positions = None
 
-    def retrieve(self, question: str) -> List[BaseMessage]:
+    def _get_vectors(self, doc_ids: List[str]) -> List[np.ndarray]:
+        """The stored vectors of the docs doc_ids, of those still in the index."""
+        if not doc_ids:
+            return []
+        vectorstore = self.retriever.vectorstore
+        if self._doc_positions is None:
+            self._doc_positions = {
+                doc_id: position
+                for position, doc_id in vectorstore.index_to_docstore_id.items()
+            }
+        return [
+            vectorstore.index.reconstruct(self._doc_positions[doc_id])
+            for doc_id in doc_ids
+            if doc_id in self._doc_positions
+        ]
+
+    def _search(self, query: str, embedding: List[float]) -> List[Document]:
+        """What the retriever returns for query, searched with its embedding."""
+        vectorstore = self.retriever.vectorstore
+        search_kwargs = self.retriever.search_kwargs
+        if self.retriever.search_type == "similarity":
+            return vectorstore.similarity_search_by_vector(embedding, **search_kwargs)
+        if self.retriever.search_type == "mmr":
+            return vectorstore.max_marginal_relevance_search_by_vector(
+                embedding, **search_kwargs
+            )
+        return self.retriever.invoke(query)
+
+    def retrieve(
+        self, question: str, retrieval_context: Optional[RetrievalContext] = None
+    ) -> List[BaseMessage]:
         """
         Retrieves a list of messages related to the given question.
 
@@ -68,19 +327,51 @@ class VectorBasedChatHistory(BaseChatMessageHistory):
 
         Args:
             question (str): The question to retrieve related messages for.
+            retrieval_context (RetrievalContext): Query embeddings of the request.
+                If given, the question's embedding is taken from it (shared with
+                RAG) and averaged with the stored vectors of the last messages,
+                instead of embedding the question with the last messages.
 
         Returns:
             List[BaseMessage]: A list of messages related to the question.
         """
-        last_messages = []
-        if self.k_last_messages:
-            last_messages = self.chat_message_history.messages[-self.k_last_messages :]
-            for message in last_messages:
-                question += "\n" + message.content
+        with self._condition:
+            # messages that are not embedded yet can only be returned as last ones
+            n_unindexed = 0
+            for ids in reversed(self.message_doc_ids):
+                if self._unindexed_ids.isdisjoint(ids):
+                    break
+                n_unindexed += 1
+            messages = self.chat_message_history.messages
+            query = question
+            recent_ids = []
+            if self.k_last_messages:
+                for message in messages[-self.k_last_messages :]:
+                    query += "\n" + message.content
+                recent_ids = [
+                    doc_id
+                    for ids in self.message_doc_ids[-self.k_last_messages :]
+                    for doc_id in ids
+                    if doc_id not in self._unindexed_ids
+                ]
+            n_last_messages = max(self.k_last_messages or 0, n_unindexed)
+            last_messages = messages[-n_last_messages:] if n_last_messages else []
 
-        last_messages_content = [message.content for message in last_messages]
+            last_messages_content = [message.content for message in last_messages]
 
-        retrieved_history = self.retriever.invoke(question)
+        vectorstore = self.retriever.vectorstore
+        if retrieval_context is not None and isinstance(vectorstore, FAISS):
+            embedding = embed_query(vectorstore.embeddings, question, retrieval_context)
+            with self._condition:
+                recent_vectors = self._get_vectors(recent_ids)
+            if recent_vectors:
+                embedding = np.mean(
+                    [embedding, np.mean(recent_vectors, axis=0)], axis=0
+                ).tolist()
+        else:
+            embedding = vectorstore.embeddings.embed_query(query)
+        with self._condition:
+            retrieved_history = self._search(query, embedding)
 
         retrieved_history_messages = []
         for db_doc in retrieved_history:
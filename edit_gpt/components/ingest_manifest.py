@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_sha256(path: str) -> Optional[str]:
+    """The hex digest of the file's content, None if it can't be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class FileRecord(BaseModel):
+    size: int
+    mtime_ns: int
+    # computed the first time size or mtime change
+    sha256: Optional[str] = None
+    chunk_ids: List[str] = Field(default_factory=list)
+
+    def matches_stat(self, stat: os.stat_result) -> bool:
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+
+class IngestReport(BaseModel):
+    added: int = 0
+    updated: int = 0
+    skipped: int = 0
+    removed: int = 0
+    embedded_chunks: int = 0
+    deleted_chunks: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"added={self.added} updated={self.updated} "
+            f"skipped={self.skipped} removed={self.removed} "
+            f"embedded_chunks={self.embedded_chunks} "
+            f"deleted_chunks={self.deleted_chunks}"
+        )
+
+
+class IngestManifest:
+    """
+    What was ingested from every file: its size, mtime, content hash and chunk ids.
+    If path is given the manifest is loaded from and saved to that JSON file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._records: Dict[str, FileRecord] = {}
+        if self.path and Path(self.path).is_file():
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(Path(self.path).read_text(encoding="utf-8"))
+            self._records = {
+                filename: FileRecord(**record) for filename, record in data.items()
+            }
+        except (ValueError, TypeError) as e:
+            logger.warning("Ignoring unreadable ingest manifest %s: %s", self.path, e)
+            self._records = {}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    filename: record.model_dump()
+                    for filename, record in self._records.items()
+                }
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+
+    def get(self, filename: str) -> Optional[FileRecord]:
+        return self._records.get(filename)
+
+    def set(self, filename: str, record: FileRecord) -> None:
+        self._records[filename] = record
+
+    def remove(self, filename: str) -> None:
+        self._records.pop(filename, None)
+
+    def filenames(self) -> List[str]:
+        return list(self._records)
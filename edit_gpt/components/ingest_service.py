@@ -1,23 +1,162 @@
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 
+from edit_gpt.components.ingest_manifest import (
+    FileRecord,
+    IngestManifest,
+    IngestReport,
+    file_sha256,
+)
 from edit_gpt.components.rag.local.rag_local import LocalRAGManager
-from edit_gpt.utils.loaders import get_all_filenames_from_paths
+from edit_gpt.components.rag.local.rag_sharded import ShardedRAGManager
+from edit_gpt.utils.loaders import (
+    get_all_filenames_from_paths,
+    normalize_to_straight_slash,
+)
+
+logger = logging.getLogger(__name__)
+
+HASH_WORKERS = 8
+
+
+def _is_under(filename: str, root: str) -> bool:
+    return filename == root or filename.startswith(root.rstrip("/") + "/")
 
 
 class IngestService:
-    def __init__(self, rag_manager: LocalRAGManager):
+    def __init__(
+        self,
+        rag_manager: Union[LocalRAGManager, ShardedRAGManager],
+        manifest_path: Optional[str] = None,
+    ):
         self._rag_manager = rag_manager
-        self.ingested_files_last_edit_time = {}
+        self.manifest = IngestManifest(manifest_path)
+        # ingestion runs both from UI callbacks and from the file watcher thread
+        self._lock = threading.RLock()
 
     def list_ingested(self) -> list:
         return self._rag_manager.get_all_docs()
 
-    def bulk_ingest(self, paths: list[str]) -> None:
-        filenames = get_all_filenames_from_paths(paths)
-        for path in filenames:
-            timestamp = os.path.getmtime(path)
-            self.ingested_files_last_edit_time[path] = timestamp
-        self._rag_manager.add_texts_from_paths(paths)
+    def list_ingested_sources(self) -> list[str]:
+        return self._rag_manager.list_sources()
+
+    def _is_indexed(self, filename: str, record: FileRecord) -> bool:
+        # the index may have been deleted or changed behind the manifest's back
+        return set(self._rag_manager.get_ids_by_source(filename)) == set(
+            record.chunk_ids
+        )
+
+    def bulk_ingest(self, paths: list[str]) -> IngestReport:
+        """
+        Brings the index in line with the files under paths: new files are added,
+        modified ones re-embedded and files that disappeared from disk (or are now
+        rejected by the RAG manager's file filter) removed.
+        Files whose size and mtime match the manifest are skipped without being
+        read, the file filter's content checks only run on new and changed files.
+        Only files whose size or mtime changed are hashed (in parallel) and skipped
+        if their content did not change. New files are not hashed, the parallel
+        loader is the only one to read them.
+        """
+        with self._lock:
+            return self._bulk_ingest(paths)
+
+    def _bulk_ingest(self, paths: list[str]) -> IngestReport:
+        report = IngestReport()
+        file_filter = self._rag_manager.file_filter
+        filenames = get_all_filenames_from_paths(
+            paths, file_filter, check_content=False
+        )
+        stats = {}
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                # deleted during the walk, removed below if it was ingested
+                continue
+            record = self.manifest.get(filename)
+            unchanged = record is not None and record.matches_stat(stat)
+            if (
+                not unchanged
+                and file_filter is not None
+                and not file_filter.accepts_content(filename)
+            ):
+                # removed below if it was ingested before
+                continue
+            stats[filename] = stat
+
+        to_ingest = {}
+        changed = []
+        for filename, stat in stats.items():
+            record = self.manifest.get(filename)
+            if record is None or not self._is_indexed(filename, record):
+                to_ingest[filename] = (stat, None)
+            elif record.matches_stat(stat):
+                report.skipped += 1
+            else:
+                changed.append(filename)
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            digests = dict(zip(changed, pool.map(file_sha256, changed)))
+        for filename, digest in digests.items():
+            record = self.manifest.get(filename)
+            stat = stats[filename]
+            if digest is not None and digest == record.sha256:
+                record.size, record.mtime_ns = stat.st_size, stat.st_mtime_ns
+                report.skipped += 1
+            else:
+                to_ingest[filename] = (stat, digest)
+        for filename in to_ingest:
+            if self.manifest.get(filename) is None:
+                report.added += 1
+            else:
+                report.updated += 1
+
+        roots = [normalize_to_straight_slash(path) for path in paths]
+        existing = set(stats)
+        removed = [
+            filename
+            for filename in self.manifest.filenames()
+            if filename not in existing
+            and any(_is_under(filename, root) for root in roots)
+        ]
+        report.removed = len(removed)
+
+        # saved once, not after the deletes and again after the updates
+        with self._rag_manager.defer_persist():
+            removed_chunks = self.delete_sources(removed)
+            # modified files keep the chunks that did not change
+            added_ids, deleted_ids = self._rag_manager.update_texts_from_paths(
+                list(to_ingest)
+            )
+        report.embedded_chunks = len(added_ids)
+        report.deleted_chunks = len(deleted_ids) + removed_chunks
+        for filename, (stat, digest) in to_ingest.items():
+            self.manifest.set(
+                filename,
+                FileRecord(
+                    size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns,
+                    sha256=digest,
+                    chunk_ids=self._rag_manager.get_ids_by_source(filename),
+                ),
+            )
+        self.manifest.save()
+        logger.info("Ingested %s: %s", paths, report)
+        return report
 
     def delete(self, doc_id: str) -> None:
-        self._rag_manager.delete(doc_id)
+        with self._lock:
+            self._rag_manager.delete(doc_id)
+
+    def delete_source(self, source: str) -> int:
+        return self.delete_sources([source])
+
+    def delete_sources(self, sources: list[str]) -> int:
+        with self._lock:
+            for source in sources:
+                self.manifest.remove(source)
+            deleted = self._rag_manager.delete_sources(sources)
+            self.manifest.save()
+            return deleted
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from langchain_text_splitters import CharacterTextSplitter
+from edit_gpt.components.rag.splitters import create_text_splitter
 
 
 class BaseRAGManager(ABC):
@@ -11,6 +11,8 @@ class BaseRAGManager(ABC):
         chunk_overlap=0,
         search_type="mmr",
         search_kwargs=None,
+        splitters=None,
+        chunk_max_tokens=400,
     ):
         if search_kwargs is None:
             search_kwargs = {"k": 4}
@@ -19,8 +21,11 @@ class BaseRAGManager(ABC):
         self.search_type = search_type
         self.search_kwargs = search_kwargs
         self.embeddings = embeddings
-        self.text_splitter = CharacterTextSplitter(
-            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        self.text_splitter = create_text_splitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            splitters=splitters,
+            max_tokens=chunk_max_tokens,
         )
         self.rag_database = self.init_database()
         self.rag_retriever = self.get_retriever()
@@ -37,6 +42,18 @@ class BaseRAGManager(ABC):
     def get_all_docs(self):
         pass
 
+    @abstractmethod
+    def get_docs_by_source(self, source):
+        pass
+
+    @abstractmethod
+    def list_sources(self):
+        pass
+
     @abstractmethod
     def add_texts_from_paths(self, paths):
         pass
+
+    @abstractmethod
+    def delete_source(self, source):
+        pass
@@ -0,0 +1,100 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+SUBWORD_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased identifiers and numbers. Identifiers made of several words
+    (snake_case, camelCase) are indexed both as a whole and by their parts, so
+    exact symbol names score highest while their parts still match.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        tokens.append(identifier.lower())
+        parts = SUBWORD_PATTERN.findall(identifier)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-memory inverted index over chunks with Okapi BM25 scoring. Chunks are keyed
+    by the entry ids of the ChunkStore, one per unique text.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {doc id -> term frequency}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        tokens = tokenize(text)
+        for term, frequency in Counter(tokens).items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._doc_lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: int, text: str) -> None:
+        """Removes a chunk, text must be the text it was added with."""
+        if doc_id not in self._doc_lengths:
+            return
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def search(
+        self, query: str, k: int = 4, doc_ids: Optional[Set[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Scores all documents, or only doc_ids if given, and returns the k best."""
+        if not self._doc_lengths:
+            return []
+        docs_count = len(self._doc_lengths)
+        average_length = self._total_length / docs_count or 1
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (docs_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            if doc_ids is None:
+                candidates = postings.items()
+            elif len(doc_ids) < len(postings):
+                candidates = [
+                    (doc_id, postings[doc_id])
+                    for doc_id in doc_ids
+                    if doc_id in postings
+                ]
+            else:
+                candidates = [
+                    (doc_id, frequency)
+                    for doc_id, frequency in postings.items()
+                    if doc_id in doc_ids
+                ]
+            for doc_id, frequency in candidates:
+                length_norm = (
+                    1 - self.b + self.b * self._doc_lengths[doc_id] / average_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (
+                    self.k1 + 1
+                ) / (frequency + self.k1 * length_norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
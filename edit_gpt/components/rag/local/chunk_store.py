@@ -0,0 +1,412 @@
+import hashlib
+import logging
+import mmap
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+BLOB_FILENAME = "chunks-{}.bin"
+# the blob is rewritten without the texts of deleted entries once they take up more
+# than half of it
+MIN_GARBAGE_TO_COMPACT = 1 << 20
+
+
+def content_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def is_in_scope(source: Optional[str], scope: str) -> bool:
+    """Whether source is the file scope or a file under the directory scope."""
+    return source is not None and (
+        source == scope or source.startswith(scope.rstrip("/") + "/")
+    )
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """
+    Compact storage for the chunks of a LocalRAGManager, used as the docstore of its
+    FAISS vectorstore.
+
+    Entries are the unique chunk texts, one per FAISS vector, and chunks are the
+    places in files where they occur. Both are numbered: entry ids are the FAISS
+    docstore ids and chunk ids are exposed as id_prefix + number. Texts are appended
+    to a blob file in directory and read back through mmap (kept in memory without
+    a directory), everything else lives in integer arrays with interned source
+    paths. Documents are only created for the chunks that are actually returned.
+
+    Only the source and the lines of a chunk are kept from its metadata.
+    """
+
+    def __init__(self, directory: Optional[str] = None, id_prefix: str = ""):
+        self.directory = directory
+        self.id_prefix = id_prefix
+        self._generation = 0
+        self._memory_blob = bytearray()
+        self._file = None
+        self._mmap = None
+        self._stale_blobs: List[Path] = []
+        # bytes of live and of deleted texts in the blob
+        self._live_size = 0
+        self._garbage = 0
+
+        # entry id -> offset and byte length of its text in the blob (-1 if deleted),
+        # its first chunk (-1 if none) and sha256 (32 bytes each)
+        self._offsets = array("q")
+        self._lengths = array("q")
+        self._first_chunks = array("q")
+        self._digests = bytearray()
+        self._digest_to_entry: Dict[bytes, int] = {}
+        # entry id -> the other chunks with the same text
+        self._duplicates: Dict[int, List[int]] = {}
+
+        # chunk id -> entry id (-1 if deleted), source index, lines (0 if unknown)
+        self._chunk_entries = array("q")
+        self._chunk_sources = array("i")
+        self._start_lines = array("i")
+        self._end_lines = array("i")
+        self._sources: List[str] = []
+        self._source_indexes: Dict[str, int] = {}
+        # source index -> its chunk ids in file order
+        self._source_chunks: Dict[int, array] = {}
+        self._chunks_count = 0
+
+    def __len__(self) -> int:
+        return self._chunks_count
+
+    # blob
+
+    def _blob_path(self, directory: str, generation: int) -> Path:
+        return Path(directory) / BLOB_FILENAME.format(generation)
+
+    def _open_blob(self, mode: str = "a+b") -> None:
+        path = self._blob_path(self.directory, self._generation)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open(mode)
+
+    def _close_blob(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, data: bytes) -> int:
+        if self.directory is None:
+            offset = len(self._memory_blob)
+            self._memory_blob += data
+            return offset
+        if self._file is None:
+            # a new store starts a new blob, an opened one appends to its own
+            self._open_blob("w+b")
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+        return offset
+
+    def _read(self, offset: int, length: int) -> str:
+        if self.directory is None:
+            return self._memory_blob[offset : offset + length].decode("utf-8")
+        if self._mmap is None or offset + length > len(self._mmap):
+            # the blob grew since it was mapped
+            self._file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset : offset + length].decode("utf-8")
+
+    def _rewrite(self, directory: str) -> None:
+        generation = self._generation + 1
+        path = self._blob_path(directory, generation)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        offsets = array("q", self._offsets)
+        with path.open("wb") as f:
+            for entry_id, length in enumerate(self._lengths):
+                if length >= 0:
+                    offsets[entry_id] = f.tell()
+                    f.write(self._read(self._offsets[entry_id], length).encode("utf-8"))
+        if self.directory is not None:
+            self._stale_blobs.append(self._blob_path(self.directory, self._generation))
+        self._close_blob()
+        self._memory_blob = bytearray()
+        self.directory = directory
+        self._generation = generation
+        self._offsets = offsets
+        self._garbage = 0
+        self._open_blob()
+
+    def save(self, directory: str) -> None:
+        """
+        Makes the blob in directory complete before the store is pickled. The blob
+        is rewritten there if it lives elsewhere or is mostly deleted texts, the old
+        one is removed by remove_stale_blobs once the pickle has been replaced.
+        """
+        if (
+            self.directory is None
+            or Path(self.directory).resolve() != Path(directory).resolve()
+            or self._garbage > max(self._live_size, MIN_GARBAGE_TO_COMPACT)
+        ):
+            garbage = self._garbage
+            self._rewrite(directory)
+            if garbage:
+                logger.info("Compacted chunk texts, %s byte(s) freed", garbage)
+        elif self._file is not None:
+            self._file.flush()
+
+    def remove_stale_blobs(self) -> None:
+        for path in self._stale_blobs:
+            path.unlink(missing_ok=True)
+        self._stale_blobs = []
+
+    def open(self, directory: str) -> None:
+        """Opens the blob of a store unpickled from directory."""
+        self.directory = directory
+        self._open_blob()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for attribute in ("directory", "_file", "_mmap", "_stale_blobs"):
+            del state[attribute]
+        state["_memory_blob"] = bytearray()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.directory = None
+        self._file = None
+        self._mmap = None
+        self._stale_blobs = []
+
+    # entries, as seen by langchain's FAISS wrapper
+
+    @property
+    def next_entry_id(self) -> int:
+        return len(self._offsets)
+
+    def add(self, texts: Dict[int, Document]) -> None:
+        """Adds entries, their ids have to continue from next_entry_id."""
+        for entry_id, doc in texts.items():
+            if entry_id != self.next_entry_id:
+                raise ValueError(
+                    f"Expected entry id {self.next_entry_id}, got {entry_id}"
+                )
+            data = doc.page_content.encode("utf-8")
+            digest = hashlib.sha256(data).digest()
+            self._offsets.append(self._append(data))
+            self._lengths.append(len(data))
+            self._first_chunks.append(-1)
+            self._digests += digest
+            self._digest_to_entry.setdefault(digest, entry_id)
+            self._live_size += len(data)
+
+    def search(self, search: int) -> Document:
+        """The entry with its id as the only metadata."""
+        if not 0 <= search < len(self._lengths) or self._lengths[search] < 0:
+            return f"ID {search} not found."
+        return Document(page_content=self.get_text(search), metadata={"id": search})
+
+    def delete(self, ids: List[int]) -> None:
+        """Deletes entries, their chunks have to be removed first."""
+        for entry_id in ids:
+            digest = self.get_digest(entry_id)
+            if self._digest_to_entry.get(digest) == entry_id:
+                del self._digest_to_entry[digest]
+            self._live_size -= self._lengths[entry_id]
+            self._garbage += self._lengths[entry_id]
+            self._lengths[entry_id] = -1
+            self._first_chunks[entry_id] = -1
+            self._duplicates.pop(entry_id, None)
+
+    def get_text(self, entry_id: int) -> str:
+        return self._read(self._offsets[entry_id], self._lengths[entry_id])
+
+    def get_digest(self, entry_id: int) -> bytes:
+        return bytes(self._digests[entry_id * 32 : entry_id * 32 + 32])
+
+    def find_entry(self, digest: bytes) -> Optional[int]:
+        return self._digest_to_entry.get(digest)
+
+    def entry_ids(self) -> List[int]:
+        return [
+            entry_id for entry_id, length in enumerate(self._lengths) if length >= 0
+        ]
+
+    def _entry_chunks(self, entry_id: int) -> List[int]:
+        first_chunk = self._first_chunks[entry_id]
+        if first_chunk < 0:
+            return []
+        return [first_chunk] + self._duplicates.get(entry_id, [])
+
+    def entry_in_scope(self, entry_id: int, scope: str) -> bool:
+        return any(
+            is_in_scope(self._sources[self._chunk_sources[chunk]], scope)
+            for chunk in self._entry_chunks(entry_id)
+        )
+
+    def get_document(self, entry_id: int, scope: Optional[str] = None) -> Document:
+        """
+        The entry as a retrieved chunk: its text with the metadata of its first
+        chunk (in scope), the other chunks with the same text are listed in the
+        "duplicates" metadata.
+        """
+        chunks = self._entry_chunks(entry_id)
+        chunk = next(
+            (
+                chunk
+                for chunk in chunks
+                if scope is None
+                or is_in_scope(self._sources[self._chunk_sources[chunk]], scope)
+            ),
+            chunks[0],
+        )
+        metadata = self._metadata(chunk)
+        if len(chunks) > 1:
+            metadata["duplicates"] = [
+                self._metadata(duplicate) for duplicate in chunks if duplicate != chunk
+            ]
+        return Document(page_content=self.get_text(entry_id), metadata=metadata)
+
+    # chunks
+
+    def _chunk_index(self, chunk_id: str) -> int:
+        number = chunk_id[len(self.id_prefix) :]
+        if (
+            not chunk_id.startswith(self.id_prefix)
+            or not number.isdigit()
+            or int(number) >= len(self._chunk_entries)
+            or self._chunk_entries[int(number)] < 0
+        ):
+            raise KeyError(chunk_id)
+        return int(number)
+
+    def _metadata(self, chunk: int) -> dict:
+        metadata = {
+            "source": self._sources[self._chunk_sources[chunk]],
+            "id": f"{self.id_prefix}{chunk}",
+        }
+        if self._start_lines[chunk]:
+            metadata["start_line"] = self._start_lines[chunk]
+            metadata["end_line"] = self._end_lines[chunk]
+        return metadata
+
+    def add_chunk(self, entry_id: int, metadata: dict) -> str:
+        source = metadata.get("source")
+        source_index = self._source_indexes.get(source)
+        if source_index is None:
+            source_index = self._source_indexes[source] = len(self._sources)
+            self._sources.append(source)
+        chunk = len(self._chunk_entries)
+        self._chunk_entries.append(entry_id)
+        self._chunk_sources.append(source_index)
+        self._start_lines.append(metadata.get("start_line", 0))
+        self._end_lines.append(metadata.get("end_line", 0))
+        self._source_chunks.setdefault(source_index, array("q")).append(chunk)
+        if self._first_chunks[entry_id] < 0:
+            self._first_chunks[entry_id] = chunk
+        else:
+            self._duplicates.setdefault(entry_id, []).append(chunk)
+        self._chunks_count += 1
+        return f"{self.id_prefix}{chunk}"
+
+    def remove_chunk(self, chunk_id: str) -> Optional[int]:
+        """
+        Removes the chunk and returns the id of its entry if no other chunk has the
+        same text, so the entry can be deleted.
+        """
+        chunk = self._chunk_index(chunk_id)
+        entry_id = self._chunk_entries[chunk]
+        self._chunk_entries[chunk] = -1
+        self._chunks_count -= 1
+        source_index = self._chunk_sources[chunk]
+        source_chunks = self._source_chunks[source_index]
+        source_chunks.remove(chunk)
+        if not source_chunks:
+            del self._source_chunks[source_index]
+
+        duplicates = self._duplicates.get(entry_id, [])
+        if chunk in duplicates:
+            duplicates.remove(chunk)
+        elif duplicates:
+            self._first_chunks[entry_id] = duplicates.pop(0)
+        else:
+            self._first_chunks[entry_id] = -1
+            return entry_id
+        if not duplicates:
+            del self._duplicates[entry_id]
+        return None
+
+    def set_source_chunks(self, source: str, chunks: List[Tuple[str, dict]]) -> bool:
+        """
+        Puts the chunks of source in the given (file) order and sets their lines from
+        the metadata, after the file was re-indexed. chunks has to list every chunk
+        of source. Returns whether anything changed.
+        """
+        source_index = self._source_indexes.get(source)
+        current = self._source_chunks.get(source_index, array("q"))
+        order = array("q")
+        changed = False
+        for chunk_id, metadata in chunks:
+            chunk = self._chunk_index(chunk_id)
+            lines = (metadata.get("start_line", 0), metadata.get("end_line", 0))
+            if (self._start_lines[chunk], self._end_lines[chunk]) != lines:
+                self._start_lines[chunk], self._end_lines[chunk] = lines
+                changed = True
+            order.append(chunk)
+        if sorted(order) != sorted(current):
+            raise ValueError(f"Chunks of {source} do not match the indexed ones")
+        if order != current:
+            self._source_chunks[source_index] = order
+            changed = True
+        return changed
+
+    def get_entry_id(self, chunk_id: str) -> int:
+        return self._chunk_entries[self._chunk_index(chunk_id)]
+
+    def get_chunk_metadata(self, chunk_id: str) -> dict:
+        return self._metadata(self._chunk_index(chunk_id))
+
+    def get_chunk(self, chunk_id: str) -> Document:
+        chunk = self._chunk_index(chunk_id)
+        return Document(
+            page_content=self.get_text(self._chunk_entries[chunk]),
+            metadata=self._metadata(chunk),
+        )
+
+    def sources(self) -> List[str]:
+        return [self._sources[source_index] for source_index in self._source_chunks]
+
+    def get_chunk_ids(self, source: Optional[str] = None) -> List[str]:
+        """Ids of the chunks of source in file order, or of all chunks."""
+        if source is None:
+            source_indexes = list(self._source_chunks)
+        elif source in self._source_indexes:
+            source_indexes = [self._source_indexes[source]]
+        else:
+            source_indexes = []
+        return [
+            f"{self.id_prefix}{chunk}"
+            for source_index in source_indexes
+            for chunk in self._source_chunks.get(source_index, [])
+        ]
+
+    def _scope_chunks(self, scope: str) -> List[int]:
+        if scope in self._source_indexes:
+            return list(self._source_chunks.get(self._source_indexes[scope], []))
+        return [
+            chunk
+            for source_index, chunks in self._source_chunks.items()
+            if is_in_scope(self._sources[source_index], scope)
+            for chunk in chunks
+        ]
+
+    def get_scope_entry_ids(self, scope: str) -> List[int]:
+        return list(
+            dict.fromkeys(
+                self._chunk_entries[chunk] for chunk in self._scope_chunks(scope)
+            )
+        )
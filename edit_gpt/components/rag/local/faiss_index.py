@@ -0,0 +1,346 @@
+import logging
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ["flat", "flat_fp16", "hnsw", "ivf_pq"]
+
+# faiss warns below 39 training points per centroid, both for the IVF lists and for
+# the 256 centroids of each 8 bit product quantizer
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+PQ_CENTROIDS = 256
+# HNSW graphs are rebuilt once they hold more deleted vectors than live ones
+MIN_TOMBSTONES_TO_REBUILD = 1000
+
+
+def create_faiss_index(
+    index_type: str,
+    dimension: int,
+    hnsw_m: int = 32,
+    hnsw_ef_search: int = 64,
+    ivf_nlist: int = 1024,
+    ivf_nprobe: int = 16,
+    pq_m: int = 16,
+):
+    """
+    Creates an empty index for langchain's FAISS vectorstore.
+
+    flat searches exhaustively over float32 vectors, flat_fp16 does the same over
+    half the memory. hnsw and ivf_pq are approximate and wrapped in ApproximateIndex.
+    """
+    faiss = dependable_faiss_import()
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "flat_fp16":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    if index_type in ("hnsw", "ivf_pq"):
+        return ApproximateIndex(
+            index_type,
+            dimension,
+            hnsw_m=hnsw_m,
+            hnsw_ef_search=hnsw_ef_search,
+            ivf_nlist=ivf_nlist,
+            ivf_nprobe=ivf_nprobe,
+            pq_m=pq_m,
+        )
+    raise ValueError(f"Unknown index type {index_type}, expected one of {INDEX_TYPES}")
+
+
+def get_index_type(index) -> str:
+    faiss = dependable_faiss_import()
+    if isinstance(index, ApproximateIndex):
+        return index.index_type
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "flat_fp16"
+    return "flat"
+
+
+def _exact_search(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    faiss = dependable_faiss_import()
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index.search(queries, k)[1]
+
+
+def _recall(expected: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(
+        len(set(expected_row[expected_row != -1]) & set(found_row[found_row != -1]))
+        for expected_row, found_row in zip(expected, found)
+    )
+    return hits / max(int((expected != -1).sum()), 1)
+
+
+class ApproximateIndex:
+    """
+    Makes an HNSW or IVF-PQ index look like a flat one to langchain's FAISS wrapper.
+
+    The wrapper numbers vectors by insertion position and expects remove_ids to shift
+    the following vectors down, which only flat indexes do. This keeps the faiss
+    labels of the live vectors in position order and translates between the two:
+    IVF-PQ vectors are removed for real, HNSW (which cannot remove) vectors are
+    masked out of searches and the graph is rebuilt once most of it is deleted.
+
+    IVF-PQ needs training, so vectors are kept in a flat index until there are
+    enough of them (MIN_POINTS_PER_CENTROID per centroid of the IVF lists or of the
+    product quantizer, whichever has more), then the quantizers are trained on a
+    sample and the flat index is replaced. Small corpora therefore stay flat.
+
+    Inverted lists loaded with IO_FLAG_MMAP are read-only, they are copied into
+    memory before the first change, so only indexes that are never written stay
+    mapped.
+    """
+
+    def __init__(
+        self,
+        index_type: str,
+        dimension: int,
+        hnsw_m: int = 32,
+        hnsw_ef_search: int = 64,
+        ivf_nlist: int = 1024,
+        ivf_nprobe: int = 16,
+        pq_m: int = 16,
+    ):
+        faiss = dependable_faiss_import()
+        self.index_type = index_type
+        self.d = dimension
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.pq_m = pq_m
+        # position -> faiss label, always sorted
+        self.labels = np.empty(0, dtype=np.int64)
+        self.next_label = 0
+        self.tombstones = 0
+        self._selector = None
+        self.is_trained = True
+        if index_type == "hnsw":
+            self.index = self._new_hnsw()
+        else:
+            self.index = faiss.IndexFlatL2(dimension)
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.labels)
+
+    @property
+    def staging(self) -> bool:
+        """Whether ivf_pq vectors are still waiting for training in a flat index."""
+        return self.index_type == "ivf_pq" and not isinstance(
+            self.index, dependable_faiss_import().IndexIVF
+        )
+
+    def _new_hnsw(self):
+        faiss = dependable_faiss_import()
+        index = faiss.IndexHNSWFlat(self.d, self.hnsw_m)
+        index.hnsw.efSearch = self.hnsw_ef_search
+        return index
+
+    def add(self, vectors: np.ndarray) -> None:
+        labels = np.arange(
+            self.next_label, self.next_label + len(vectors), dtype=np.int64
+        )
+        if self.index_type == "ivf_pq" and not self.staging:
+            self._load_mapped_lists()
+            self.index.add_with_ids(vectors, labels)
+        else:
+            # flat and HNSW label vectors by insertion order themselves
+            self.index.add(vectors)
+        self.labels = np.concatenate([self.labels, labels])
+        self.next_label += len(vectors)
+        if self.staging and self.ntotal >= MIN_POINTS_PER_CENTROID * self._centroids:
+            self._train()
+
+    @property
+    def _centroids(self) -> int:
+        return max(self.ivf_nlist, PQ_CENTROIDS)
+
+    def _train(self) -> None:
+        faiss = dependable_faiss_import()
+        start = time.perf_counter()
+        # the staging index is flat, so labels are positions
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        sample_size = min(len(vectors), MAX_POINTS_PER_CENTROID * self._centroids)
+        sample = vectors[
+            np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)
+        ]
+        quantizer = faiss.IndexFlatL2(self.d)
+        index = faiss.IndexIVFPQ(quantizer, self.d, self.ivf_nlist, self.pq_m, 8)
+        index.train(sample)
+        # needed by reconstruct (MMR) and remove_ids with arbitrary labels
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.nprobe = self.ivf_nprobe
+        index.add_with_ids(vectors, self.labels)
+        # keep the quantizer alive as long as the index
+        index.quantizer_ref = quantizer
+        self.index = index
+        logger.info(
+            "Trained IVF-PQ index on %s of %s vector(s) in %.1fs",
+            sample_size,
+            len(vectors),
+            time.perf_counter() - start,
+        )
+        stats = self.benchmark(vectors=vectors)
+        logger.info(
+            "IVF-PQ recall@%s %.3f, %.2fms/query (flat %.2fms/query)",
+            stats["k"],
+            stats["recall"],
+            stats["latency_ms"],
+            stats["exact_latency_ms"],
+        )
+
+    def _load_mapped_lists(self) -> None:
+        faiss = dependable_faiss_import()
+        invlists = faiss.downcast_InvertedLists(self.index.invlists)
+        if not isinstance(invlists, faiss.OnDiskInvertedLists):
+            return
+        start = time.perf_counter()
+        in_memory = faiss.ArrayInvertedLists(invlists.nlist, invlists.code_size)
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                in_memory.add_entries(
+                    list_no,
+                    size,
+                    invlists.get_ids(list_no),
+                    invlists.get_codes(list_no),
+                )
+        self.index.replace_invlists(in_memory, True)
+        # owned by the index now
+        in_memory.this.disown()
+        logger.info(
+            "Copied %s memory-mapped vector(s) into memory before a change in %.1fs",
+            self.ntotal,
+            time.perf_counter() - start,
+        )
+
+    def _label_selector(self):
+        if self._selector is None and self.tombstones:
+            faiss = dependable_faiss_import()
+            live = faiss.IDSelectorBatch(self.labels)
+            self._selector = faiss.SearchParametersHNSW(
+                sel=live, efSearch=self.hnsw_ef_search
+            )
+            # SearchParameters doesn't own the selector
+            self._selector.sel_ref = live
+        return self._selector
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index_type == "hnsw":
+            params = self._label_selector()
+            distances, labels = self.index.search(queries, k, params=params)
+        else:
+            distances, labels = self.index.search(queries, k)
+        if not self.ntotal:
+            return distances, np.full_like(labels, -1)
+        positions = np.searchsorted(self.labels, labels).clip(max=self.ntotal - 1)
+        found = (labels != -1) & (self.labels[positions] == labels)
+        return distances, np.where(found, positions, -1)
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        return self.index.reconstruct(int(self.labels[position]))
+
+    def remove_ids(self, positions: np.ndarray) -> int:
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.index_type == "ivf_pq":
+            if not self.staging:
+                self._load_mapped_lists()
+            self.index.remove_ids(self.labels[positions])
+        else:
+            self.tombstones += len(positions)
+            self._selector = None
+        self.labels = np.delete(self.labels, positions)
+        if self.staging:
+            # the flat staging index shifts the following vectors down
+            self.labels = np.arange(self.ntotal, dtype=np.int64)
+            self.next_label = self.ntotal
+        elif self.tombstones > max(self.ntotal, MIN_TOMBSTONES_TO_REBUILD):
+            self._rebuild_hnsw()
+        return len(positions)
+
+    def _rebuild_hnsw(self) -> None:
+        start = time.perf_counter()
+        vectors = self.index.reconstruct_batch(self.labels)
+        self.index = self._new_hnsw()
+        self.index.add(vectors)
+        logger.info(
+            "Rebuilt HNSW graph without %s deleted vector(s) in %.1fs",
+            self.tombstones,
+            time.perf_counter() - start,
+        )
+        self.labels = np.arange(len(vectors), dtype=np.int64)
+        self.next_label = len(vectors)
+        self.tombstones = 0
+        self._selector = None
+
+    def benchmark(
+        self, n_queries: int = 100, k: int = 10, vectors: Optional[np.ndarray] = None
+    ) -> dict:
+        """
+        Measures recall@k of the index against an exact search and the latency of
+        both, using stored vectors as queries.
+
+        Without the original vectors the ground truth is computed over the vectors
+        reconstructed from the index, which for ivf_pq leaves out the error of the
+        product quantization itself.
+        """
+        if vectors is None:
+            vectors = self.index.reconstruct_batch(self.labels)
+        if not len(vectors):
+            return {"k": k, "recall": 1.0, "latency_ms": 0.0, "exact_latency_ms": 0.0}
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)))]
+
+        start = time.perf_counter()
+        expected = _exact_search(vectors, queries, k)
+        exact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        _, found = self.search(queries, k)
+        seconds = time.perf_counter() - start
+        return {
+            "k": k,
+            "recall": _recall(expected, found),
+            "latency_ms": seconds * 1000 / len(queries),
+            "exact_latency_ms": exact_seconds * 1000 / len(queries),
+        }
+
+    def get_state(self) -> dict:
+        """Everything but the faiss index itself, which is saved with write_index."""
+        return {
+            "index_type": self.index_type,
+            "d": self.d,
+            "hnsw_m": self.hnsw_m,
+            "hnsw_ef_search": self.hnsw_ef_search,
+            "ivf_nlist": self.ivf_nlist,
+            "ivf_nprobe": self.ivf_nprobe,
+            "pq_m": self.pq_m,
+            "labels": self.labels,
+            "next_label": self.next_label,
+            "tombstones": self.tombstones,
+        }
+
+    @classmethod
+    def from_state(cls, index, state: dict) -> "ApproximateIndex":
+        approximate_index = cls(
+            state["index_type"],
+            state["d"],
+            hnsw_m=state["hnsw_m"],
+            hnsw_ef_search=state["hnsw_ef_search"],
+            ivf_nlist=state["ivf_nlist"],
+            ivf_nprobe=state["ivf_nprobe"],
+            pq_m=state["pq_m"],
+        )
+        if state["index_type"] == "hnsw":
+            index.hnsw.efSearch = state["hnsw_ef_search"]
+        elif isinstance(index, dependable_faiss_import().IndexIVF):
+            index.nprobe = state["ivf_nprobe"]
+        approximate_index.index = index
+        approximate_index.labels = state["labels"]
+        approximate_index.next_label = state["next_label"]
+        approximate_index.tombstones = state["tombstones"]
+        return approximate_index
@@ -0,0 +1,110 @@
+import os
+import pickle
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.embeddings import Embeddings
+
+from edit_gpt.components.rag.local.chunk_store import ChunkStore
+from edit_gpt.components.rag.local.faiss_index import ApproximateIndex
+
+INDEX_FILENAME = "index-{}.faiss"
+DOCSTORE_FILENAME = "index-{}.pkl"
+# the generation of the index and docstore files to load, replaced last
+CURRENT_FILENAME = "CURRENT"
+
+
+class FaissSnapshot(NamedTuple):
+    index: np.ndarray
+    docstore: bytes
+
+
+def _current_generation(path: Path) -> Optional[int]:
+    try:
+        return int((path / CURRENT_FILENAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def faiss_index_exists(directory: str) -> bool:
+    path = Path(directory)
+    generation = _current_generation(path)
+    return (
+        generation is not None
+        and (path / INDEX_FILENAME.format(generation)).is_file()
+        and (path / DOCSTORE_FILENAME.format(generation)).is_file()
+    )
+
+
+def snapshot_faiss(db: FAISS, directory: str) -> FaissSnapshot:
+    """
+    Serializes the vector index and the docstore (chunks with their metadata) in
+    memory, the part of saving that needs db not to change meanwhile. The texts of
+    a ChunkStore are written to its blob file in directory.
+    """
+    faiss = dependable_faiss_import()
+    index, index_state = db.index, None
+    if isinstance(index, ApproximateIndex):
+        index, index_state = index.index, index.get_state()
+    if isinstance(db.docstore, ChunkStore):
+        db.docstore.save(directory)
+    return FaissSnapshot(
+        faiss.serialize_index(index),
+        pickle.dumps((db.docstore, db.index_to_docstore_id, index_state)),
+    )
+
+
+def write_faiss_snapshot(snapshot: FaissSnapshot, directory: str) -> None:
+    """
+    Writes the files of a new generation and then points CURRENT to it, so that a
+    crash at any point leaves a matching index and docstore and other processes
+    loading the same directory never see half-written files.
+    """
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    previous = _current_generation(path)
+    generation = (previous or 0) + 1
+    with (path / INDEX_FILENAME.format(generation)).open("wb") as f:
+        f.write(snapshot.index.tobytes())
+    (path / DOCSTORE_FILENAME.format(generation)).write_bytes(snapshot.docstore)
+
+    tmp_current_path = path / (CURRENT_FILENAME + f".{os.getpid()}.tmp")
+    tmp_current_path.write_text(str(generation))
+    os.replace(tmp_current_path, path / CURRENT_FILENAME)
+    if previous is not None:
+        (path / INDEX_FILENAME.format(previous)).unlink(missing_ok=True)
+        (path / DOCSTORE_FILENAME.format(previous)).unlink(missing_ok=True)
+
+
+def save_faiss(db: FAISS, directory: str) -> None:
+    """Saves db to directory, see snapshot_faiss and write_faiss_snapshot."""
+    write_faiss_snapshot(snapshot_faiss(db, directory), directory)
+    if isinstance(db.docstore, ChunkStore):
+        db.docstore.remove_stale_blobs()
+
+
+def load_faiss(directory: str, embeddings: Embeddings, mmap: bool = False) -> FAISS:
+    """
+    Loads an index saved by save_faiss. The directory is expected to be written only
+    by this application, which is what makes unpickling the docstore safe.
+
+    With mmap=True the index is opened with IO_FLAG_MMAP, so index types that keep
+    their vectors in inverted lists (IVF) are served from the page cache and shared
+    between processes instead of being copied into each of them. Mapped lists are
+    read-only, ApproximateIndex copies them into memory before the first change.
+    """
+    faiss = dependable_faiss_import()
+    path = Path(directory)
+    generation = _current_generation(path)
+    io_flags = faiss.IO_FLAG_MMAP if mmap else 0
+    index = faiss.read_index(str(path / INDEX_FILENAME.format(generation)), io_flags)
+    with (path / DOCSTORE_FILENAME.format(generation)).open("rb") as f:
+        docstore, index_to_docstore_id, index_state = pickle.load(f)
+    # flat indexes have no state
+    if index_state is not None:
+        index = ApproximateIndex.from_state(index, index_state)
+    if isinstance(docstore, ChunkStore):
+        docstore.open(directory)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
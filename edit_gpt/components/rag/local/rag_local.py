@@ -1,22 +1,69 @@
-import re
-import uuid
-from operator import attrgetter
-from typing import List, Optional
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, Union
 
+import numpy as np
 from langchain_community.vectorstores.faiss import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel
 from langchain_core.vectorstores import VectorStore
 
 from edit_gpt.components.rag.base_rag import BaseRAGManager
-from edit_gpt.components.rag.local.rag_prompts import FILTER_PROMPT
-from edit_gpt.utils.loaders import load_docs_from_paths
-from edit_gpt.utils.utils import format_docs_with_index
+from edit_gpt.components.rag.lexical_index import LexicalIndex
+from edit_gpt.components.rag.local.chunk_store import ChunkStore, content_digest
+from edit_gpt.components.rag.local.faiss_index import (
+    create_faiss_index,
+    get_index_type,
+)
+from edit_gpt.components.rag.local.faiss_storage import (
+    faiss_index_exists,
+    load_faiss,
+    snapshot_faiss,
+    write_faiss_snapshot,
+)
+from edit_gpt.components.rag.rerankers import BaseReranker
+from edit_gpt.components.rag.retrieval_cache import RetrievalCache, normalize_question
+from edit_gpt.components.rag.retrieval_context import RetrievalContext, embed_query
+from edit_gpt.utils.file_filter import FileFilter
+from edit_gpt.utils.loaders import iter_docs_from_paths
 
+logger = logging.getLogger(__name__)
 
-def extract_numbers(s):
-    return [int(num) for num in re.findall(r"\d+", s)]
+# scopes with up to this many chunks are searched exactly over their own vectors,
+# larger ones by filtering the results of an index search
+EXACT_SCOPE_SEARCH_LIMIT = 5000
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[str]:
+    fused_scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused_scores[doc_id] = fused_scores.get(doc_id, 0.0) + 1 / (rrf_k + rank)
+    return sorted(fused_scores, key=fused_scores.get, reverse=True)
+
+
+def select_vector_docs(
+    embedding: List[float],
+    results: List[Tuple[Document, float, np.ndarray]],
+    k: int,
+    mmr: bool = False,
+    lambda_mult: float = 0.5,
+) -> List[Document]:
+    """Picks k of the (doc, distance, vector) results by distance or with MMR."""
+    results = sorted(results, key=lambda result: result[1])
+    if mmr and results:
+        selected = maximal_marginal_relevance(
+            np.array(embedding, dtype=np.float32),
+            [vector for _, _, vector in results],
+            k=k,
+            lambda_mult=lambda_mult,
+        )
+        return [results[i][0] for i in selected]
+    return [doc for doc, _, _ in results[:k]]
 
 
 class LocalRAGManager(BaseRAGManager):
@@ -30,53 +77,307 @@ class LocalRAGManager(BaseRAGManager):
         search_kwargs: Optional[dict] = None,
         vectorstore: VectorStore = FAISS,
         chat_model: Optional[BaseChatModel] = None,
+        persist_directory: Optional[str] = None,
+        mmap_index: bool = False,
+        loader_workers: int = 8,
+        batch_size: int = 256,
+        file_filter: Optional[FileFilter] = None,
+        splitters: Optional[Dict[str, str]] = None,
+        chunk_max_tokens: int = 400,
+        retrieval_mode: Literal["vector", "lexical", "hybrid"] = "vector",
+        rrf_k: int = 60,
+        reranker: Optional[BaseReranker] = None,
+        result_cache_size: int = 256,
+        index_type: str = "flat",
+        index_params: Optional[dict] = None,
+        id_prefix: str = "",
     ):
         self.paths_to_rag = paths_to_rag
+        self.persist_directory = persist_directory
+        self.mmap_index = mmap_index
+        self.loader_workers = loader_workers
+        self.batch_size = batch_size
+        self.file_filter = file_filter
+        # see create_faiss_index
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        # prepended to chunk ids, keeps the ids of shards apart
+        self.id_prefix = id_prefix
+        self._embedding_seconds = 0.0
+        self._embedded_chunks = 0
+        # guards the FAISS index and the lookup tables, which the file watcher
+        # updates from a background thread while requests are being served
+        self._lock = threading.RLock()
+        # orders the writes of concurrent saves, which happen outside _lock
+        self._persist_lock = threading.Lock()
+        # saves requested inside defer_persist wait until it exits
+        self._defer_lock = threading.Lock()
+        self._defer_depth = 0
+        self._persist_pending = False
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        self.lexical_index = LexicalIndex() if retrieval_mode != "vector" else None
         self.vectorstore = vectorstore
         self.chat_model = chat_model
-        self.docs_indexes = set()
+        # filters retrieved docs in get_filtered_docs, None returns them as is
+        self.reranker = reranker
+        self.retrieval_cache = RetrievalCache(result_cache_size)
+        # bumped whenever chunks are added or deleted, invalidates retrieval_cache
+        self.index_version = 0
+        # FAISS entry id -> position in the FAISS index, rebuilt lazily when
+        # index_version changes
+        self._id_to_position: Dict[int, int] = {}
+        self._positions_version = -1
         super().__init__(
-            embeddings, chunk_size, chunk_overlap, search_type, search_kwargs
+            embeddings,
+            chunk_size,
+            chunk_overlap,
+            search_type,
+            search_kwargs,
+            splitters,
+            chunk_max_tokens,
         )
 
-    def get_filtered_docs(self, question, **kwargs):
-        filter_chain = (
-            FILTER_PROMPT | self.chat_model | attrgetter("content") | extract_numbers
+    def get_filtered_docs(
+        self,
+        question,
+        scope: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ):
+        """
+        Retrieves and reranks chunks for question. With scope (a file or directory
+        path) only chunks of the files under it are searched. The question is
+        embedded through retrieval_context, if given, to be shared with the other
+        searches of the request.
+        """
+        cache_key = (
+            normalize_question(question),
+            scope,
+            repr(sorted(kwargs.items())),
+            self.index_version,
+        )
+        cached_docs = self.retrieval_cache.get(cache_key)
+        if cached_docs is not None:
+            return cached_docs
+
+        # the question itself without kwargs, the same text the reranker embeds
+        rag_retriever_input = "\n".join([question, *kwargs])
+        if retrieval_context is None:
+            retrieval_context = RetrievalContext(self.embeddings)
+        docs = self.retrieve(rag_retriever_input, scope, retrieval_context)
+        if self.reranker is not None:
+            docs = self.reranker.rerank(
+                question, docs, retrieval_context=retrieval_context, **kwargs
+            )
+        self.retrieval_cache.put(cache_key, docs)
+        return docs
+
+    def retrieve(
+        self,
+        query: str,
+        scope: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+    ) -> List[Document]:
+        """
+        Retrieves chunks for the query with the configured retrieval_mode: FAISS
+        (vector), BM25 over the lexical index (lexical), or both fused with
+        reciprocal rank fusion (hybrid). See get_filtered_docs for scope and
+        retrieval_context.
+        """
+        # embedded before taking the lock, ingest is not blocked meanwhile
+        embedding = (
+            embed_query(self.embeddings, query, retrieval_context)
+            if self.retrieval_mode != "lexical"
+            else None
+        )
+        with self._lock:
+            if scope is not None:
+                return self._retrieve_scoped(query, embedding, scope)
+            return self._retrieve(query, embedding)
+
+    def _retrieve_scoped(
+        self, query: str, embedding: Optional[List[float]], scope: str
+    ) -> List[Document]:
+        k = self.search_kwargs.get("k", 4)
+        mmr = self.search_type == "mmr"
+        vector_docs = []
+        if embedding is not None:
+            vector_docs = select_vector_docs(
+                embedding,
+                self.search_by_vector(
+                    embedding,
+                    self.search_kwargs.get("fetch_k", 20) if mmr else k,
+                    scope,
+                ),
+                k,
+                mmr,
+                self.search_kwargs.get("lambda_mult", 0.5),
+            )
+        if self.retrieval_mode == "vector":
+            return vector_docs
+
+        lexical_docs = [doc for doc, _ in self.search_lexical(query, k, scope)]
+        if self.retrieval_mode == "lexical":
+            return lexical_docs
+        docs_by_id = {doc.metadata["id"]: doc for doc in vector_docs + lexical_docs}
+        fused_ids = reciprocal_rank_fusion(
+            [
+                [doc.metadata["id"] for doc in vector_docs],
+                [doc.metadata["id"] for doc in lexical_docs],
+            ],
+            self.rrf_k,
         )
-        rag_retriever_input = question
-        rag_retriever_input += "\n"
-        rag_retriever_input += "\n".join([*kwargs])
-        docs = self.rag_retriever.invoke(rag_retriever_input)
-
-        filtered_docs_indexes = filter_chain.invoke(
-            {
-                "question": question,
-                "rag_context": format_docs_with_index(docs),
-                **kwargs,
+        return [docs_by_id[doc_id] for doc_id in fused_ids[:k]]
+
+    def _search_vector(self, query: str, embedding: List[float]) -> List[Document]:
+        """What rag_retriever returns for query, searched with its embedding."""
+        db = self.rag_database
+        if self.search_type == "mmr":
+            return db.max_marginal_relevance_search_by_vector(
+                embedding, **self.search_kwargs
+            )
+        if self.search_type == "similarity":
+            return db.similarity_search_by_vector(embedding, **self.search_kwargs)
+        # similarity_score_threshold
+        return self.rag_retriever.invoke(query)
+
+    def _retrieve(self, query: str, embedding: Optional[List[float]]) -> List[Document]:
+        if self.retrieval_mode == "vector":
+            return [
+                self.chunk_store.get_document(doc.metadata["id"])
+                for doc in self._search_vector(query, embedding)
+            ]
+
+        k = self.search_kwargs.get("k", 4)
+        lexical_ids = [doc_id for doc_id, _ in self.lexical_index.search(query, k)]
+        if self.retrieval_mode == "lexical":
+            fused_ids = lexical_ids
+        else:
+            vector_ids = [
+                doc.metadata["id"] for doc in self._search_vector(query, embedding)
+            ]
+            fused_ids = reciprocal_rank_fusion([vector_ids, lexical_ids], self.rrf_k)
+        return [self.chunk_store.get_document(doc_id) for doc_id in fused_ids[:k]]
+
+    def _get_positions(self) -> Dict[int, int]:
+        if self._positions_version != self.index_version:
+            self._id_to_position = {
+                doc_id: position
+                for position, doc_id in self.rag_database.index_to_docstore_id.items()
             }
+            self._positions_version = self.index_version
+        return self._id_to_position
+
+    def _search_scope_by_vector(
+        self, embedding: List[float], k: int, scope: str
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        db = self.rag_database
+        store = self.chunk_store
+        ids = store.get_scope_entry_ids(scope)
+        if not ids:
+            return []
+        positions = self._get_positions()
+        if len(ids) > EXACT_SCOPE_SEARCH_LIMIT:
+            # fetch enough neighbours for about k of them to fall into the scope
+            fetch_k = min(db.index.ntotal, 2 * k * -(-db.index.ntotal // len(ids)))
+            return [
+                (
+                    store.get_document(doc.metadata["id"], scope),
+                    float(distance),
+                    db.index.reconstruct(positions[doc.metadata["id"]]),
+                )
+                for doc, distance in db.similarity_search_with_score_by_vector(
+                    embedding,
+                    k,
+                    filter=lambda metadata: store.entry_in_scope(metadata["id"], scope),
+                    fetch_k=fetch_k,
+                )
+            ]
+        vectors = np.array(
+            [db.index.reconstruct(positions[doc_id]) for doc_id in ids],
+            dtype=np.float32,
         )
-        try:
-            return [docs[i - 1] for i in filtered_docs_indexes]
-        except IndexError:
-            return docs
+        distances = ((vectors - np.array(embedding, dtype=np.float32)) ** 2).sum(axis=1)
+        return [
+            (
+                store.get_document(ids[i], scope),
+                float(distances[i]),
+                vectors[i],
+            )
+            for i in np.argsort(distances)[:k]
+        ]
+
+    def search_by_vector(
+        self, embedding: List[float], k: int, scope: Optional[str] = None
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        The k chunks nearest to embedding with their L2 distance and stored vector,
+        so results of several indexes can be merged (and MMR applied to them).
+        With scope only chunks of the files under it are considered.
+        """
+        with self._lock:
+            if scope is not None:
+                return self._search_scope_by_vector(embedding, k, scope)
+            db = self.rag_database
+            distances, positions = db.index.search(
+                np.array([embedding], dtype=np.float32), k
+            )
+            return [
+                (
+                    self.chunk_store.get_document(db.index_to_docstore_id[position]),
+                    float(distance),
+                    db.index.reconstruct(int(position)),
+                )
+                for distance, position in zip(distances[0], positions[0])
+                if position != -1
+            ]
+
+    def search_lexical(
+        self, query: str, k: int, scope: Optional[str] = None
+    ) -> List[Tuple[Document, float]]:
+        """The k best BM25 matches for query with their scores."""
+        with self._lock:
+            store = self.chunk_store
+            doc_ids = (
+                set(store.get_scope_entry_ids(scope)) if scope is not None else None
+            )
+            return [
+                (store.get_document(doc_id, scope), score)
+                for doc_id, score in self.lexical_index.search(query, k, doc_ids)
+            ]
 
     def init_database(self):
-        if self.paths_to_rag is not None:
-            rag_docs = load_docs_from_paths(self.paths_to_rag)
-            rag_docs = self.text_splitter.split_documents(rag_docs)
-            ids = [str(uuid.uuid4()) for _ in rag_docs]
-            for i, doc in enumerate(rag_docs):
-                doc.metadata["id"] = ids[i]
-            self.docs_indexes.update(ids)
-            return self.vectorstore.from_documents(rag_docs, self.embeddings, ids=ids)
-        else:
-            # trick to init empty db
-            fake_id = str(uuid.uuid4())
-            db = self.vectorstore.from_documents(
-                [Document(page_content="")], self.embeddings, ids=[fake_id]
+        if self.persist_directory and faiss_index_exists(self.persist_directory):
+            db = load_faiss(self.persist_directory, self.embeddings, self.mmap_index)
+            self.rag_database = db
+            if self.lexical_index is not None:
+                for entry_id in db.docstore.entry_ids():
+                    self.lexical_index.add(entry_id, db.docstore.get_text(entry_id))
+            logger.info(
+                "Loaded %s chunk(s) from %s",
+                len(db.docstore),
+                self.persist_directory,
             )
-            db.delete([fake_id])
+            if get_index_type(db.index) != self.index_type:
+                logger.warning(
+                    "The index in %s is %s, not %s. Delete it to rebuild the index",
+                    self.persist_directory,
+                    get_index_type(db.index),
+                    self.index_type,
+                )
             return db
+        dimension = len(self.embeddings.embed_query(""))
+        db = self.vectorstore(
+            self.embeddings,
+            create_faiss_index(self.index_type, dimension, **self.index_params),
+            ChunkStore(self.persist_directory, self.id_prefix),
+            {},
+        )
+        if self.paths_to_rag is not None:
+            self.rag_database = db
+            self.add_texts_from_paths(self.paths_to_rag)
+        return db
 
     def get_retriever(self):
         return self.rag_database.as_retriever(
@@ -84,21 +385,247 @@ class LocalRAGManager(BaseRAGManager):
             search_kwargs=self.search_kwargs,
         )
 
-    def get_all_docs(self):
-        db_length = len(self.docs_indexes)
-        if db_length == 0:
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self.rag_database.docstore
+
+    @contextmanager
+    def defer_persist(self) -> Iterator[None]:
+        """Changes made inside are saved once at the end instead of one by one."""
+        with self._defer_lock:
+            self._defer_depth += 1
+        try:
+            yield
+        finally:
+            with self._defer_lock:
+                self._defer_depth -= 1
+                persist = not self._defer_depth and self._persist_pending
+                if persist:
+                    self._persist_pending = False
+            if persist:
+                self._persist()
+
+    def _persist(self) -> None:
+        if not self.persist_directory:
+            return
+        with self._defer_lock:
+            if self._defer_depth:
+                self._persist_pending = True
+                return
+        with self._persist_lock:
+            # retrieval is only blocked while the index is copied, not written
+            with self._lock:
+                snapshot = snapshot_faiss(self.rag_database, self.persist_directory)
+            write_faiss_snapshot(snapshot, self.persist_directory)
+            with self._lock:
+                self.chunk_store.remove_stale_blobs()
+
+    def _unindex_doc(self, doc_id: str) -> Optional[int]:
+        """
+        Removes the chunk and returns the id of its FAISS entry if it was the last
+        chunk with that text, so the entry can be deleted.
+        """
+        self.index_version += 1
+        entry_id = self.chunk_store.remove_chunk(doc_id)
+        if entry_id is not None and self.lexical_index is not None:
+            self.lexical_index.remove(entry_id, self.chunk_store.get_text(entry_id))
+        return entry_id
+
+    @property
+    def docs_indexes(self) -> List[str]:
+        return self.chunk_store.get_chunk_ids()
+
+    def get_metadata(self, doc_id: str) -> dict:
+        return self.chunk_store.get_chunk_metadata(doc_id)
+
+    def get_ids_by_source(self, source: str) -> List[str]:
+        with self._lock:
+            return self.chunk_store.get_chunk_ids(source)
+
+    def get_docs_by_source(self, source: str) -> List[Document]:
+        with self._lock:
+            return [
+                self.chunk_store.get_chunk(doc_id)
+                for doc_id in self.chunk_store.get_chunk_ids(source)
+            ]
+
+    def list_sources(self) -> List[str]:
+        with self._lock:
+            return self.chunk_store.sources()
+
+    def get_all_docs(self) -> List[Document]:
+        with self._lock:
+            return [
+                self.chunk_store.get_chunk(doc_id)
+                for doc_id in self.chunk_store.get_chunk_ids()
+            ]
+
+    def _add_docs(self, docs: List[Document]) -> List[str]:
+        if not docs:
             return []
-        return self.rag_database.search("", "similarity", k=db_length)
+        store = self.chunk_store
+        digests = [content_digest(doc.page_content) for doc in docs]
+        # identical chunks are embedded and stored once
+        new_texts: Dict[bytes, str] = {}
+        for doc, digest in zip(docs, digests):
+            if store.find_entry(digest) is None:
+                new_texts.setdefault(digest, doc.page_content)
+        start = time.perf_counter()
+        # embed outside the lock so retrieval is only blocked by the index update
+        vectors = (
+            self.embeddings.embed_documents(list(new_texts.values()))
+            if new_texts
+            else []
+        )
+        self._embedding_seconds += time.perf_counter() - start
+        self._embedded_chunks += len(new_texts)
+
+        with self._lock:
+            self.index_version += 1
+            new_entries = [
+                (text, vector)
+                for (digest, text), vector in zip(new_texts.items(), vectors)
+                if store.find_entry(digest) is None
+            ]
+            if new_entries:
+                entry_ids = list(
+                    range(store.next_entry_id, store.next_entry_id + len(new_entries))
+                )
+                self.rag_database.add_embeddings(new_entries, ids=entry_ids)
+                if self.lexical_index is not None:
+                    for entry_id, (text, _) in zip(entry_ids, new_entries):
+                        self.lexical_index.add(entry_id, text)
+            return [
+                store.add_chunk(store.find_entry(digest), doc.metadata)
+                for doc, digest in zip(docs, digests)
+            ]
+
+    def _log_throughput(self, chunks_count: int) -> None:
+        if self._embedded_chunks and self._embedding_seconds:
+            logger.info(
+                "Embedded %s unique of %s chunk(s) in %.1fs (%.1f chunks/s)",
+                self._embedded_chunks,
+                chunks_count,
+                self._embedding_seconds,
+                self._embedded_chunks / self._embedding_seconds,
+            )
+        self._embedding_seconds = 0.0
+        self._embedded_chunks = 0
+
+    def _delete_ids(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            entry_ids = [self._unindex_doc(doc_id) for doc_id in ids]
+            entry_ids = [entry_id for entry_id in entry_ids if entry_id is not None]
+            if entry_ids:
+                self.rag_database.delete(entry_ids)
+
+    def _iter_chunk_batches(self, paths) -> Iterator[List[Document]]:
+        batch = []
+        for _, docs in iter_docs_from_paths(
+            paths, self.loader_workers, file_filter=self.file_filter
+        ):
+            batch.extend(self.text_splitter.split_documents(docs))
+            while len(batch) >= self.batch_size:
+                yield batch[: self.batch_size]
+                batch = batch[self.batch_size :]
+        if batch:
+            yield batch
 
     def add_texts_from_paths(self, paths):
-        docs = load_docs_from_paths(paths)
-        docs = self.text_splitter.split_documents(docs)
-        ids = [str(uuid.uuid4()) for _ in docs]
-        for i, doc in enumerate(docs):
-            doc.metadata["id"] = ids[i]
-        self.rag_database.add_documents(docs, ids=ids)
-        self.docs_indexes.update(ids)
+        ids = []
+        for batch in self._iter_chunk_batches(paths):
+            ids += self._add_docs(batch)
+        self._log_throughput(len(ids))
+        if ids:
+            self._persist()
+        return ids
+
+    def update_texts_from_paths(self, paths) -> Tuple[List[str], List[str]]:
+        """
+        Re-indexes files under paths by diffing their chunks against the indexed ones.
+
+        Chunks whose content hash is already indexed for the same file are kept (with
+        their lines updated), only new chunks are embedded and only chunks that no
+        longer occur are deleted. The chunks of a file are left in file order.
+        Files that are not indexed yet are simply added.
+
+        Returns:
+            Tuple[List[str], List[str]]: ids of the added and of the deleted chunks.
+        """
+        added_ids = []
+        ids_to_delete = []
+        docs_to_add = []
+        # source -> (kept chunk id or index in added_ids, metadata) in file order
+        layouts: Dict[str, List[Tuple[Union[str, int], dict]]] = {}
+        files_count = 0
+        chunks_count = 0
+        for source, file_docs in iter_docs_from_paths(
+            paths, self.loader_workers, file_filter=self.file_filter
+        ):
+            files_count += 1
+            store = self.chunk_store
+            old_ids_by_hash: Dict[bytes, List[str]] = {}
+            for doc_id in store.get_chunk_ids(source):
+                old_ids_by_hash.setdefault(
+                    store.get_digest(store.get_entry_id(doc_id)), []
+                ).append(doc_id)
+            layout = layouts[source] = []
+            for doc in self.text_splitter.split_documents(file_docs):
+                chunks_count += 1
+                old_ids = old_ids_by_hash.get(content_digest(doc.page_content))
+                if old_ids:
+                    layout.append((old_ids.pop(0), doc.metadata))
+                else:
+                    layout.append((len(added_ids) + len(docs_to_add), doc.metadata))
+                    docs_to_add.append(doc)
+            for old_ids in old_ids_by_hash.values():
+                ids_to_delete.extend(old_ids)
+            if len(docs_to_add) >= self.batch_size:
+                added_ids += self._add_docs(docs_to_add)
+                docs_to_add = []
+        added_ids += self._add_docs(docs_to_add)
+        self._delete_ids(ids_to_delete)
+        self._log_throughput(len(added_ids))
+
+        relaid = False
+        with self._lock:
+            for source, layout in layouts.items():
+                relaid |= self.chunk_store.set_source_chunks(
+                    source,
+                    [
+                        (added_ids[i] if isinstance(i, int) else i, metadata)
+                        for i, metadata in layout
+                    ],
+                )
+            if relaid:
+                # cached results carry the old lines
+                self.index_version += 1
+
+        if added_ids or ids_to_delete or relaid:
+            self._persist()
+        logger.debug(
+            "Re-indexed %s file(s): %s chunk(s) added, %s deleted, %s kept",
+            files_count,
+            len(added_ids),
+            len(ids_to_delete),
+            chunks_count - len(added_ids),
+        )
+        return added_ids, ids_to_delete
 
     def delete(self, doc_id: str) -> None:
-        self.rag_database.delete([doc_id])
-        self.docs_indexes.remove(doc_id)
+        self._delete_ids([doc_id])
+        self._persist()
+
+    def delete_source(self, source: str) -> int:
+        return self.delete_sources([source])
+
+    def delete_sources(self, sources: List[str]) -> int:
+        ids = [
+            doc_id for source in sources for doc_id in self.get_ids_by_source(source)
+        ]
+        if ids:
+            self._delete_ids(ids)
+            self._persist()
+        return len(ids)
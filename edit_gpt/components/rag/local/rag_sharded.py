@@ -0,0 +1,314 @@
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+
+from edit_gpt.components.rag.base_rag import BaseRAGManager
+from edit_gpt.components.rag.local.rag_local import (
+    LocalRAGManager,
+    reciprocal_rank_fusion,
+    select_vector_docs,
+)
+from edit_gpt.components.rag.rerankers import BaseReranker
+from edit_gpt.components.rag.retrieval_cache import RetrievalCache, normalize_question
+from edit_gpt.components.rag.retrieval_context import RetrievalContext, embed_query
+from edit_gpt.utils.loaders import (
+    iter_filenames_from_paths,
+    normalize_to_straight_slash,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIRECTORY_PREFIX = "shard-"
+
+
+class ShardedRAGManager(BaseRAGManager):
+    """
+    Splits the chunks into several LocalRAGManager shards, each with its own FAISS
+    index (and lexical index), searches them in parallel and merges the results.
+
+    Files are assigned to shards by the hash of their top-level directory under
+    partition_roots (partition="directory", related files stay together, defaults
+    to paths_to_rag) or of their path (partition="hash", even shards). A file stays
+    in its shard until deleted. Shards are searched in threads, FAISS releases the
+    GIL while searching.
+
+    Vector results are merged by distance. Lexical results are merged by BM25 score,
+    which is computed with the term statistics of each shard.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        shards_count: int = 4,
+        partition: Literal["directory", "hash"] = "directory",
+        paths_to_rag: Optional[List[str]] = None,
+        partition_roots: Optional[List[str]] = None,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 0,
+        persist_directory: Optional[str] = None,
+        search_type: str = "mmr",
+        search_kwargs: Optional[dict] = None,
+        retrieval_mode: Literal["vector", "lexical", "hybrid"] = "vector",
+        rrf_k: int = 60,
+        reranker: Optional[BaseReranker] = None,
+        result_cache_size: int = 256,
+        **shard_kwargs,
+    ):
+        """shard_kwargs are passed to every LocalRAGManager shard."""
+        self.shards_count = shards_count
+        self.partition = partition
+        self.paths_to_rag = paths_to_rag
+        self.partition_roots = (
+            partition_roots if partition_roots is not None else paths_to_rag
+        )
+        self.persist_directory = persist_directory
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+        self.retrieval_cache = RetrievalCache(result_cache_size)
+        self.file_filter = shard_kwargs.get("file_filter")
+        self._shard_kwargs = shard_kwargs
+        self._executor = ThreadPoolExecutor(
+            max_workers=shards_count, thread_name_prefix="rag-shard"
+        )
+        # source path -> index of the shard holding its chunks
+        self._source_to_shard: Dict[str, int] = {}
+        super().__init__(
+            embeddings,
+            chunk_size,
+            chunk_overlap,
+            search_type,
+            search_kwargs,
+            shard_kwargs.get("splitters"),
+            shard_kwargs.get("chunk_max_tokens", 400),
+        )
+
+    def init_database(self) -> List[LocalRAGManager]:
+        self.shards = [
+            LocalRAGManager(
+                self.embeddings,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                search_type=self.search_type,
+                search_kwargs=self.search_kwargs,
+                persist_directory=(
+                    os.path.join(self.persist_directory, f"{SHARD_DIRECTORY_PREFIX}{i}")
+                    if self.persist_directory
+                    else None
+                ),
+                retrieval_mode=self.retrieval_mode,
+                rrf_k=self.rrf_k,
+                # results are cached and reranked after merging
+                result_cache_size=0,
+                id_prefix=f"{i}:",
+                **self._shard_kwargs,
+            )
+            for i in range(self.shards_count)
+        ]
+        for shard_index, shard in enumerate(self.shards):
+            for source in shard.list_sources():
+                self._source_to_shard[source] = shard_index
+        if self.paths_to_rag is not None:
+            self.add_texts_from_paths(self.paths_to_rag)
+        return self.shards
+
+    def get_retriever(self):
+        return RunnableLambda(self.retrieve)
+
+    @property
+    def index_version(self) -> int:
+        return sum(shard.index_version for shard in self.shards)
+
+    @contextmanager
+    def defer_persist(self) -> Iterator[None]:
+        """Changes made inside are saved once per shard at the end."""
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.defer_persist())
+            yield
+
+    def _partition_key(self, source: str) -> str:
+        if self.partition == "hash":
+            return source
+        for root in self.partition_roots or []:
+            root = normalize_to_straight_slash(root)
+            if root == "." and not os.path.isabs(source):
+                # sources under the working directory are normalized without "./"
+                return source.split("/")[0]
+            root = root.rstrip("/") + "/"
+            if source.startswith(root):
+                return root + source[len(root) :].split("/")[0]
+        return os.path.dirname(source)
+
+    def _get_shard_index(self, source: str) -> int:
+        shard_index = self._source_to_shard.get(source)
+        if shard_index is None:
+            key = self._partition_key(source).encode("utf-8")
+            shard_index = zlib.crc32(key) % self.shards_count
+        return shard_index
+
+    def _get_shard(self, source: str) -> LocalRAGManager:
+        return self.shards[self._get_shard_index(source)]
+
+    def _group_by_shard(self, sources: List[str]) -> Dict[int, List[str]]:
+        groups: Dict[int, List[str]] = {}
+        for source in sources:
+            groups.setdefault(self._get_shard_index(source), []).append(source)
+        return groups
+
+    def get_filtered_docs(
+        self,
+        question,
+        scope: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ):
+        cache_key = (
+            normalize_question(question),
+            scope,
+            repr(sorted(kwargs.items())),
+            self.index_version,
+        )
+        cached_docs = self.retrieval_cache.get(cache_key)
+        if cached_docs is not None:
+            return cached_docs
+
+        rag_retriever_input = "\n".join([question, *kwargs])
+        if retrieval_context is None:
+            retrieval_context = RetrievalContext(self.embeddings)
+        docs = self.retrieve(rag_retriever_input, scope, retrieval_context)
+        if self.reranker is not None:
+            docs = self.reranker.rerank(
+                question, docs, retrieval_context=retrieval_context, **kwargs
+            )
+        self.retrieval_cache.put(cache_key, docs)
+        return docs
+
+    def _search_shard(
+        self,
+        shard: LocalRAGManager,
+        query: str,
+        embedding,
+        k: int,
+        scope: Optional[str] = None,
+    ) -> Tuple[list, list]:
+        vector_results = (
+            shard.search_by_vector(embedding, k, scope) if embedding is not None else []
+        )
+        lexical_results = (
+            shard.search_lexical(query, k, scope)
+            if self.retrieval_mode != "vector"
+            else []
+        )
+        return vector_results, lexical_results
+
+    def retrieve(
+        self,
+        query: str,
+        scope: Optional[str] = None,
+        retrieval_context: Optional[RetrievalContext] = None,
+    ) -> List[Document]:
+        k = self.search_kwargs.get("k", 4)
+        mmr = self.search_type == "mmr"
+        fetch_k = self.search_kwargs.get("fetch_k", 20) if mmr else k
+        embedding = (
+            embed_query(self.embeddings, query, retrieval_context)
+            if self.retrieval_mode != "lexical"
+            else None
+        )
+        vector_results = []
+        lexical_results = []
+        for shard_vector_results, shard_lexical_results in self._executor.map(
+            lambda shard: self._search_shard(shard, query, embedding, fetch_k, scope),
+            self.shards,
+        ):
+            vector_results += shard_vector_results
+            lexical_results += shard_lexical_results
+
+        vector_results.sort(key=lambda result: result[1])
+        vector_docs = select_vector_docs(
+            embedding,
+            vector_results[:fetch_k],
+            k,
+            mmr,
+            self.search_kwargs.get("lambda_mult", 0.5),
+        )
+        lexical_results.sort(key=lambda result: result[1], reverse=True)
+        lexical_docs = [doc for doc, _ in lexical_results[:k]]
+
+        if self.retrieval_mode == "vector":
+            return vector_docs
+        if self.retrieval_mode == "lexical":
+            return lexical_docs
+        docs_by_id = {doc.metadata["id"]: doc for doc in vector_docs + lexical_docs}
+        fused_ids = reciprocal_rank_fusion(
+            [
+                [doc.metadata["id"] for doc in vector_docs],
+                [doc.metadata["id"] for doc in lexical_docs],
+            ],
+            self.rrf_k,
+        )
+        return [docs_by_id[doc_id] for doc_id in fused_ids[:k]]
+
+    @property
+    def docs_indexes(self) -> List[str]:
+        return [doc_id for shard in self.shards for doc_id in shard.docs_indexes]
+
+    def get_ids_by_source(self, source: str) -> List[str]:
+        return self._get_shard(source).get_ids_by_source(source)
+
+    def get_docs_by_source(self, source: str) -> List[Document]:
+        return self._get_shard(source).get_docs_by_source(source)
+
+    def list_sources(self) -> List[str]:
+        return [source for shard in self.shards for source in shard.list_sources()]
+
+    def get_all_docs(self) -> List[Document]:
+        return [doc for shard in self.shards for doc in shard.get_all_docs()]
+
+    def add_texts_from_paths(self, paths) -> List[str]:
+        filenames = list(iter_filenames_from_paths(paths, self.file_filter))
+        ids = []
+        for shard_index, shard_filenames in self._group_by_shard(filenames).items():
+            ids += self.shards[shard_index].add_texts_from_paths(shard_filenames)
+            self._source_to_shard.update(dict.fromkeys(shard_filenames, shard_index))
+        return ids
+
+    def update_texts_from_paths(self, paths) -> Tuple[List[str], List[str]]:
+        filenames = list(iter_filenames_from_paths(paths, self.file_filter))
+        added_ids, deleted_ids = [], []
+        for shard_index, shard_filenames in self._group_by_shard(filenames).items():
+            shard_added_ids, shard_deleted_ids = self.shards[
+                shard_index
+            ].update_texts_from_paths(shard_filenames)
+            added_ids += shard_added_ids
+            deleted_ids += shard_deleted_ids
+            self._source_to_shard.update(dict.fromkeys(shard_filenames, shard_index))
+        return added_ids, deleted_ids
+
+    def delete(self, doc_id: str) -> None:
+        for shard in self.shards:
+            try:
+                shard.get_metadata(doc_id)
+            except KeyError:
+                continue
+            shard.delete(doc_id)
+            return
+
+    def delete_source(self, source: str) -> int:
+        return self.delete_sources([source])
+
+    def delete_sources(self, sources: List[str]) -> int:
+        deleted = 0
+        for shard_index, shard_sources in self._group_by_shard(sources).items():
+            deleted += self.shards[shard_index].delete_sources(shard_sources)
+        for source in sources:
+            self._source_to_shard.pop(source, None)
+        return deleted
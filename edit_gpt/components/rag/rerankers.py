@@ -0,0 +1,174 @@
+import re
+from abc import ABC, abstractmethod
+from operator import attrgetter
+from typing import List, Literal, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+
+from edit_gpt.components.rag.local.rag_prompts import FILTER_PROMPT
+from edit_gpt.components.rag.retrieval_context import RetrievalContext, embed_query
+from edit_gpt.utils.utils import format_docs_with_index
+
+DEFAULT_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def extract_numbers(s):
+    return [int(num) for num in re.findall(r"\d+", s)]
+
+
+class BaseReranker(ABC):
+    """
+    Filters and reorders retrieved documents by relevance to the question.
+    retrieval_context holds the query embeddings of the request, if any.
+    """
+
+    @abstractmethod
+    def rerank(
+        self,
+        question: str,
+        docs: List[Document],
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> List[Document]:
+        pass
+
+    def _select(
+        self,
+        docs: List[Document],
+        scores,
+        threshold: Optional[float],
+        top_n: Optional[int],
+    ) -> List[Document]:
+        ranked = sorted(zip(scores, docs), key=lambda item: item[0], reverse=True)
+        if threshold is not None:
+            ranked = [(score, doc) for score, doc in ranked if score >= threshold]
+        return [doc for _, doc in ranked[:top_n]]
+
+
+class LLMFilterReranker(BaseReranker):
+    """Asks the chat model which of the documents are useful. Costs a model call."""
+
+    def __init__(self, chat_model: BaseChatModel):
+        self.chat_model = chat_model
+
+    def rerank(
+        self,
+        question: str,
+        docs: List[Document],
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> List[Document]:
+        filter_chain = (
+            FILTER_PROMPT | self.chat_model | attrgetter("content") | extract_numbers
+        )
+        filtered_docs_indexes = filter_chain.invoke(
+            {
+                "question": question,
+                "rag_context": format_docs_with_index(docs),
+                **kwargs,
+            }
+        )
+        try:
+            return [docs[i - 1] for i in filtered_docs_indexes]
+        except IndexError:
+            return docs
+
+
+class EmbeddingReranker(BaseReranker):
+    """
+    Keeps documents whose cosine similarity to the question reaches threshold.
+    Document vectors usually come from the embedding cache filled during ingest.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: Optional[float] = 0.3,
+        top_n: Optional[int] = None,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.top_n = top_n
+
+    def rerank(
+        self,
+        question: str,
+        docs: List[Document],
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> List[Document]:
+        if not docs:
+            return []
+        query_vector = np.asarray(
+            embed_query(self.embeddings, question, retrieval_context)
+        )
+        doc_vectors = np.asarray(
+            self.embeddings.embed_documents([doc.page_content for doc in docs])
+        )
+        norms = np.linalg.norm(doc_vectors, axis=1) * np.linalg.norm(query_vector)
+        scores = doc_vectors @ query_vector / np.maximum(norms, 1e-12)
+        return self._select(docs, scores, self.threshold, self.top_n)
+
+
+class CrossEncoderReranker(BaseReranker):
+    """
+    Scores (question, document) pairs with a local sentence-transformers
+    cross-encoder, in batches on the CPU. Keeps documents whose score (a logit
+    for ms-marco models) reaches threshold.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_CROSS_ENCODER_MODEL,
+        threshold: Optional[float] = 0.0,
+        top_n: Optional[int] = None,
+        batch_size: int = 16,
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.threshold = threshold
+        self.top_n = top_n
+        self.batch_size = batch_size
+
+    def rerank(
+        self,
+        question: str,
+        docs: List[Document],
+        retrieval_context: Optional[RetrievalContext] = None,
+        **kwargs,
+    ) -> List[Document]:
+        if not docs:
+            return []
+        scores = self.model.predict(
+            [(question, doc.page_content) for doc in docs],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        return self._select(docs, scores, self.threshold, self.top_n)
+
+
+def initialize_reranker(
+    reranker_type: Literal["llm", "embedding", "cross_encoder", "none"] = "embedding",
+    chat_model: Optional[BaseChatModel] = None,
+    embeddings: Optional[Embeddings] = None,
+    model: Optional[str] = None,
+    threshold: Optional[float] = None,
+    top_n: Optional[int] = None,
+) -> Optional[BaseReranker]:
+    if reranker_type == "llm":
+        return LLMFilterReranker(chat_model)
+    elif reranker_type == "embedding":
+        return EmbeddingReranker(
+            embeddings, threshold=0.3 if threshold is None else threshold, top_n=top_n
+        )
+    elif reranker_type == "cross_encoder":
+        return CrossEncoderReranker(
+            model or DEFAULT_CROSS_ENCODER_MODEL,
+            threshold=0.0 if threshold is None else threshold,
+            top_n=top_n,
+        )
+    return None
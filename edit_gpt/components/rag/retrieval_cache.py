@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from langchain_core.documents import Document
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+class RetrievalCache:
+    """
+    LRU cache of filtered retrieval results. Keys include the index version, so
+    entries of an older version are never returned and age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, List[Document]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[List[Document]]:
+        with self._lock:
+            docs = self._entries.get(key)
+            if docs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(docs)
+
+    def put(self, key: Hashable, docs: List[Document]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = list(docs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
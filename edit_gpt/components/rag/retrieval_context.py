@@ -0,0 +1,40 @@
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class RetrievalContext:
+    """
+    Query embeddings of one chat request. A text is embedded once however many
+    searches use it (RAG, its shards, the reranker, the history vectorstore), the
+    searches then go through the vector stores' by-vector methods.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self._vectors: Dict[str, List[float]] = {}
+        # held while embedding, so a text asked for by two threads is embedded once
+        self._lock = threading.Lock()
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vector = self._vectors.get(text)
+            if vector is None:
+                vector = self.embeddings.embed_query(text)
+                self._vectors[text] = vector
+            return vector
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+
+def embed_query(
+    embeddings: Embeddings,
+    text: str,
+    retrieval_context: Optional[RetrievalContext] = None,
+) -> List[float]:
+    """Embeds text with embeddings, through retrieval_context if it uses them."""
+    if retrieval_context is not None and retrieval_context.embeddings is embeddings:
+        return retrieval_context.embed_query(text)
+    return embeddings.embed_query(text)
@@ -0,0 +1,364 @@
+import ast
+import copy
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter, TextSplitter
+
+
+class ContentDefinedTextSplitter(CharacterTextSplitter):
+    """
+    CharacterTextSplitter whose chunk boundaries are anchored to the content.
+
+    Besides the size limit, a chunk always ends after a split whose checksum is
+    divisible by boundary_every. Greedy merging therefore restarts at these anchors,
+    and an edit can only move chunk boundaries up to the next anchor: the rest of
+    the file produces byte-identical chunks that don't have to be embedded again.
+
+    Chunks still longer than chunk_size (text without blank lines) are split on
+    newlines and lines longer than chunk_size into chunk_size characters.
+    """
+
+    def __init__(self, separator: str = "\n\n", boundary_every: int = 4, **kwargs):
+        super().__init__(separator=separator, **kwargs)
+        self._boundary_every = boundary_every
+
+    def _is_boundary(self, split: str) -> bool:
+        return zlib.crc32(split.encode("utf-8")) % self._boundary_every == 0
+
+    def _merge_splits(self, splits: Iterable[str], separator: str) -> List[str]:
+        chunks = []
+        segment = []
+        for split in splits:
+            segment.append(split)
+            if self._is_boundary(split):
+                chunks.extend(super()._merge_splits(segment, separator))
+                segment = []
+        if segment:
+            chunks.extend(super()._merge_splits(segment, separator))
+        return chunks
+
+    def _split_oversized(self, chunk: str) -> List[str]:
+        pieces = []
+        for line in chunk.splitlines(keepends=True):
+            while self._length_function(line) > self._chunk_size:
+                pieces.append(line[: self._chunk_size])
+                line = line[self._chunk_size :]
+            if pieces and self._length_function(pieces[-1] + line) <= self._chunk_size:
+                pieces[-1] += line
+            else:
+                pieces.append(line)
+        return [piece.strip() for piece in pieces if piece.strip()]
+
+    def split_text(self, text: str) -> List[str]:
+        chunks = []
+        for chunk in super().split_text(text):
+            if self._length_function(chunk) > self._chunk_size:
+                chunks.extend(self._split_oversized(chunk))
+            else:
+                chunks.append(chunk)
+        return chunks
+
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SPLITTER_TYPES = ("python", "code", "text")
+DEFAULT_SPLITTERS = {
+    "py": "python",
+    **{
+        extension: "code"
+        for extension in (
+            "c",
+            "cc",
+            "cpp",
+            "cs",
+            "go",
+            "h",
+            "hpp",
+            "java",
+            "js",
+            "jsx",
+            "kt",
+            "php",
+            "rb",
+            "rs",
+            "scala",
+            "sh",
+            "swift",
+            "ts",
+            "tsx",
+        )
+    },
+}
+CLOSING_PREFIXES = ("}", ")", "]", "end")
+
+
+def count_tokens(text: str) -> int:
+    """Approximates the number of model tokens as the number of words and symbols."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+class CodeTextSplitter(TextSplitter):
+    """
+    Splits source code into chunks of whole top-level blocks (functions, classes,
+    statements), found by indentation and brace structure, of at most max_tokens.
+
+    Blocks that exceed the budget are split at the next indentation level and, as a
+    last resort, line by line (a line over the budget between tokens). Small
+    neighbouring blocks are merged back up to the budget, with the same
+    content-defined anchors as ContentDefinedTextSplitter.
+    Chunks record their 1-based start_line and end_line in the metadata.
+    """
+
+    def __init__(self, max_tokens: int = 400, boundary_every: int = 4, **kwargs):
+        super().__init__(
+            chunk_size=max_tokens,
+            chunk_overlap=0,
+            length_function=count_tokens,
+            **kwargs,
+        )
+        self._max_tokens = max_tokens
+        self._boundary_every = boundary_every
+
+    @staticmethod
+    def _tokens(prefix: List[int], start: int, end: int) -> int:
+        """Tokens in lines[start:end], prefix holds cumulative per-line counts."""
+        return prefix[end] - prefix[start]
+
+    def _block_ranges(
+        self, lines: List[str], start: int, end: int, has_header: bool
+    ) -> List[Tuple[int, int]]:
+        """Splits lines[start:end] at the lines with the lowest indentation."""
+        non_blank = [i for i in range(start, end) if lines[i].strip()]
+        if has_header:
+            non_blank = non_blank[1:]
+        candidates = [
+            i for i in non_blank if not lines[i].lstrip().startswith(CLOSING_PREFIXES)
+        ]
+        if not candidates:
+            return [(start, end)]
+        level = min(_indent(lines[i]) for i in candidates)
+        boundaries = [i for i in candidates if _indent(lines[i]) == level]
+        # leading comments, or the header, go with the first block
+        boundaries = boundaries[1:]
+        starts = [start] + boundaries
+        return list(zip(starts, boundaries + [end]))
+
+    def _line_ranges(
+        self, lines: List[str], text: str, prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        return self._fit_ranges(
+            lines, self._block_ranges(lines, 0, len(lines), has_header=False), prefix
+        )
+
+    def _fit_ranges(
+        self, lines: List[str], ranges: List[Tuple[int, int]], prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        result = []
+        for start, end in ranges:
+            if self._tokens(prefix, start, end) <= self._max_tokens:
+                result.append((start, end))
+                continue
+            sub_ranges = self._block_ranges(lines, start, end, has_header=True)
+            if len(sub_ranges) > 1:
+                result.extend(self._fit_ranges(lines, sub_ranges, prefix))
+            else:
+                result.extend(self._pack_lines(start, end, prefix))
+        return result
+
+    def _pack_lines(
+        self, start: int, end: int, prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        result = []
+        chunk_start = start
+        for i in range(start, end):
+            if (
+                i > chunk_start
+                and self._tokens(prefix, chunk_start, i + 1) > self._max_tokens
+            ):
+                result.append((chunk_start, i))
+                chunk_start = i
+        result.append((chunk_start, end))
+        return result
+
+    def _is_boundary(self, lines: List[str], start: int, end: int) -> bool:
+        text = "".join(lines[start:end])
+        return zlib.crc32(text.encode("utf-8")) % self._boundary_every == 0
+
+    def _merge_ranges(
+        self, lines: List[str], ranges: List[Tuple[int, int]], prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        merged = []
+        for start, end in ranges:
+            if (
+                merged
+                and not merged[-1][2]
+                and self._tokens(prefix, merged[-1][0], end) <= self._max_tokens
+            ):
+                merged[-1] = (merged[-1][0], end, self._is_boundary(lines, start, end))
+            else:
+                merged.append((start, end, self._is_boundary(lines, start, end)))
+        return [(start, end) for start, end, _ in merged]
+
+    def _split_tokens(self, text: str) -> List[str]:
+        """Splits text that is a single line over the budget between tokens."""
+        starts = [match.start() for match in TOKEN_PATTERN.finditer(text)]
+        cuts = starts[self._max_tokens :: self._max_tokens]
+        return [
+            piece
+            for piece in (
+                text[start:end].strip() for start, end in zip([0] + cuts, cuts + [None])
+            )
+            if piece
+        ]
+
+    def split_text_with_lines(self, text: str) -> List[Tuple[str, int, int]]:
+        """Returns (chunk, start_line, end_line) tuples, lines are 1-based."""
+        lines = text.splitlines(keepends=True)
+        prefix = [0]
+        for line in lines:
+            prefix.append(prefix[-1] + count_tokens(line))
+        ranges = self._merge_ranges(
+            lines, self._line_ranges(lines, text, prefix), prefix
+        )
+
+        chunks = []
+        for start, end in ranges:
+            while start < end and not lines[start].strip():
+                start += 1
+            while end > start and not lines[end - 1].strip():
+                end -= 1
+            if start >= end:
+                continue
+            chunk = "".join(lines[start:end]).rstrip("\n")
+            if self._tokens(prefix, start, end) > self._max_tokens:
+                chunks.extend(
+                    (piece, start + 1, end) for piece in self._split_tokens(chunk)
+                )
+            else:
+                chunks.append((chunk, start + 1, end))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _, _ in self.split_text_with_lines(text)]
+
+    def create_documents(
+        self, texts: List[str], metadatas: Optional[List[dict]] = None
+    ) -> List[Document]:
+        _metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, _metadatas):
+            for chunk, start_line, end_line in self.split_text_with_lines(text):
+                chunk_metadata = copy.deepcopy(metadata)
+                chunk_metadata["start_line"] = start_line
+                chunk_metadata["end_line"] = end_line
+                documents.append(Document(page_content=chunk, metadata=chunk_metadata))
+        return documents
+
+
+class PythonCodeTextSplitter(CodeTextSplitter):
+    """CodeTextSplitter that finds blocks with the ast module instead of indentation."""
+
+    @staticmethod
+    def _statement_start(statement: ast.stmt) -> int:
+        decorators = getattr(statement, "decorator_list", [])
+        return min([statement.lineno] + [d.lineno for d in decorators]) - 1
+
+    def _statement_ranges(
+        self,
+        lines: List[str],
+        statements: List[ast.stmt],
+        start: int,
+        end: int,
+        prefix: List[int],
+    ) -> List[Tuple[int, int]]:
+        # leading comments and the header of the parent go with the first statement
+        starts = [start] + [self._statement_start(s) for s in statements[1:]]
+        result = []
+        for statement, range_start, range_end in zip(
+            statements, starts, starts[1:] + [end]
+        ):
+            if self._tokens(prefix, range_start, range_end) <= self._max_tokens:
+                result.append((range_start, range_end))
+            elif isinstance(getattr(statement, "body", None), list) and (
+                self._statement_start(statement.body[0]) > range_start
+            ):
+                result.extend(
+                    self._statement_ranges(
+                        lines, statement.body, range_start, range_end, prefix
+                    )
+                )
+            else:
+                result.extend(self._pack_lines(range_start, range_end, prefix))
+        return result
+
+    def _line_ranges(
+        self, lines: List[str], text: str, prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            return super()._line_ranges(lines, text, prefix)
+        if not tree.body:
+            return [(0, len(lines))]
+        return self._statement_ranges(lines, tree.body, 0, len(lines), prefix)
+
+
+class ExtensionTextSplitter(TextSplitter):
+    """Splits every document with the splitter registered for its file extension."""
+
+    def __init__(
+        self, default_splitter: TextSplitter, splitters: Dict[str, TextSplitter]
+    ):
+        super().__init__()
+        self.default_splitter = default_splitter
+        self.splitters = splitters
+
+    def get_splitter(self, source: Optional[str]) -> TextSplitter:
+        extension = os.path.splitext(source or "")[1].lower().lstrip(".")
+        return self.splitters.get(extension, self.default_splitter)
+
+    def split_text(self, text: str) -> List[str]:
+        return self.default_splitter.split_text(text)
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        result = []
+        for document in documents:
+            splitter = self.get_splitter(document.metadata.get("source"))
+            result.extend(splitter.split_documents([document]))
+        return result
+
+
+def create_text_splitter(
+    chunk_size: int = 1000,
+    chunk_overlap: int = 0,
+    splitters: Optional[Dict[str, str]] = None,
+    max_tokens: int = 400,
+) -> TextSplitter:
+    """
+    Builds the splitter used for ingested files: splitters maps file extensions to
+    one of SPLITTER_TYPES, other files are split as text into chunk_size characters.
+    """
+    text_splitter = ContentDefinedTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    if not splitters:
+        return text_splitter
+    by_type = {
+        "python": PythonCodeTextSplitter(max_tokens=max_tokens),
+        "code": CodeTextSplitter(max_tokens=max_tokens),
+        "text": text_splitter,
+    }
+    return ExtensionTextSplitter(
+        text_splitter,
+        {
+            extension.lower().lstrip("."): by_type[splitter_type]
+            for extension, splitter_type in splitters.items()
+        },
+    )
@@ -1,6 +1,6 @@
+import os
+
 from dotenv import load_dotenv
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain_core.embeddings.fake import FakeEmbeddings
 
 from edit_gpt.chat_models.init_chat_model import initialize_chat_model
 from edit_gpt.components.chat.agent.agent_builder import initialize_agent
@@ -8,16 +8,26 @@ from edit_gpt.components.chat.agent.tools.tools_builder import (
     initialize_tools_for_agent,
 )
 from edit_gpt.components.chat.chat_manager import ChatManager
+from edit_gpt.components.chat.context_packer import ContextPacker, get_token_counter
 from edit_gpt.components.chat.chat_prompts import qa_prompt
 from edit_gpt.components.chat.data_preprocessor import AdditionalDataPreprocessor
 from edit_gpt.components.diff_storage import DiffReader, DiffStorage
-from edit_gpt.components.history.init_history import initialize_history
+from edit_gpt.components.embeddings.init_embeddings import (
+    close_embeddings,
+    initialize_embeddings,
+)
+from edit_gpt.components.file_watcher import FileWatcher
+from edit_gpt.components.history.history_store import HistoryStore
+from edit_gpt.components.ingest_manifest import MANIFEST_FILENAME
 from edit_gpt.components.ingest_service import IngestService
 from edit_gpt.components.langsmith_client import setup_langsmith_client
 from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.components.rag.local.rag_sharded import ShardedRAGManager
+from edit_gpt.components.rag.rerankers import initialize_reranker
 from edit_gpt.components.web_search.init_web_search import initialize_web_search
 from edit_gpt.settings.settings import load_settings
 from edit_gpt.ui.ui import EditGptUi
+from edit_gpt.utils.file_filter import FileFilter
 
 
 def launch_app():
@@ -29,17 +39,87 @@ def launch_app():
         setup_langsmith_client()
 
     chat_model = initialize_chat_model(**settings.chat_model.model_dump())
-    if settings.embeddings.model == "fake":
-        embeddings = FakeEmbeddings()
+    embeddings = initialize_embeddings(
+        settings.embeddings.model,
+        cache_max_bytes=settings.embeddings.cache_max_bytes,
+        cache_directory=settings.embeddings.cache_directory,
+        processes=settings.embeddings.processes,
+        batch_size=settings.embeddings.batch_size,
+    )
+    rag_manager_kwargs = dict(
+        embeddings=embeddings,
+        chat_model=chat_model,
+        persist_directory=settings.rag.persist_directory,
+        mmap_index=settings.rag.mmap_index,
+        loader_workers=settings.rag.loader_workers,
+        # a full batch for every embedding worker
+        batch_size=max(
+            settings.rag.ingest_batch_size,
+            settings.embeddings.processes * settings.embeddings.batch_size,
+        ),
+        splitters=settings.rag.splitters,
+        chunk_max_tokens=settings.rag.chunk_max_tokens,
+        retrieval_mode=settings.rag.retrieval_mode,
+        reranker=initialize_reranker(
+            settings.rag.reranker,
+            chat_model=chat_model,
+            embeddings=embeddings,
+            model=settings.rag.reranker_model,
+            threshold=settings.rag.reranker_threshold,
+            top_n=settings.rag.reranker_top_n,
+        ),
+        result_cache_size=settings.rag.result_cache_size,
+        index_type=settings.rag.index_type,
+        index_params={
+            "hnsw_m": settings.rag.index_hnsw_m,
+            "hnsw_ef_search": settings.rag.index_hnsw_ef_search,
+            "ivf_nlist": settings.rag.index_ivf_nlist,
+            "ivf_nprobe": settings.rag.index_ivf_nprobe,
+            "pq_m": settings.rag.index_pq_m,
+        },
+        file_filter=FileFilter(
+            ignore_patterns=settings.rag.ignore_patterns,
+            use_gitignore=settings.rag.use_gitignore,
+            allowed_extensions=settings.rag.allowed_extensions,
+            max_file_size=settings.rag.max_file_size,
+            skip_binary_files=settings.rag.skip_binary_files,
+        ),
+    )
+    if settings.rag.shards > 1:
+        rag_manager = ShardedRAGManager(
+            shards_count=settings.rag.shards,
+            partition=settings.rag.shard_partition,
+            # not paths_to_rag, the files are ingested by IngestService below
+            partition_roots=settings.rag.filepaths,
+            **rag_manager_kwargs,
+        )
     else:
-        embeddings = HuggingFaceEmbeddings(model_name=settings.embeddings.model)
-    rag_manager = LocalRAGManager(embeddings=embeddings, chat_model=chat_model)
-    ingest_service = IngestService(rag_manager)
+        rag_manager = LocalRAGManager(**rag_manager_kwargs)
+    ingest_service = IngestService(
+        rag_manager,
+        manifest_path=(
+            os.path.join(settings.rag.persist_directory, MANIFEST_FILENAME)
+            if settings.rag.persist_directory
+            else None
+        ),
+    )
     diff_storage = DiffStorage()
-    history = initialize_history(
+    count_tokens = get_token_counter(chat_model, settings.chat_model.provider)
+    history_store = HistoryStore(
         history_type=settings.history.type,
         embeddings=embeddings,
+        persist_directory=settings.history.persist_directory,
         n_retrieved_messages=settings.history.n,
+        idle_timeout=settings.history.idle_timeout,
+        max_resident_sessions=settings.history.max_resident_sessions,
+        retention=settings.history.retention,
+        chat_model=chat_model,
+        summary_kwargs={
+            "last_turns": settings.history.last_turns,
+            "max_tokens": settings.history.max_tokens,
+            "summary_max_tokens": settings.history.summary_max_tokens,
+            "count_tokens": count_tokens,
+        },
     )
     tools = initialize_tools_for_agent(
         rag_manager=rag_manager,
@@ -60,25 +140,57 @@ def launch_app():
     web_search_tool = initialize_web_search(
         settings.web_search.provider, settings.web_search.k
     )
+    context_budget = settings.context.max_tokens or settings.chat_model.context_window
     chat_manager = ChatManager(
         chat_model=chat_model,
         qa_prompt=qa_prompt,
-        history=history,
+        history_store=history_store,
         agent=agent,
+        context_packer=(
+            ContextPacker(
+                context_budget,
+                rag_weight=settings.context.rag_weight,
+                history_weight=settings.context.history_weight,
+                web_weight=settings.context.web_weight,
+                count_tokens=count_tokens,
+            )
+            if context_budget
+            else None
+        ),
+        answer_tokens=settings.context.answer_tokens,
     )
     additional_data_manager = AdditionalDataPreprocessor(
-        rag_manager=rag_manager, web_search_tool=web_search_tool
+        rag_manager=rag_manager,
+        web_search_tool=web_search_tool,
+        rag_timeout=settings.rag.timeout,
+        web_search_timeout=settings.web_search.timeout,
     )
+    file_watcher = None
+    if settings.rag.watch and settings.rag.filepaths:
+        file_watcher = FileWatcher(
+            ingest_service,
+            settings.rag.filepaths,
+            file_filter=rag_manager.file_filter,
+            poll_interval=settings.rag.watch_poll_interval,
+            debounce=settings.rag.watch_debounce,
+        )
     ui = EditGptUi(
         ingest_service=ingest_service,
         chat_manager=chat_manager,
         filenames=settings.rag.filepaths,
         additional_data_manager=additional_data_manager,
         diff_storage=diff_storage,
+        file_watcher=file_watcher,
     )
     _blocks = ui.get_ui_blocks()
     _blocks.queue()
-    _blocks.launch(debug=False, show_api=False)
+    try:
+        _blocks.launch(debug=False, show_api=False)
+    finally:
+        if file_watcher is not None:
+            file_watcher.stop()
+        history_store.close()
+        close_embeddings(embeddings)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,11 @@
 # TODO add vectorstore settings
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
+from edit_gpt.components.rag.splitters import DEFAULT_SPLITTERS
 from edit_gpt.settings.settings_loader import load_active_settings
+from edit_gpt.utils.file_filter import DEFAULT_IGNORE_PATTERNS
 
 
 class ChatModel(BaseModel):
@@ -33,10 +35,126 @@ class RagSettings(BaseModel):
         2,
         description="This value controls the number of documents returned by the RAG pipeline",
     )
+    retrieval_mode: Literal["vector", "lexical", "hybrid"] = Field(
+        "vector",
+        description="vector searches the FAISS index, lexical uses BM25 over an in-memory inverted index of the chunks (finds exact identifiers and error strings), hybrid fuses both rankings with reciprocal rank fusion",
+    )
+    reranker: Literal["llm", "embedding", "cross_encoder", "none"] = Field(
+        "embedding",
+        description="How retrieved documents are filtered before they are added to the prompt. embedding keeps documents similar enough to the question, cross_encoder scores them with a local cross-encoder model, llm asks the chat model (an extra model call per message), none keeps all of them",
+    )
+    reranker_model: Optional[str] = Field(
+        None,
+        description="The cross-encoder model for the cross_encoder reranker. Defaults to cross-encoder/ms-marco-MiniLM-L-6-v2",
+    )
+    reranker_threshold: Optional[float] = Field(
+        None,
+        description="The minimum score a document needs to be kept: cosine similarity for embedding (default 0.3), model score for cross_encoder (default 0.0)",
+    )
+    reranker_top_n: Optional[int] = Field(
+        None,
+        description="The maximum number of documents kept by the embedding and cross_encoder rerankers",
+    )
+    result_cache_size: int = Field(
+        256,
+        description="The number of filtered retrieval results cached by normalized question. Entries are invalidated whenever ingested chunks change. 0 disables the cache",
+    )
+    timeout: Optional[float] = Field(
+        None,
+        description="Seconds to wait for RAG retrieval before answering without RAG context. No limit by default",
+    )
     filepaths: Optional[List[str]] = Field(
         None,
         description="A list of paths (you can specify folders and files) that will be uploaded to RAG, and which can be edited directly",
     )
+    persist_directory: Optional[str] = Field(
+        None,
+        description="If set, the vector index, the ingested chunks and the manifest of ingested files are saved to this directory after every change and loaded from it at startup, so only new and modified files are embedded again",
+    )
+    mmap_index: bool = Field(
+        False,
+        description="Open the persisted index memory-mapped, so that several processes share one copy in the page cache. Only index types that keep vectors in inverted lists (IVF) are actually mapped, and only until the first change to the index (an ingest, a saved edit or a watcher update), which copies it into memory",
+    )
+    index_type: Literal["flat", "flat_fp16", "hnsw", "ivf_pq"] = Field(
+        "flat",
+        description="The FAISS index type. flat searches all vectors exactly and is best for small corpora, flat_fp16 does the same in half the memory. hnsw (graph) and ivf_pq (inverted lists with product quantization, much smaller) are approximate and scale to millions of chunks. ivf_pq stays flat until there are 39 * max(index_ivf_nlist, 256) chunks to train on (256 is the size of the product quantizer codebook). Changing it requires deleting rag.persist_directory",
+    )
+    index_hnsw_m: int = Field(
+        32,
+        description="The number of neighbours per node of the hnsw graph. Higher is more accurate, slower to build and uses more memory",
+    )
+    index_hnsw_ef_search: int = Field(
+        64,
+        description="The size of the candidate list of hnsw searches. Higher is more accurate and slower",
+    )
+    index_ivf_nlist: int = Field(
+        1024,
+        description="The number of inverted lists (clusters) of the ivf_pq index. About 4 * sqrt(number of chunks) is a good start",
+    )
+    index_ivf_nprobe: int = Field(
+        16,
+        description="The number of inverted lists searched by ivf_pq queries. Higher is more accurate and slower",
+    )
+    index_pq_m: int = Field(
+        16,
+        description="The number of bytes each vector is compressed to by ivf_pq. Must divide the embedding dimension",
+    )
+    shards: int = Field(
+        1,
+        description="The number of indexes the chunks are split into. Shards are searched in parallel and their results merged, so large corpora use several cores per query. 1 keeps a single index",
+    )
+    shard_partition: Literal["directory", "hash"] = Field(
+        "directory",
+        description="How files are assigned to shards: by their top-level directory under rag.filepaths (directory) or by their path (hash, evenly sized shards)",
+    )
+    ignore_patterns: List[str] = Field(
+        DEFAULT_IGNORE_PATTERNS,
+        description="Patterns in .gitignore syntax, relative to each ingested folder, of files and folders that are not ingested",
+    )
+    use_gitignore: bool = Field(
+        True,
+        description="Also skip files matched by .gitignore files found in the ingested folders",
+    )
+    allowed_extensions: Optional[List[str]] = Field(
+        None,
+        description="If set, only files with these extensions (e.g. [py, md]) are ingested",
+    )
+    max_file_size: Optional[int] = Field(
+        1_000_000,
+        description="Files larger than this number of bytes are not ingested",
+    )
+    skip_binary_files: bool = Field(
+        True,
+        description="Skip files that look binary (contain NUL bytes in the first 8 KB)",
+    )
+    splitters: Dict[str, Literal["python", "code", "text"]] = Field(
+        DEFAULT_SPLITTERS,
+        description="How files are chunked, by extension. python chunks by functions and classes using the ast module, code by indentation and brace structure, text by blank lines into chunks of up to 1000 characters. Unlisted extensions are chunked as text",
+    )
+    chunk_max_tokens: int = Field(
+        400,
+        description="The maximum number of tokens in a chunk produced by the python and code splitters",
+    )
+    loader_workers: int = Field(
+        8,
+        description="The number of parallel workers reading files during ingest. Notebooks are parsed in worker processes, other files in threads. 1 loads files sequentially",
+    )
+    ingest_batch_size: int = Field(
+        256,
+        description="The number of chunks that are embedded and added to the index at once during ingest",
+    )
+    watch: bool = Field(
+        False,
+        description="Whether to re-ingest files under rag.filepaths in the background when they change on disk. Uses filesystem events if the watchdog package is installed, polling otherwise",
+    )
+    watch_poll_interval: float = Field(
+        2.0,
+        description="How often (in seconds) file stats are polled for changes when watchdog is not installed",
+    )
+    watch_debounce: float = Field(
+        1.0,
+        description="How long (in seconds) files have to stop changing before they are re-ingested",
+    )
 
 
 class WebSearchSettings(BaseModel):
@@ -45,6 +163,10 @@ class WebSearchSettings(BaseModel):
         2,
         description="This value controls the number of pages returned by the web search tool/pipeline",
     )
+    timeout: Optional[float] = Field(
+        None,
+        description="Seconds to wait for web search results before answering without them. No limit by default",
+    )
 
 
 class AgentSettings(BaseModel):
@@ -59,18 +181,85 @@ class AgentSettings(BaseModel):
 
 class EmbeddingsSettings(BaseModel):
     model: str
+    cache_max_bytes: int = Field(
+        64 * 1024 * 1024,
+        description="Memory budget of the in-memory LRU cache of computed embeddings, shared by RAG, history and web search. 0 disables it",
+    )
+    cache_directory: Optional[str] = Field(
+        None,
+        description="If set, computed embeddings are also stored in this directory, keyed by model name and text hash, and reused across restarts",
+    )
+    processes: int = Field(
+        1,
+        description="The number of worker processes, each with its own copy of the model, that embed documents during ingest. Queries are always embedded in the app process",
+    )
+    batch_size: int = Field(
+        64,
+        description="The maximum number of texts sent to an embedding worker at once. During ingest at least processes * batch_size chunks are embedded at once (see rag.ingest_batch_size), so that every worker gets a full batch",
+    )
 
 
 class HistorySettings(BaseModel):
-    type: Literal["vector", "simple"] = Field(
+    type: Literal["vector", "simple", "summary"] = Field(
         "simple",
-        description="The type of the chat history. If simple is set, then the history is stored in-memory in a regular list. In vector mode, k last messages are taken, and n messages are extracted via similarity",
+        description="The type of the chat history. If simple is set, then the history is stored in-memory in a regular list. In vector mode, k last messages are taken, and n messages are extracted via similarity. In summary mode, the last turns are sent verbatim and older ones as a summary updated by the chat model after each answer",
+    )
+    last_turns: int = Field(
+        3,
+        description="Summary mode: the number of last turns (a question and an answer) sent verbatim",
+    )
+    max_tokens: int = Field(
+        1500,
+        description="Summary mode: the token budget of the history sent with a prompt, the summary and the verbatim turns. Turns that don't fit are folded into the summary",
+    )
+    summary_max_tokens: int = Field(
+        500,
+        description="Summary mode: the length the chat model is asked to keep the summary within",
+    )
+    persist_directory: Optional[str] = Field(
+        None,
+        description="The directory to store the chat history of every UI session in, messages in a SQLite database and the vector index of each session in a subdirectory. If not set, histories are kept in memory only",
+    )
+    idle_timeout: float = Field(
+        900.0,
+        description="The number of seconds after which the history of an idle session is saved and unloaded from memory",
+    )
+    max_resident_sessions: int = Field(
+        100,
+        description="The maximum number of session histories kept in memory, the least recently used ones are saved and unloaded",
+    )
+    retention: Optional[float] = Field(
+        604800.0,
+        description="The number of seconds after the last message of a session after which its persisted history is deleted. The UI starts a new session on every page load, so old sessions are rarely resumed. If not set, histories are kept forever",
     )
 
     class Config:
         extra = "allow"
 
 
+class ContextSettings(BaseModel):
+    max_tokens: Optional[int] = Field(
+        None,
+        description="The token budget of a prompt. RAG chunks, history messages and web search results are packed into it by value and the rest is dropped. Defaults to chat_model.context_window, nothing is dropped if neither is set",
+    )
+    answer_tokens: int = Field(
+        512,
+        description="The number of tokens of the budget kept free for the answer",
+    )
+    rag_weight: float = Field(
+        1.0,
+        description="The value of the best RAG chunk when packing, the chunk ranked n-th is worth rag_weight / n",
+    )
+    history_weight: float = Field(
+        0.8,
+        description="The value of the most recent history message when packing, the n-th most recent is worth history_weight / n",
+    )
+    web_weight: float = Field(
+        0.6,
+        description="The value of the first web search result when packing, the n-th is worth web_weight / n",
+    )
+
+
 class LangsmithSettings(BaseModel):
     use_langsmith: bool = Field(False)
 
@@ -82,6 +271,7 @@ class Settings(BaseModel):
     agent: AgentSettings
     embeddings: EmbeddingsSettings
     history: HistorySettings
+    context: ContextSettings = ContextSettings()
     langsmith: LangsmithSettings
 
 
@@ -1,5 +1,4 @@
 import logging
-import os
 from pathlib import Path
 from typing import Any, Iterator, List, Optional
 
@@ -13,6 +12,7 @@ from edit_gpt.components.chat.agent.tools.edit_file import get_text_from_observa
 from edit_gpt.components.chat.chat_manager import ChatManager
 from edit_gpt.components.chat.data_preprocessor import AdditionalDataPreprocessor
 from edit_gpt.components.diff_storage import DiffStorage
+from edit_gpt.components.file_watcher import FileWatcher
 from edit_gpt.components.ingest_service import IngestService
 from edit_gpt.constants import PROJECT_ROOT_PATH
 from edit_gpt.utils.loaders import normalize_to_straight_slash
@@ -44,6 +44,7 @@ class EditGptUi:
         diff_storage: DiffStorage,
         additional_data_manager: AdditionalDataPreprocessor,
         filenames: Optional[List[str]] = None,
+        file_watcher: Optional[FileWatcher] = None,
     ) -> None:
         self.diff_storage = diff_storage
         self._ingest_service = ingest_service
@@ -63,24 +64,45 @@ class EditGptUi:
         if self.filenames:
             self._upload_files(self.filenames)
 
-    def _update_history(self, history: list[list[str]]) -> None:
+        # started after the initial ingest so it only sees later changes
+        self._file_watcher = file_watcher
+        if self._file_watcher is not None:
+            self._file_watcher.start()
+
+    def _update_history(
+        self, history: list[list[str]], session_id: Optional[str] = None
+    ) -> None:
         past_messages = []
         for step in history:
             past_messages.append(HumanMessage(content=step[0]))
             past_messages.append(AIMessage(content=step[1]))
-        self._chat_manager.update_history(past_messages)
+        self._chat_manager.update_history(past_messages, session_id)
 
-    def _chat(self, message: str, history: list[list[str]], *_: Any) -> Iterator[str]:
-        self._update_history(history)
+    def _chat(
+        self,
+        message: str,
+        history: list[list[str]],
+        request: gr.Request,
+        *_: Any,
+    ) -> Iterator[str]:
+        # every browser session has its own history
+        session_id = request.session_hash if request else None
+        self._update_history(history, session_id)
 
         if self.mode == AGENT_MODE:
-            yield from self._process_agent_chat(message)
+            yield from self._process_agent_chat(message, session_id)
         elif self.mode == LLM_MODE:
-            yield from self._process_llm_chat(message)
+            yield from self._process_llm_chat(message, session_id)
 
-    def _process_agent_chat(self, message: str) -> Iterator[str]:
-        additional_data = self.additional_data_manager.prepare_data(message, ["RAG"])
-        result = self._chat_manager.agent_gen(message, **additional_data)
+    def _process_agent_chat(
+        self, message: str, session_id: Optional[str] = None
+    ) -> Iterator[str]:
+        additional_data = self.additional_data_manager.prepare_data(
+            message, ["RAG"], scope=self._selected_filename
+        )
+        result = self._chat_manager.agent_gen(
+            message, session_id=session_id, **additional_data
+        )
         output = result["output"]
         edited_files = {}
         for step in result["intermediate_steps"]:
@@ -94,25 +116,20 @@ class EditGptUi:
         self.diff_storage.add_history_step(edited_files)
         yield output
 
-    def _process_llm_chat(self, message: str) -> Iterator[str]:
+    def _process_llm_chat(
+        self, message: str, session_id: Optional[str] = None
+    ) -> Iterator[str]:
         additional_data = self.additional_data_manager.prepare_data(
-            message, self.options
+            message, self.options, scope=self._selected_filename
         )
-        for accumulated_text in self._chat_manager.chat_gen(message, **additional_data):
+        for accumulated_text in self._chat_manager.chat_gen(
+            message, session_id=session_id, **additional_data
+        ):
             yield accumulated_text
         self.diff_storage.add_history_step(None)
 
     def _list_ingested_files(self) -> List[str]:
-        filenames = set()
-        for ingested_document in self._ingest_service.list_ingested():
-            if ingested_document.metadata is None:
-                # Skipping documents without metadata
-                continue
-            file_name = ingested_document.metadata.get("source", "[FILE NAME MISSING]")
-
-            filenames.add(file_name)
-
-        return list(filenames)
+        return self._ingest_service.list_ingested_sources()
 
     def _list_ingested_files_styled(self) -> Styler:
         filenames = self._list_ingested_files()
@@ -131,28 +148,14 @@ class EditGptUi:
     def _upload_files(self, files: list[str]) -> None:
         logger.debug("Loading count=%s files", len(files))
 
-        doc_ids_to_delete = []
-        for ingested_document in self._ingest_service.list_ingested():
-            if (
-                ingested_document.metadata["source"]
-                and ingested_document.metadata["source"] in files
-            ):
-                doc_ids_to_delete.append(ingested_document.metadata["id"])
-        if len(doc_ids_to_delete) > 0:
-            logger.info(
-                "Uploading file(s) which were already ingested: %s document(s) will be replaced.",
-                len(doc_ids_to_delete),
-            )
-            for doc_id in doc_ids_to_delete:
-                self._ingest_service.delete(doc_id)
-
-        self._ingest_service.bulk_ingest(files)
+        # unchanged files are skipped, modified ones only re-embed changed chunks
+        report = self._ingest_service.bulk_ingest(files)
+        logger.info("Uploaded files: %s", report)
 
     def _delete_all_files(self) -> Any:
-        ingested_files = self._ingest_service.list_ingested()
+        ingested_files = self._ingest_service.list_ingested_sources()
         logger.debug("Deleting count=%s files", len(ingested_files))
-        for ingested_document in ingested_files:
-            self._ingest_service.delete(ingested_document.metadata["id"])
+        self._ingest_service.delete_sources(ingested_files)
         return [
             gr.DataFrame(self._list_ingested_files_styled()),
             gr.components.Button(interactive=False),
@@ -162,13 +165,7 @@ class EditGptUi:
 
     def _delete_selected_file(self) -> Any:
         logger.debug("Deleting selected %s", self._selected_filename)
-        ingested_files = self._ingest_service.list_ingested()
-        for ingested_document in ingested_files:
-            if (
-                ingested_document.metadata
-                and ingested_document.metadata["source"] == self._selected_filename
-            ):
-                self._ingest_service.delete(ingested_document.metadata["id"])
+        self._ingest_service.delete_source(self._selected_filename)
         return [
             gr.DataFrame(self._list_ingested_files_styled()),
             gr.components.Button(interactive=False),
@@ -190,13 +187,11 @@ class EditGptUi:
         return self._update_file_view()
 
     def _update_if_outdated(self, filepath: str) -> None:
+        if self._file_watcher is not None and self._file_watcher.is_running:
+            # the watcher re-ingests changed files in the background
+            return
         selected_filename_path = normalize_to_straight_slash(Path(filepath))
-        timestamp = os.path.getmtime(selected_filename_path)
-        if (
-            timestamp
-            > self._ingest_service.ingested_files_last_edit_time[selected_filename_path]
-        ):
-            self._ingest_service.bulk_ingest([selected_filename_path])
+        self._ingest_service.bulk_ingest([selected_filename_path])
 
     def _update_file_view(self):
         if self._selected_filename is None:
@@ -0,0 +1,166 @@
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/",
+    ".hg/",
+    ".svn/",
+    "node_modules/",
+    "__pycache__/",
+    ".venv/",
+    "venv/",
+    ".tox/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    ".idea/",
+    "build/",
+    "dist/",
+    "*.egg-info/",
+    "*.lock",
+    "package-lock.json",
+    "*.min.js",
+    "*.pyc",
+]
+BINARY_SNIFF_BYTES = 8192
+
+
+class IgnoreRule(NamedTuple):
+    regex: re.Pattern
+    negate: bool
+    dir_only: bool
+    base: str
+
+
+def _translate_glob(pattern: str) -> str:
+    result = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            result += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            result += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            result += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            result += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+            end = pattern.index("]", i + 1)
+            result += "[" + pattern[i + 1 : end].replace("!", "^", 1) + "]"
+            i = end + 1
+        else:
+            result += re.escape(pattern[i])
+            i += 1
+    return result
+
+
+def parse_ignore_pattern(pattern: str, base: str) -> Optional[IgnoreRule]:
+    """Parses one line of .gitignore syntax, relative to the base directory."""
+    pattern = pattern.rstrip("\n").rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None
+    # patterns with a slash are relative to base, others match a name at any depth
+    anchored = "/" in pattern
+    regex = _translate_glob(pattern.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return IgnoreRule(re.compile(regex + "$"), negate, dir_only, base)
+
+
+def is_binary_file(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(BINARY_SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+class FileFilter:
+    """
+    Decides which files are ingested: ignore patterns in .gitignore syntax (given
+    explicitly and read from .gitignore files in the walked directories), an
+    extension allowlist, a size limit and a check for binary content.
+    """
+
+    def __init__(
+        self,
+        ignore_patterns: Optional[List[str]] = None,
+        use_gitignore: bool = True,
+        allowed_extensions: Optional[List[str]] = None,
+        max_file_size: Optional[int] = None,
+        skip_binary_files: bool = True,
+    ):
+        self.ignore_patterns = (
+            DEFAULT_IGNORE_PATTERNS if ignore_patterns is None else ignore_patterns
+        )
+        self.use_gitignore = use_gitignore
+        self.allowed_extensions = (
+            {extension.lower().lstrip(".") for extension in allowed_extensions}
+            if allowed_extensions is not None
+            else None
+        )
+        self.max_file_size = max_file_size
+        self.skip_binary_files = skip_binary_files
+
+    def root_rules(self, root: str) -> List[IgnoreRule]:
+        rules = [
+            parse_ignore_pattern(pattern, root) for pattern in self.ignore_patterns
+        ]
+        return [rule for rule in rules if rule is not None]
+
+    def directory_rules(self, directory: str) -> List[IgnoreRule]:
+        if not self.use_gitignore:
+            return []
+        try:
+            with open(os.path.join(directory, ".gitignore"), encoding="utf-8") as f:
+                lines = f.readlines()
+        except (OSError, UnicodeDecodeError):
+            return []
+        rules = [parse_ignore_pattern(line, directory) for line in lines]
+        return [rule for rule in rules if rule is not None]
+
+    @staticmethod
+    def is_ignored(path: str, is_dir: bool, rules: List[IgnoreRule]) -> bool:
+        ignored = False
+        for rule in rules:
+            if rule.dir_only and not is_dir:
+                continue
+            relative_path = os.path.relpath(path, rule.base).replace("\\", "/")
+            if rule.regex.match(relative_path):
+                ignored = not rule.negate
+        return ignored
+
+    def accepts_file(self, path: str) -> bool:
+        return self.accepts_name(path) and self.accepts_content(path)
+
+    def accepts_name(self, path: str) -> bool:
+        """The checks that don't touch the file."""
+        if self.allowed_extensions is not None:
+            extension = os.path.splitext(path)[1].lower().lstrip(".")
+            if extension not in self.allowed_extensions:
+                return False
+        return True
+
+    def accepts_content(self, path: str) -> bool:
+        """The size limit and the binary check, which reads the start of the file."""
+        if self.max_file_size is not None:
+            try:
+                if os.path.getsize(path) > self.max_file_size:
+                    return False
+            except OSError:
+                return False
+        if self.skip_binary_files and is_binary_file(path):
+            return False
+        return True
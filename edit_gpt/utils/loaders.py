@@ -1,7 +1,13 @@
 import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
 from langchain_community.document_loaders.notebook import NotebookLoader
 from langchain_community.document_loaders.text import TextLoader
+from langchain_core.documents import Document
+
+from edit_gpt.utils.file_filter import FileFilter
 
 
 def load_doc(path):
@@ -24,24 +30,98 @@ def normalize_to_straight_slash(path):
     return os.path.normpath(path).replace("\\", "/")
 
 
-def get_all_filenames_from_paths(paths):
-    all_files = []
+def iter_filenames_from_paths(
+    paths, file_filter: Optional[FileFilter] = None, check_content: bool = True
+) -> Iterator[str]:
+    """
+    Files under paths accepted by file_filter. With check_content=False the filter's
+    size and binary checks are left to the caller and files are not opened.
+    """
+
+    def accepts(file_path: str) -> bool:
+        if check_content:
+            return file_filter.accepts_file(file_path)
+        return file_filter.accepts_name(file_path)
+
     for path in paths:
         if os.path.isfile(path):
-            all_files.append(normalize_to_straight_slash(path))
-        else:
+            if file_filter is None or accepts(path):
+                yield normalize_to_straight_slash(path)
+            continue
+        if file_filter is None:
             for root, dirs, files in os.walk(path):
                 for file in files:
-                    all_files.append(os.path.join(root, file))
-                    all_files[-1] = normalize_to_straight_slash(all_files[-1])
-    return all_files
-
-
-def load_docs_from_paths(paths):
-    all_files = get_all_filenames_from_paths(paths)
-    docs = []
-    for file_path in all_files:
-        file_docs = load_doc(file_path)
-        if file_docs is not None:
-            docs += file_docs
-    return docs
+                    yield normalize_to_straight_slash(os.path.join(root, file))
+            continue
+
+        # ignore rules inherited by every directory from its parents
+        inherited_rules = {path: file_filter.root_rules(path)}
+        for root, dirs, files in os.walk(path):
+            rules = inherited_rules.pop(root) + file_filter.directory_rules(root)
+            dirs[:] = [
+                d
+                for d in dirs
+                if not file_filter.is_ignored(os.path.join(root, d), True, rules)
+            ]
+            for d in dirs:
+                inherited_rules[os.path.join(root, d)] = rules
+            for file in files:
+                file_path = os.path.join(root, file)
+                if not file_filter.is_ignored(file_path, False, rules) and accepts(
+                    file_path
+                ):
+                    yield normalize_to_straight_slash(file_path)
+
+
+def get_all_filenames_from_paths(
+    paths, file_filter: Optional[FileFilter] = None, check_content: bool = True
+):
+    return list(iter_filenames_from_paths(paths, file_filter, check_content))
+
+
+def iter_docs_from_paths(
+    paths,
+    max_workers: int = 8,
+    max_pending: Optional[int] = None,
+    file_filter: Optional[FileFilter] = None,
+) -> Iterator[Tuple[str, List[Document]]]:
+    """
+    Loads files under paths in parallel and yields (filename, docs) in walk order.
+
+    Text files are read and decoded in a thread pool, notebooks are parsed in a
+    process pool that is only started if there is a notebook to load. At most
+    max_pending files (2 * max_workers by default) are loaded ahead of the consumer,
+    so memory does not grow with the size of the tree. Files that cannot be
+    decoded are yielded with an empty list of docs, files rejected by file_filter
+    are not yielded at all.
+    """
+    if max_workers <= 1:
+        for filename in iter_filenames_from_paths(paths, file_filter):
+            yield filename, load_doc(filename) or []
+        return
+
+    if max_pending is None:
+        max_pending = 2 * max_workers
+    process_pool: Optional[Executor] = None
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+        try:
+            for filename in iter_filenames_from_paths(paths, file_filter):
+                if filename.endswith(".ipynb"):
+                    if process_pool is None:
+                        process_pool = ProcessPoolExecutor(max_workers=max_workers)
+                    pool = process_pool
+                else:
+                    pool = thread_pool
+                pending.append((filename, pool.submit(load_doc, filename)))
+                if len(pending) >= max_pending:
+                    filename, future = pending.popleft()
+                    yield filename, future.result() or []
+            while pending:
+                filename, future = pending.popleft()
+                yield filename, future.result() or []
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if process_pool is not None:
+                process_pool.shutdown(cancel_futures=True)
@@ -1,12 +1,36 @@
+MAX_DUPLICATES_SHOWN = 3
+
+
+def format_location(metadata):
+    path = metadata["source"]
+    if "start_line" in metadata:
+        path += f" (lines {metadata['start_line']}-{metadata['end_line']})"
+    return path
+
+
+def format_doc_path(doc):
+    path = format_location(doc.metadata)
+    duplicates = doc.metadata.get("duplicates")
+    if duplicates:
+        shown = ", ".join(
+            format_location(duplicate)
+            for duplicate in duplicates[:MAX_DUPLICATES_SHOWN]
+        )
+        if len(duplicates) > MAX_DUPLICATES_SHOWN:
+            shown += ", ..."
+        path += f" (+{len(duplicates)} identical: {shown})"
+    return path
+
+
 def format_docs(docs):
     return "\n\n".join(
-        f"Doc path: {doc.metadata['source']} \n{doc.page_content}"
+        f"Doc path: {format_doc_path(doc)} \n{doc.page_content}"
         for i, doc in enumerate(docs, 1)
     )
 
 
 def format_docs_with_index(docs):
     return "\n\n".join(
-        f"Index: {i} \nDoc path: {doc.metadata['source']} \n{doc.page_content}"
+        f"Index: {i} \nDoc path: {format_doc_path(doc)} \n{doc.page_content}"
         for i, doc in enumerate(docs, 1)
     )
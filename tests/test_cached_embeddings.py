@@ -0,0 +1,51 @@
+from typing import List
+
+import numpy as np
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
+
+from edit_gpt.components.embeddings.cached_embeddings import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        self.texts: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.texts.append(text)
+        return self.embeddings.embed_query(text)
+
+
+def test_texts_are_embedded_once_per_model(tmp_path) -> None:
+    base = CountingEmbeddings()
+    embeddings = CachedEmbeddings(base, "model", cache_directory=str(tmp_path))
+
+    vectors = embeddings.embed_documents(["a", "b", "a"])
+    assert embeddings.embed_documents(["b"]) == [vectors[1]]
+    assert base.texts == ["a", "b"]
+    # stored as float32
+    assert np.allclose(vectors, base.embeddings.embed_documents(["a", "b", "a"]))
+
+    # from disk after a restart, other models don't share vectors
+    restarted = CachedEmbeddings(base, "model", cache_directory=str(tmp_path))
+    assert restarted.embed_documents(["a"]) == [vectors[0]]
+    CachedEmbeddings(base, "other", cache_directory=str(tmp_path)).embed_query("a")
+    assert base.texts == ["a", "b", "a"]
+
+
+def test_memory_is_bounded_least_recently_used_first() -> None:
+    base = CountingEmbeddings()
+    # 8 float32 values per vector, room for two of them
+    embeddings = CachedEmbeddings(base, "model", max_bytes=64)
+
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a", "c"])
+    embeddings.embed_documents(["a", "b"])
+
+    assert base.texts == ["a", "b", "c", "b"]
+    assert embeddings.stats["memory_bytes"] == 64
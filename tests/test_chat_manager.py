@@ -0,0 +1,62 @@
+from typing import List
+
+from langchain_community.chat_message_histories.in_memory import ChatMessageHistory
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from edit_gpt.components.chat.chat_manager import ChatManager
+from edit_gpt.components.chat.chat_prompts import qa_prompt
+from edit_gpt.components.history.vector_based_history import (
+    VectorBasedChatHistory,
+    create_empty_vectorstore,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        self.texts: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def _conversation(n_turns: int, last_answer: str = "") -> list:
+    messages = []
+    for i in range(n_turns):
+        messages.append(HumanMessage(content=f"question {i}"))
+        messages.append(AIMessage(content=f"answer {i}"))
+    if last_answer:
+        messages[-1] = AIMessage(content=last_answer)
+    return messages
+
+
+def test_only_new_and_changed_messages_are_embedded() -> None:
+    embeddings = CountingEmbeddings()
+    history = VectorBasedChatHistory(
+        create_empty_vectorstore(embeddings).as_retriever(), ChatMessageHistory()
+    )
+    chat_manager = ChatManager(
+        FakeListChatModel(responses=[]), qa_prompt, history=history
+    )
+    # the placeholder text of the empty vectorstore
+    embeddings.texts.clear()
+
+    chat_manager.update_history(_conversation(3))
+    chat_manager.update_history(_conversation(4))
+    assert history.flush(timeout=5)
+    assert len(embeddings.texts) == 8
+
+    # the last answer was regenerated
+    chat_manager.update_history(_conversation(4, last_answer="another answer"))
+    assert history.flush(timeout=5)
+    assert len(embeddings.texts) == 9
+    assert history.messages == _conversation(4, last_answer="another answer")
+    assert len(history.retriever.vectorstore.index_to_docstore_id) == 8
+    history.close()
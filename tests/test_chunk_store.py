@@ -0,0 +1,85 @@
+import pickle
+
+from langchain_core.documents import Document
+
+from edit_gpt.components.rag.local.chunk_store import ChunkStore, content_digest
+
+
+def _add_entry(store: ChunkStore, text: str) -> int:
+    entry_id = store.next_entry_id
+    store.add({entry_id: Document(page_content=text)})
+    return entry_id
+
+
+def test_chunks_with_the_same_text_share_an_entry() -> None:
+    store = ChunkStore(id_prefix="0:")
+    entry_id = _add_entry(store, "def a(): pass")
+    first = store.add_chunk(
+        entry_id, {"source": "a.py", "start_line": 1, "end_line": 1}
+    )
+    second = store.add_chunk(
+        entry_id, {"source": "b.py", "start_line": 5, "end_line": 5}
+    )
+
+    assert store.find_entry(content_digest("def a(): pass")) == entry_id
+    assert (first, second) == ("0:0", "0:1")
+    doc = store.get_document(entry_id)
+    assert doc.page_content == "def a(): pass"
+    assert doc.metadata["source"] == "a.py"
+    duplicates = doc.metadata["duplicates"]
+    assert [duplicate["source"] for duplicate in duplicates] == ["b.py"]
+    assert store.get_document(entry_id, scope="b.py").metadata["start_line"] == 5
+
+
+def test_entry_is_released_with_its_last_chunk() -> None:
+    store = ChunkStore()
+    entry_id = _add_entry(store, "text")
+    first = store.add_chunk(entry_id, {"source": "a.py"})
+    second = store.add_chunk(entry_id, {"source": "b.py"})
+
+    assert store.remove_chunk(first) is None
+    assert store.get_document(entry_id).metadata["source"] == "b.py"
+    assert store.remove_chunk(second) == entry_id
+    store.delete([entry_id])
+
+    assert store.entry_ids() == []
+    assert store.find_entry(content_digest("text")) is None
+    assert store.sources() == []
+
+
+def test_store_is_restored_from_its_directory(tmp_path) -> None:
+    store = ChunkStore(str(tmp_path))
+    kept = _add_entry(store, "kept")
+    deleted = _add_entry(store, "deleted")
+    store.add_chunk(kept, {"source": "a.py", "start_line": 2, "end_line": 4})
+    store.add_chunk(deleted, {"source": "a.py"})
+    store.remove_chunk("1")
+    store.delete([deleted])
+
+    store.save(str(tmp_path))
+    restored = pickle.loads(pickle.dumps(store))
+    restored.open(str(tmp_path))
+
+    assert restored.entry_ids() == [kept]
+    assert restored.get_chunk("0").page_content == "kept"
+    assert restored.get_chunk_metadata("0") == {
+        "source": "a.py",
+        "id": "0",
+        "start_line": 2,
+        "end_line": 4,
+    }
+
+
+def test_save_to_another_directory_rewrites_live_texts(tmp_path) -> None:
+    store = ChunkStore()
+    entry_id = _add_entry(store, "in memory")
+    _add_entry(store, "deleted")
+    store.delete([1])
+
+    store.save(str(tmp_path))
+    store.remove_stale_blobs()
+
+    blobs = list(tmp_path.glob("chunks-*.bin"))
+    assert len(blobs) == 1
+    assert blobs[0].read_bytes() == b"in memory"
+    assert store.get_text(entry_id) == "in memory"
@@ -0,0 +1,57 @@
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from edit_gpt.components.chat.context_packer import (
+    ContextPacker,
+    estimate_tokens,
+    get_token_counter,
+)
+
+
+def test_the_most_valuable_items_are_kept_in_their_order() -> None:
+    rag_docs = [
+        Document(page_content=f"chunk {i}", metadata={"source": f"{i}.py"})
+        for i in range(3)
+    ]
+    history = [
+        HumanMessage(content="first"),
+        AIMessage(content="second"),
+        HumanMessage(content="last"),
+    ]
+    web_results = ["result 0", "result 1"]
+    # every item costs 10 tokens, 4 of them fit
+    packer = ContextPacker(45, count_tokens=lambda text: 10)
+
+    packed = packer.pack(rag_docs, history, web_results, reserved_tokens=5)
+
+    assert packed.rag_docs == rag_docs[:2]
+    assert packed.history == history[2:]
+    assert packed.web_results == web_results[:1]
+    assert packed.report.used == 45
+    assert packed.report.dropped == {"rag": 1, "history": 2, "web": 1}
+    assert packed.report.dropped_tokens == {"rag": 10, "history": 20, "web": 10}
+
+
+def test_tokens_are_counted_locally(monkeypatch) -> None:
+    calls = []
+
+    def get_num_tokens(self, text: str) -> int:
+        calls.append(text)
+        return 1
+
+    monkeypatch.setattr(FakeListChatModel, "get_num_tokens", get_num_tokens)
+    chat_model = FakeListChatModel(responses=[])
+
+    # counted with a remote API or a tokenizer of another model
+    for provider in ("google", "ollama", "fake"):
+        assert get_token_counter(chat_model, provider) is estimate_tokens
+    assert calls == []
+
+    assert get_token_counter(chat_model, "llamacpp")("text") == 1
+
+    def missing_tokenizer(self, text: str) -> int:
+        raise ImportError("tiktoken")
+
+    monkeypatch.setattr(FakeListChatModel, "get_num_tokens", missing_tokenizer)
+    assert get_token_counter(chat_model, "openai") is estimate_tokens
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.chat.data_preprocessor import AdditionalDataPreprocessor
+
+
+class FakeRAGManager:
+    def __init__(self, error: bool = False):
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        self.error = error
+
+    def get_filtered_docs(self, question, scope=None, retrieval_context=None) -> list:
+        if self.error:
+            raise RuntimeError("index is broken")
+        return [question]
+
+
+class FakeSearchTool:
+    def __init__(self, released: threading.Event):
+        self.released = released
+
+    def invoke(self, message: str) -> str:
+        self.released.wait()
+        return f"[snippet: {message}]"
+
+
+def test_a_failing_source_returns_the_results_of_the_others() -> None:
+    released = threading.Event()
+    released.set()
+    preprocessor = AdditionalDataPreprocessor(
+        FakeRAGManager(error=True), web_search_tool=FakeSearchTool(released)
+    )
+
+    data = preprocessor.prepare_data("question", ["RAG", "Web Search"])
+
+    assert data["rag_docs"] == []
+    assert data["web_results"] == ["[snippet: question]"]
+
+
+def test_hung_sources_do_not_hold_up_later_requests() -> None:
+    released = threading.Event()
+    preprocessor = AdditionalDataPreprocessor(
+        FakeRAGManager(),
+        web_search_tool=FakeSearchTool(released),
+        web_search_timeout=0.05,
+    )
+    try:
+        for i in range(10):
+            start = time.monotonic()
+            data = preprocessor.prepare_data(f"q{i}", ["RAG", "Web Search"])
+            assert time.monotonic() - start < 1
+            assert data["rag_docs"] == [f"q{i}"]
+            assert data["web_results"] == []
+    finally:
+        released.set()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from edit_gpt.components.rag.local import faiss_index
+from edit_gpt.components.rag.local.faiss_index import (
+    MIN_POINTS_PER_CENTROID,
+    PQ_CENTROIDS,
+    create_faiss_index,
+)
+
+DIMENSION = 16
+
+
+def _vectors(n: int) -> np.ndarray:
+    return np.random.default_rng(0).random((n, DIMENSION), dtype=np.float32)
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf_pq"])
+def test_remove_shifts_following_positions(index_type) -> None:
+    index = create_faiss_index(index_type, DIMENSION, ivf_nlist=4, pq_m=4)
+    vectors = _vectors(20)
+    index.add(vectors)
+
+    assert index.remove_ids(np.array([3, 7])) == 2
+
+    assert index.ntotal == 18
+    distances, positions = index.search(vectors[[3, 8, 19]], 1)
+    assert distances[0][0] > 0
+    assert positions[1:, 0].tolist() == [6, 17]
+    np.testing.assert_allclose(index.reconstruct(6), vectors[8])
+
+
+def test_hnsw_is_rebuilt_once_mostly_deleted(monkeypatch) -> None:
+    monkeypatch.setattr(faiss_index, "MIN_TOMBSTONES_TO_REBUILD", 5)
+    index = create_faiss_index("hnsw", DIMENSION)
+    vectors = _vectors(10)
+    index.add(vectors)
+
+    index.remove_ids(np.array([0, 1, 2, 3, 4]))
+    assert index.tombstones == 5
+    assert index.index.ntotal == 10
+
+    index.remove_ids(np.array([0]))
+    assert index.tombstones == 0
+    assert index.index.ntotal == 4
+    _, positions = index.search(vectors[[9]], 1)
+    assert positions[0][0] == 3
+
+
+def test_ivf_pq_is_trained_once_there_are_enough_vectors() -> None:
+    index = create_faiss_index("ivf_pq", DIMENSION, ivf_nlist=4, pq_m=4)
+    threshold = MIN_POINTS_PER_CENTROID * PQ_CENTROIDS
+    vectors = _vectors(threshold + 10)
+
+    index.add(vectors[: threshold - 1])
+    assert index.staging
+    index.add(vectors[threshold - 1 :])
+    assert not index.staging
+
+    assert index.ntotal == len(vectors)
+    index.remove_ids(np.arange(10))
+    assert index.ntotal == index.index.ntotal == threshold
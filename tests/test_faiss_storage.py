@@ -0,0 +1,61 @@
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.ingest_service import IngestService
+from edit_gpt.components.rag.local import rag_local
+from edit_gpt.components.rag.local.faiss_storage import (
+    CURRENT_FILENAME,
+    DOCSTORE_FILENAME,
+    INDEX_FILENAME,
+)
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=16)
+
+
+def test_index_is_reloaded_from_the_current_generation(tmp_path) -> None:
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.py").write_text("a = 1\n")
+    persist_directory = tmp_path / "index"
+    rag_manager = LocalRAGManager(EMBEDDINGS, persist_directory=str(persist_directory))
+    rag_manager.add_texts_from_paths([str(source)])
+    generation = int((persist_directory / CURRENT_FILENAME).read_text())
+    # a save that crashed before switching CURRENT
+    (persist_directory / INDEX_FILENAME.format(generation + 1)).write_bytes(b"x")
+    (persist_directory / DOCSTORE_FILENAME.format(generation + 1)).write_bytes(b"x")
+
+    reloaded = LocalRAGManager(EMBEDDINGS, persist_directory=str(persist_directory))
+
+    assert [doc.page_content for doc in reloaded.get_all_docs()] == ["a = 1"]
+    assert reloaded.retrieve("a", None)[0].page_content == "a = 1"
+    reloaded.delete_source(str(source / "a.py"))
+    assert int((persist_directory / CURRENT_FILENAME).read_text()) == generation + 1
+    assert sorted(path.name for path in persist_directory.glob("index-*")) == [
+        INDEX_FILENAME.format(generation + 1),
+        DOCSTORE_FILENAME.format(generation + 1),
+    ]
+
+
+def test_bulk_ingest_saves_once(tmp_path, monkeypatch) -> None:
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.py").write_text("a = 1\n")
+    (source / "b.py").write_text("b = 1\n")
+    service = IngestService(
+        LocalRAGManager(EMBEDDINGS, persist_directory=str(tmp_path / "index"))
+    )
+    service.bulk_ingest([str(source)])
+    writes = []
+    write_faiss_snapshot = rag_local.write_faiss_snapshot
+    monkeypatch.setattr(
+        rag_local,
+        "write_faiss_snapshot",
+        lambda *args: writes.append(args) or write_faiss_snapshot(*args),
+    )
+
+    (source / "a.py").unlink()
+    (source / "b.py").write_text("b = 22\n")
+    report = service.bulk_ingest([str(source)])
+
+    assert (report.removed, report.updated) == (1, 1)
+    assert len(writes) == 1
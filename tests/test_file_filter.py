@@ -0,0 +1,41 @@
+from edit_gpt.utils.file_filter import FileFilter
+from edit_gpt.utils.loaders import get_all_filenames_from_paths
+
+
+def _write(path, content: bytes = b"x = 1\n") -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def _relative_filenames(root, file_filter: FileFilter) -> list:
+    filenames = get_all_filenames_from_paths([str(root)], file_filter)
+    return sorted(filename[len(str(root)) + 1 :] for filename in filenames)
+
+
+def test_ignored_binary_and_oversized_files_are_skipped(tmp_path) -> None:
+    _write(tmp_path / "app.py")
+    _write(tmp_path / "node_modules" / "lib.js")
+    _write(tmp_path / "pkg" / "__pycache__" / "app.cpython-311.pyc")
+    _write(tmp_path / "image.png", b"\x89PNG\0\0")
+    _write(tmp_path / "big.py", b"x = 1\n" * 100)
+    _write(tmp_path / ".gitignore", b"*.log\n/generated/\n")
+    _write(tmp_path / "debug.log")
+    _write(tmp_path / "generated" / "out.py")
+    _write(tmp_path / "pkg" / "generated" / "kept.py")
+    _write(tmp_path / "pkg" / ".gitignore", b"!keep.log\n")
+    _write(tmp_path / "pkg" / "keep.log")
+
+    assert _relative_filenames(tmp_path, FileFilter(max_file_size=100)) == [
+        ".gitignore",
+        "app.py",
+        "pkg/.gitignore",
+        "pkg/generated/kept.py",
+        "pkg/keep.log",
+    ]
+    allow_python = FileFilter(allowed_extensions=[".PY"], use_gitignore=False)
+    assert _relative_filenames(tmp_path, allow_python) == [
+        "app.py",
+        "big.py",
+        "generated/out.py",
+        "pkg/generated/kept.py",
+    ]
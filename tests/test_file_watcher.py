@@ -0,0 +1,44 @@
+import queue
+
+from edit_gpt.components.file_watcher import FileWatcher
+from edit_gpt.utils.file_filter import FileFilter
+
+
+class FakeIngestService:
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def bulk_ingest(self, paths: list) -> None:
+        self.calls.put(paths)
+
+
+def test_changed_added_and_removed_files_are_reingested(tmp_path) -> None:
+    for name in ("changed.py", "removed.py", "unchanged.py"):
+        (tmp_path / name).write_text("x = 1\n")
+    ingest_service = FakeIngestService()
+    watcher = FileWatcher(
+        ingest_service,
+        [str(tmp_path)],
+        file_filter=FileFilter(),
+        poll_interval=0.02,
+        debounce=0.05,
+        use_events=False,
+    )
+    watcher.start()
+    try:
+        (tmp_path / "changed.py").write_text("x = 2\ny = 3\n")
+        (tmp_path / "added.py").write_text("z = 1\n")
+        (tmp_path / "binary.py").write_bytes(b"\0\0")
+        (tmp_path / "removed.py").unlink()
+
+        expected = {"added.py", "changed.py", "removed.py"}
+        # usually one batch, more if a poll falls between the writes
+        ingested = set()
+        while ingested != expected:
+            paths = ingest_service.calls.get(timeout=5)
+            ingested.update(path[len(str(tmp_path)) + 1 :] for path in paths)
+            assert ingested <= expected
+    finally:
+        watcher.stop()
+
+    assert not watcher.is_running
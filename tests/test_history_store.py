@@ -0,0 +1,72 @@
+import threading
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, HumanMessage
+
+from edit_gpt.components.history.history_store import SESSIONS_DIRECTORY, HistoryStore
+
+MESSAGES = [HumanMessage(content="question"), AIMessage(content="answer")]
+
+
+def test_sessions_are_persisted_until_they_expire(tmp_path) -> None:
+    store = HistoryStore(
+        history_type="vector",
+        embeddings=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path),
+        retention=3600.0,
+    )
+    store.get("old").add_messages(MESSAGES)
+    store.close()
+    assert (tmp_path / SESSIONS_DIRECTORY / "old").is_dir()
+
+    store = HistoryStore(
+        history_type="vector",
+        embeddings=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path),
+        retention=3600.0,
+    )
+    assert store.delete_expired() == 0
+    assert store.get("old").messages == MESSAGES
+    store.close()
+
+    store = HistoryStore(persist_directory=str(tmp_path), retention=0.0)
+    store.get("loaded").add_messages(MESSAGES)
+    store.delete_expired()
+    # waits for the sweep if it is deleting the session
+    assert store.get("old").messages == []
+    assert not (tmp_path / SESSIONS_DIRECTORY / "old").exists()
+    # sessions in memory are not deleted
+    assert store.get("loaded").messages == MESSAGES
+    store.close()
+
+
+def test_sessions_are_loaded_outside_the_lock(tmp_path, monkeypatch) -> None:
+    store = HistoryStore(persist_directory=str(tmp_path))
+    load = store._load
+    loading, released = threading.Event(), threading.Event()
+
+    def slow_load(session_id: str):
+        if session_id == "slow":
+            loading.set()
+            released.wait()
+        return load(session_id)
+
+    monkeypatch.setattr(store, "_load", slow_load)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(store.get("slow")))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    assert loading.wait(5)
+
+    # other sessions are served while one is loaded
+    store.get("fast").add_messages(MESSAGES)
+    assert results == []
+    released.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(results) == 2 and results[0] is results[1]
+    store.close()
@@ -0,0 +1,78 @@
+import os
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.ingest_service import IngestService
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.utils import file_filter
+from edit_gpt.utils.file_filter import FileFilter
+
+
+def _counts(report) -> tuple:
+    return report.added, report.updated, report.skipped, report.removed
+
+
+def _touch(path) -> None:
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_bulk_ingest_counts_files_by_what_changed(tmp_path) -> None:
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.py").write_text("a = 1\n")
+    (source / "b.py").write_text("b = 1\n")
+    service = IngestService(
+        LocalRAGManager(DeterministicFakeEmbedding(size=16)),
+        manifest_path=str(tmp_path / "manifest.json"),
+    )
+    paths = [str(source)]
+
+    assert _counts(service.bulk_ingest(paths)) == (2, 0, 0, 0)
+    assert _counts(service.bulk_ingest(paths)) == (0, 0, 2, 0)
+
+    # new files are not hashed, so the first touch re-ingests without embedding
+    _touch(source / "a.py")
+    report = service.bulk_ingest(paths)
+    assert _counts(report) == (0, 1, 1, 0)
+    assert (report.embedded_chunks, report.deleted_chunks) == (0, 0)
+    # then their hash is known and touched but unchanged files are skipped
+    _touch(source / "a.py")
+    assert _counts(service.bulk_ingest(paths)) == (0, 0, 2, 0)
+
+    (source / "b.py").write_text("b = 2\n")
+    report = service.bulk_ingest(paths)
+    assert _counts(report) == (0, 1, 1, 0)
+    assert (report.embedded_chunks, report.deleted_chunks) == (1, 1)
+
+    (source / "a.py").unlink()
+    (source / "c.py").write_text("c = 1\n")
+    report = service.bulk_ingest(paths)
+    assert _counts(report) == (1, 0, 1, 1)
+    assert (report.embedded_chunks, report.deleted_chunks) == (1, 1)
+    assert sorted(
+        os.path.basename(source) for source in service.list_ingested_sources()
+    ) == ["b.py", "c.py"]
+
+
+def test_unchanged_files_are_not_read(tmp_path, monkeypatch) -> None:
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_text(f"{name[0]} = 1\n")
+    service = IngestService(
+        LocalRAGManager(DeterministicFakeEmbedding(size=16), file_filter=FileFilter())
+    )
+    service.bulk_ingest([str(tmp_path)])
+    sniffed = []
+    is_binary_file = file_filter.is_binary_file
+    monkeypatch.setattr(
+        file_filter,
+        "is_binary_file",
+        lambda path: sniffed.append(path) or is_binary_file(path),
+    )
+
+    assert _counts(service.bulk_ingest([str(tmp_path)])) == (0, 0, 3, 0)
+    assert sniffed == []
+    (tmp_path / "b.py").write_text("b = 2\n")
+    assert _counts(service.bulk_ingest([str(tmp_path)])) == (0, 1, 2, 0)
+    assert sniffed[0] == str(tmp_path / "b.py")
+    assert set(sniffed) == {str(tmp_path / "b.py")}
@@ -0,0 +1,59 @@
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.rag.lexical_index import LexicalIndex, tokenize
+from edit_gpt.components.rag.local.rag_local import (
+    LocalRAGManager,
+    reciprocal_rank_fusion,
+)
+
+
+def test_identifiers_are_indexed_whole_and_by_parts() -> None:
+    assert tokenize("parseHTTPHeader(max_size=10)") == [
+        "parsehttpheader",
+        "parse",
+        "http",
+        "header",
+        "max_size",
+        "max",
+        "size",
+        "10",
+    ]
+
+
+def test_exact_symbols_rank_first_and_removed_chunks_are_not_found() -> None:
+    texts = {
+        1: "def load_config(path): return read(path)",
+        2: "def load(path): config = read(path)",
+        3: "def save(path): pass",
+    }
+    index = LexicalIndex()
+    for doc_id, text in texts.items():
+        index.add(doc_id, text)
+
+    assert [doc_id for doc_id, _ in index.search("load_config")] == [1, 2]
+    assert [doc_id for doc_id, _ in index.search("load_config", doc_ids={2})] == [2]
+
+    index.remove(1, texts[1])
+    assert [doc_id for doc_id, _ in index.search("load_config")] == [2]
+    assert len(index) == 2
+
+
+def test_rank_fusion_prefers_documents_ranked_by_both() -> None:
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert fused == ["b", "a", "d", "c"]
+
+
+def test_hybrid_retrieval_finds_chunks_by_symbol(tmp_path) -> None:
+    for name in ("parser", "writer", "reader"):
+        (tmp_path / f"{name}.txt").write_text(f"notes about the {name}_settings")
+    rag_manager = LocalRAGManager(
+        DeterministicFakeEmbedding(size=16), retrieval_mode="hybrid"
+    )
+    rag_manager.add_texts_from_paths([str(tmp_path)])
+
+    docs = rag_manager.retrieve("writer_settings")
+    assert docs[0].metadata["source"].endswith("writer.txt")
+
+    rag_manager.delete_source(str(tmp_path / "writer.txt"))
+    sources = [doc.metadata["source"] for doc in rag_manager.retrieve("writer")]
+    assert not any(source.endswith("writer.txt") for source in sources)
@@ -0,0 +1,17 @@
+from edit_gpt.utils.loaders import iter_docs_from_paths
+
+
+def test_files_are_yielded_in_walk_order(tmp_path) -> None:
+    for i in range(20):
+        (tmp_path / f"{i:02}.txt").write_text(f"file {i}")
+    (tmp_path / "latin1.txt").write_bytes("caf\xe9".encode("latin-1"))
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+
+    loaded = list(iter_docs_from_paths(paths, max_workers=4, max_pending=3))
+
+    assert [filename for filename, _ in loaded] == paths
+    assert [docs[0].page_content for _, docs in loaded[:20]] == [
+        f"file {i}" for i in range(20)
+    ]
+    # not utf-8
+    assert loaded[20][1] == []
@@ -0,0 +1,19 @@
+from edit_gpt.components.embeddings.init_embeddings import (
+    close_embeddings,
+    create_base_embeddings,
+    initialize_embeddings,
+)
+
+
+def test_workers_embed_like_the_wrapped_model() -> None:
+    embeddings = initialize_embeddings(
+        "fake", cache_max_bytes=0, processes=2, batch_size=4
+    )
+    texts = [f"text {i}" for i in range(21)]
+    try:
+        vectors = embeddings.embed_documents(texts)
+    finally:
+        close_embeddings(embeddings)
+
+    assert vectors == create_base_embeddings("fake").embed_documents(texts)
+    assert embeddings._pool is None
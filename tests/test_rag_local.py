@@ -0,0 +1,93 @@
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.components.rag.splitters import DEFAULT_SPLITTERS
+
+
+def _function(name: str) -> str:
+    body = "".join(f"    {name}_{i} = {i} * {i}\n" for i in range(15))
+    return f"def {name}():\n{body}    return {name}_0\n"
+
+
+def _lines(rag_manager: LocalRAGManager, source: str) -> list:
+    return [
+        (
+            doc_id,
+            rag_manager.get_metadata(doc_id)["start_line"],
+            rag_manager.get_metadata(doc_id)["end_line"],
+        )
+        for doc_id in rag_manager.get_ids_by_source(source)
+    ]
+
+
+def test_update_embeds_only_changed_chunks(tmp_path) -> None:
+    path = tmp_path / "module.py"
+    path.write_text("\n\n".join(_function(name) for name in "abc"))
+    source = str(path)
+    rag_manager = LocalRAGManager(
+        DeterministicFakeEmbedding(size=16),
+        splitters=DEFAULT_SPLITTERS,
+        chunk_max_tokens=120,
+    )
+    assert rag_manager.update_texts_from_paths([source]) == (["0", "1", "2"], [])
+    assert _lines(rag_manager, source) == [("0", 1, 17), ("1", 20, 36), ("2", 39, 55)]
+
+    # b changes, a new function is inserted before a
+    path.write_text(
+        "\n\n".join(
+            [_function("d"), _function("a"), _function("b") + "    # x\n"]
+            + [_function("c")]
+        )
+    )
+    added_ids, deleted_ids = rag_manager.update_texts_from_paths([source])
+
+    assert (added_ids, deleted_ids) == (["3", "4"], ["1"])
+    # kept chunks are moved to their new lines, in file order
+    assert _lines(rag_manager, source) == [
+        ("3", 1, 17),
+        ("0", 20, 36),
+        ("4", 39, 56),
+        ("2", 59, 75),
+    ]
+    assert "b_0 = 0 * 0" in rag_manager.get_docs_by_source(source)[2].page_content
+
+
+def test_identical_chunks_are_embedded_once(tmp_path) -> None:
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(_function("shared"))
+    rag_manager = LocalRAGManager(
+        DeterministicFakeEmbedding(size=16), splitters=DEFAULT_SPLITTERS
+    )
+    rag_manager.add_texts_from_paths([str(tmp_path)])
+    index = rag_manager.rag_database.index
+
+    assert index.ntotal == 1
+    assert len(rag_manager.get_all_docs()) == 2
+    doc = rag_manager.retrieve("shared", None)[0]
+    assert len(doc.metadata["duplicates"]) == 1
+
+    rag_manager.delete_source(str(tmp_path / "a.py"))
+    assert index.ntotal == 1
+    assert rag_manager.list_sources() == [str(tmp_path / "b.py")]
+    rag_manager.delete_source(str(tmp_path / "b.py"))
+    assert index.ntotal == 0
+
+
+def test_scoped_retrieval_only_returns_files_under_the_scope(tmp_path) -> None:
+    for package in ("api", "core"):
+        (tmp_path / package).mkdir()
+        for i in range(3):
+            (tmp_path / package / f"{i}.txt").write_text(f"{package} notes {i}")
+    rag_manager = LocalRAGManager(
+        DeterministicFakeEmbedding(size=16), retrieval_mode="hybrid"
+    )
+    rag_manager.add_texts_from_paths([str(tmp_path)])
+
+    scope = str(tmp_path / "core")
+    docs = rag_manager.get_filtered_docs("api notes", scope=scope)
+    assert len(docs) == 3
+    assert all(doc.metadata["source"].startswith(scope) for doc in docs)
+
+    scope = str(tmp_path / "api" / "1.txt")
+    docs = rag_manager.get_filtered_docs("notes", scope=scope)
+    assert [doc.page_content for doc in docs] == ["api notes 1"]
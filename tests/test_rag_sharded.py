@@ -0,0 +1,57 @@
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.components.rag.local.rag_sharded import ShardedRAGManager
+
+SEARCH_KWARGS = {"k": 5}
+
+
+def _write_tree(root) -> None:
+    for package in ("api", "core", "docs", "tools"):
+        (root / package).mkdir(parents=True)
+        for i in range(3):
+            (root / package / f"{i}.txt").write_text(f"{package} module {i}")
+
+
+def test_sharded_search_matches_a_single_index(tmp_path) -> None:
+    _write_tree(tmp_path)
+    kwargs = dict(search_type="similarity", search_kwargs=SEARCH_KWARGS)
+    sharded = ShardedRAGManager(
+        DeterministicFakeEmbedding(size=16),
+        shards_count=3,
+        partition_roots=[str(tmp_path)],
+        **kwargs,
+    )
+    single = LocalRAGManager(DeterministicFakeEmbedding(size=16), **kwargs)
+    sharded.add_texts_from_paths([str(tmp_path)])
+    single.add_texts_from_paths([str(tmp_path)])
+
+    # files of a top-level directory stay together
+    for package in ("api", "core", "docs", "tools"):
+        sources = [str(tmp_path / package / f"{i}.txt") for i in range(3)]
+        assert len({sharded._get_shard_index(source) for source in sources}) == 1
+    assert sorted(sharded.list_sources()) == sorted(single.list_sources())
+
+    for query in ("api module 1", "tools", "something else"):
+        assert [doc.page_content for doc in sharded.retrieve(query)] == [
+            doc.page_content for doc in single.retrieve(query)
+        ]
+
+
+def test_shards_are_persisted_and_sources_deleted(tmp_path) -> None:
+    _write_tree(tmp_path / "src")
+    kwargs = dict(
+        shards_count=2,
+        partition="hash",
+        persist_directory=str(tmp_path / "index"),
+        search_type="similarity",
+    )
+    sharded = ShardedRAGManager(DeterministicFakeEmbedding(size=16), **kwargs)
+    sharded.add_texts_from_paths([str(tmp_path / "src")])
+    removed = str(tmp_path / "src" / "api" / "0.txt")
+    sharded.delete_source(removed)
+
+    reloaded = ShardedRAGManager(DeterministicFakeEmbedding(size=16), **kwargs)
+    assert sorted(reloaded.list_sources()) == sorted(sharded.list_sources())
+    assert len(reloaded.list_sources()) == 11
+    assert removed not in reloaded.list_sources()
@@ -0,0 +1,53 @@
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+
+from edit_gpt.components.rag.rerankers import (
+    EmbeddingReranker,
+    LLMFilterReranker,
+    initialize_reranker,
+)
+
+VECTORS = {
+    "question": [1.0, 0.0],
+    "same": [2.0, 0.0],
+    "close": [1.0, 1.0],
+    "far": [0.0, 1.0],
+}
+DOCS = [
+    Document(page_content=text, metadata={"source": f"{text}.py"})
+    for text in ("far", "close", "same")
+]
+
+
+class TableEmbeddings(Embeddings):
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return VECTORS[text]
+
+
+def _texts(docs: List[Document]) -> List[str]:
+    return [doc.page_content for doc in docs]
+
+
+def test_embedding_reranker_orders_by_similarity_above_threshold() -> None:
+    reranker = EmbeddingReranker(TableEmbeddings(), threshold=0.5)
+    assert _texts(reranker.rerank("question", DOCS)) == ["same", "close"]
+
+    reranker = EmbeddingReranker(TableEmbeddings(), threshold=None, top_n=1)
+    assert _texts(reranker.rerank("question", DOCS)) == ["same"]
+
+
+def test_llm_reranker_keeps_the_documents_the_model_selects() -> None:
+    reranker = LLMFilterReranker(FakeListChatModel(responses=["3, 1", "7"]))
+    assert _texts(reranker.rerank("question", DOCS)) == ["same", "far"]
+    # an index out of range keeps every document
+    assert reranker.rerank("question", DOCS) == DOCS
+
+
+def test_no_reranker() -> None:
+    assert initialize_reranker("none") is None
@@ -0,0 +1,38 @@
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.components.rag.retrieval_cache import RetrievalCache
+
+
+def test_results_are_cached_until_the_index_changes(tmp_path, monkeypatch) -> None:
+    (tmp_path / "a.txt").write_text("alpha notes")
+    rag_manager = LocalRAGManager(DeterministicFakeEmbedding(size=16), reranker=None)
+    rag_manager.add_texts_from_paths([str(tmp_path / "a.txt")])
+    retrieve = rag_manager.retrieve
+    queries = []
+
+    def counting_retrieve(query, *args, **kwargs):
+        queries.append(query)
+        return retrieve(query, *args, **kwargs)
+
+    monkeypatch.setattr(rag_manager, "retrieve", counting_retrieve)
+
+    docs = rag_manager.get_filtered_docs("Which notes?")
+    assert rag_manager.get_filtered_docs("  which   NOTES? ") == docs
+    assert queries == ["Which notes?"]
+
+    (tmp_path / "b.txt").write_text("beta notes")
+    rag_manager.add_texts_from_paths([str(tmp_path / "b.txt")])
+    assert len(rag_manager.get_filtered_docs("which notes?")) == 2
+    assert len(queries) == 2
+
+
+def test_least_recently_used_entries_are_dropped() -> None:
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", [])
+    cache.put("b", [])
+    cache.get("a")
+    cache.put("c", [])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [] and cache.get("c") == []
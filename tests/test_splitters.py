@@ -0,0 +1,42 @@
+from edit_gpt.components.rag.splitters import (
+    CodeTextSplitter,
+    ContentDefinedTextSplitter,
+    PythonCodeTextSplitter,
+    count_tokens,
+)
+
+
+def test_python_chunks_are_whole_definitions_with_lines() -> None:
+    text = "\n\n".join(
+        f"def f{i}():\n" + "".join(f"    x{j} = {j}\n" for j in range(20))
+        for i in range(3)
+    )
+    splitter = PythonCodeTextSplitter(max_tokens=100)
+
+    chunks = splitter.split_text_with_lines(text)
+
+    lines = [(start, end) for _, start, end in chunks]
+    assert lines == [(1, 21), (24, 44), (47, 67)]
+    assert all(chunk.startswith("def f") for chunk, _, _ in chunks)
+
+
+def test_code_lines_over_the_budget_are_split_between_tokens() -> None:
+    long_line = "values = [" + ", ".join(str(i) for i in range(500)) + "]"
+    splitter = CodeTextSplitter(max_tokens=60)
+
+    chunks = splitter.split_text(f"a = 1\n{long_line}\nb = 2\n")
+
+    assert max(count_tokens(chunk) for chunk in chunks) <= 60
+    assert sum(count_tokens(chunk) for chunk in chunks) == count_tokens(
+        f"a = 1\n{long_line}\nb = 2\n"
+    )
+
+
+def test_text_without_blank_lines_is_split_to_the_chunk_size() -> None:
+    lines = [f"line {i} " + "word " * 30 for i in range(200)] + ["x" * 2500]
+    splitter = ContentDefinedTextSplitter(chunk_size=1000, chunk_overlap=0)
+
+    chunks = splitter.split_text("\n".join(lines))
+
+    assert max(len(chunk) for chunk in chunks) <= 1000
+    assert "".join(chunks).count("x") == 2500
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from edit_gpt.chat_models.providers.llamacpp.llamacpp_chat import LlamaCppChat
+from edit_gpt.components.history.summary_history import (
+    SUMMARY_MESSAGE_PREFIX,
+    SummaryChatHistory,
+)
+
+
+def _turns(n: int) -> list:
+    return [
+        message
+        for i in range(n)
+        for message in (HumanMessage(content=f"q{i}"), AIMessage(content=f"a{i}"))
+    ]
+
+
+class FakeLlama:
+    """Fails if two completions overlap, like a llama.cpp context would corrupt."""
+
+    def __init__(self):
+        self.running = threading.Lock()
+        self.completions = 0
+
+    def create_chat_completion(self, messages, stream=False, **kwargs):
+        if not self.running.acquire(blocking=False):
+            raise RuntimeError("concurrent completions")
+        try:
+            time.sleep(0.01)
+            self.completions += 1
+            if not stream:
+                return {"choices": [{"message": {"content": "summary"}}]}
+            chunks = [{"choices": [{"delta": {"content": "x"}}]}] * 5
+        finally:
+            self.running.release()
+        return self._stream(chunks)
+
+    def _stream(self, chunks):
+        for chunk in chunks:
+            with self.running:
+                time.sleep(0.01)
+            yield chunk
+
+
+def test_older_turns_are_sent_as_a_summary() -> None:
+    history = SummaryChatHistory(
+        FakeListChatModel(responses=["they said hi"]),
+        ChatMessageHistory(),
+        last_turns=1,
+    )
+    history.add_messages(_turns(3))
+    assert history.flush(timeout=5)
+
+    messages = history.context_messages()
+    assert messages[0] == SystemMessage(content=SUMMARY_MESSAGE_PREFIX + "they said hi")
+    assert [message.content for message in messages[1:]] == ["q2", "a2"]
+
+    # a summary of removed messages is dropped
+    history.truncate(2)
+    assert history.context_messages() == _turns(1)
+
+
+def test_summary_does_not_run_concurrently_with_llamacpp_generation() -> None:
+    model = FakeLlama()
+    chat_model = LlamaCppChat(model=model, temperature=0.4, top_p=0.7)
+    history = SummaryChatHistory(chat_model, ChatMessageHistory(), last_turns=1)
+
+    for i in range(3):
+        history.add_messages(_turns(i + 2)[-2:])
+        chunks = [chunk.content for chunk in chat_model.stream("question")]
+        assert chunks == ["x"] * 5
+    assert history.flush(timeout=5)
+    assert history.summary == "summary"
@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+from langchain_community.chat_message_histories.in_memory import ChatMessageHistory
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, HumanMessage
+
+from edit_gpt.components.history.vector_based_history import (
+    VectorBasedChatHistory,
+    create_empty_vectorstore,
+)
+from edit_gpt.components.rag.local.rag_local import LocalRAGManager
+from edit_gpt.components.rag.retrieval_context import RetrievalContext
+
+
+class GatedEmbeddings(Embeddings):
+    """Embeds documents only once released, to hold a batch in flight."""
+
+    def __init__(self):
+        self.fake = DeterministicFakeEmbedding(size=8)
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.released.set()
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.started.set()
+        self.released.wait(5)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.fake.embed_query(text)
+
+
+def _messages(*contents):
+    return [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=content)
+        for i, content in enumerate(contents)
+    ]
+
+
+@pytest.mark.parametrize("n_messages", [0, 1, 2, 3, 4])
+def test_truncate_while_a_batch_is_embedded(n_messages) -> None:
+    embeddings = GatedEmbeddings()
+    vectorstore = create_empty_vectorstore(embeddings)
+    history = VectorBasedChatHistory(vectorstore.as_retriever(), ChatMessageHistory())
+    embeddings.started.clear()
+    embeddings.released.clear()
+
+    history.add_messages(_messages("a", "b"))
+    assert embeddings.started.wait(5)
+    # embedded after the batch in flight
+    history.add_messages(_messages("c", "d"))
+    history.truncate(n_messages)
+    embeddings.released.set()
+
+    assert history.flush(timeout=5)
+    assert [message.content for message in history.messages] == list("abcd")[
+        :n_messages
+    ]
+    assert len(vectorstore.index_to_docstore_id) == n_messages
+    assert (
+        sorted(doc.page_content[-1] for doc in vectorstore.docstore._dict.values())
+        == list("abcd")[:n_messages]
+    )
+    history.close()
+
+
+def test_history_and_rag_share_the_query_embedding(tmp_path) -> None:
+    embeddings = GatedEmbeddings()
+    (tmp_path / "notes.txt").write_text("notes about e")
+    rag_manager = LocalRAGManager(embeddings, search_type="similarity")
+    rag_manager.add_texts_from_paths([str(tmp_path)])
+    vectorstore = create_empty_vectorstore(embeddings)
+    history = VectorBasedChatHistory(
+        vectorstore.as_retriever(search_kwargs={"k": 1}),
+        ChatMessageHistory(),
+        k_last_messages=2,
+    )
+    history.add_messages(_messages(*"abcdefgh"))
+    # positions of the vectors shift after a delete
+    history.truncate(6)
+    assert history.flush(timeout=5)
+    doc_ids = [doc_id for ids in history.message_doc_ids for doc_id in ids]
+    texts = [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids]
+    vectors = embeddings.fake.embed_documents(texts)
+    assert np.allclose(history._get_vectors(doc_ids), vectors)
+    embeddings.queries.clear()
+
+    retrieval_context = RetrievalContext(embeddings)
+    assert rag_manager.get_filtered_docs("e?", retrieval_context=retrieval_context)
+    messages = history.retrieve("e?", retrieval_context)
+
+    assert embeddings.queries == ["e?"]
+    assert [message.content for message in messages[-2:]] == ["e", "f"]
+    assert len(messages) == 3 and messages[0].content in "abcd"
+    history.close()